@@ -0,0 +1,11 @@
+"""
+Offline benchmarks for cloudshell-traffic, they are not added to Cloudshell-Traffic package.
+
+Run each benchmark as a module from the repository root, e.g. `python -m benchmarks.bench_records_memory`.
+"""
+import sys
+
+
+def write_line(line: str) -> None:
+    """Write result line to standard output."""
+    sys.stdout.write(f"{line}\n")
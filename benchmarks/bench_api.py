@@ -0,0 +1,185 @@
+"""
+Measure throughput and latency of cloudshell traffic helpers against the local CloudShell stand-in server.
+
+Usage: python -m benchmarks.bench_api [--ports 500] [--latency 0.005] [--iterations 50] [--size-mb 16] [--json]
+                                      [--output results.json]
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import platform
+import statistics
+import time
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List
+
+from cloudshell.traffic import helpers
+from cloudshell.traffic.helpers import ReservationOutputHandler
+from cloudshell.traffic.rest_api_helpers import RestJsonClient, SandboxAttachments
+
+from . import write_line
+from .server import StandInServer
+from .synthetic import PORT_MODEL, port_name
+
+RESERVATION_ID = "benchmark-reservation"
+
+
+def measure(name: str, func: Callable[[], Any], iterations: int, **info: Any) -> Dict[str, Any]:
+    """Call func iterations times and return its latency statistics, in milliseconds, and throughput."""
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return {
+        "benchmark": name,
+        "iterations": iterations,
+        "ops_per_sec": round(iterations / sum(latencies), 1),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 3),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 3),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1 if len(latencies) > 1 else 0] * 1000, 3),
+        **info,
+    }
+
+
+def bench_lookups(sandbox: Any, iterations: int) -> List[Dict[str, Any]]:
+    """Reservation lookups with and without the reservation cache."""
+    return [
+        measure("get_reservation_index", lambda: helpers.get_reservation_index(sandbox), iterations),
+        measure(
+            "get_resources_from_reservation",
+            lambda: helpers.get_resources_from_reservation(sandbox, PORT_MODEL),
+            iterations,
+        ),
+        measure(
+            "get_resources_from_reservation_cached",
+            lambda: helpers.get_resources_from_reservation(sandbox, PORT_MODEL, use_cache=True),
+            iterations * 100,
+        ),
+        measure(
+            "get_locations",
+            lambda: helpers.get_locations(helpers.get_resources_from_reservation(sandbox, PORT_MODEL, use_cache=True)),
+            iterations * 10,
+        ),
+    ]
+
+
+def bench_waiters(sandbox: Any, ports: int, iterations: int) -> List[Dict[str, Any]]:
+    """Waiters whose condition is already met, i.e. the cost of a single poll."""
+    session = sandbox.automation_api
+    names = [port_name(port) for port in range(ports)]
+    return [
+        measure(
+            "wait_for_resources",
+            lambda: helpers.wait_for_resources(session, RESERVATION_ID, names),
+            iterations,
+        ),
+        measure(
+            "wait_for_attribute",
+            lambda: helpers.wait_for_attribute(session, RESERVATION_ID, "Controller 0", "Attribute 0", "Value 0"),
+            iterations,
+        ),
+    ]
+
+
+def bench_reservation_output(server: StandInServer, sandbox: Any, records: int) -> List[Dict[str, Any]]:
+    """Log records to reservation output, write per record versus batched writes."""
+    results = []
+    for batched in (False, True):
+        logger = logging.getLogger(f"benchmark.reservation_output.{batched}")
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        handler = ReservationOutputHandler(sandbox, batched=batched)
+        logger.addHandler(handler)
+        calls = server.calls["WriteMessageToReservationOutput"]
+        start = time.perf_counter()
+        for record in range(records):
+            logger.info("record %d", record)
+        handler.close()
+        elapsed = time.perf_counter() - start
+        logger.removeHandler(handler)
+        results.append(
+            {
+                "benchmark": "reservation_output_batched" if batched else "reservation_output",
+                "records": records,
+                "records_per_sec": round(records / elapsed, 1),
+                "api_calls": server.calls["WriteMessageToReservationOutput"] - calls,
+            }
+        )
+    return results
+
+
+def bench_rest(server: StandInServer, iterations: int, size_mb: int) -> List[Dict[str, Any]]:
+    """Benchmark RestJsonClient requests and attachments upload and download."""
+    client = RestJsonClient(server.host, use_https=False)
+    uri = f"API/Package/GetReservationAttachmentsDetails/{RESERVATION_ID}"
+    results = [measure("rest_get_json", lambda: client.request_get_json(uri), iterations * 10)]
+
+    attachments = SandboxAttachments(server.host, "token", logging.getLogger("benchmark"))
+    attachments.login()
+    data = os.urandom(size_mb * 1024 * 1024)
+    results.append(
+        measure(
+            "attachment_upload_stream",
+            lambda: attachments.attach_new_file_stream(RESERVATION_ID, io.BytesIO(data), "benchmark.bin"),
+            3,
+            size_mb=size_mb,
+        )
+    )
+    results.append(
+        measure(
+            "attachment_download",
+            lambda: attachments.download_attached_file(RESERVATION_ID, "benchmark.bin", io.BytesIO()),
+            3,
+            size_mb=size_mb,
+        )
+    )
+    for result in results[1:]:
+        result["mb_per_sec"] = round(size_mb * result["ops_per_sec"], 1)
+    return results
+
+
+def run(ports: int, latency: float, iterations: int, size_mb: int) -> Dict[str, Any]:
+    """Run all benchmarks against a fresh stand-in server."""
+    with StandInServer(latency=latency, ports=ports, services=4, connectors=ports // 2, attributes=20) as server:
+        sandbox = SimpleNamespace(id=RESERVATION_ID, automation_api=server.session())
+        results = bench_lookups(sandbox, iterations)
+        results += bench_waiters(sandbox, ports, iterations)
+        results += bench_reservation_output(server, sandbox, iterations * 20)
+        results += bench_rest(server, iterations, size_mb)
+        calls = dict(server.calls)
+    return {
+        "python": platform.python_version(),
+        "parameters": {"ports": ports, "latency": latency, "iterations": iterations, "size_mb": size_mb},
+        "results": results,
+        "server_calls": calls,
+    }
+
+
+def main() -> None:
+    """Run benchmarks and print results."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ports", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.005, help="simulated server latency in seconds")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--size-mb", type=int, default=16, help="size of attachment to upload and download")
+    parser.add_argument("--json", action="store_true", help="print machine readable results")
+    parser.add_argument("--output", help="write machine readable results to file")
+    args = parser.parse_args()
+    report = run(args.ports, args.latency, args.iterations, args.size_mb)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    if args.json:
+        write_line(json.dumps(report))
+        return
+    for result in report["results"]:
+        details = ", ".join(f"{key}={value}" for key, value in result.items() if key != "benchmark")
+        write_line(f"{result['benchmark']:40} {details}")
+
+
+if __name__ == "__main__":
+    main()
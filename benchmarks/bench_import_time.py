@@ -0,0 +1,83 @@
+"""
+Measure the import time of cloudshell traffic modules in fresh interpreters and check heavy dependencies are deferred.
+
+Usage: python -m benchmarks.bench_import_time [--runs 10] [--max-ms 100] [--json]
+
+Exits with status 1 if a deferred dependency is imported eagerly or if the median import time exceeds --max-ms.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from typing import Any, Dict, List
+
+from . import write_line
+
+MODULES = ("cloudshell.traffic.tg", "cloudshell.traffic.helpers", "cloudshell.traffic.rest_api_helpers")
+
+DEFERRED = (
+    "cloudshell.api.cloudshell_api",
+    "cloudshell.workflow.orchestration.sandbox",
+    "cloudshell.logging.qs_logger",
+    "requests",
+    "urllib3",
+    "numpy",
+)
+
+PROBE = """
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(elapsed, *[name for name in {deferred!r} if name in sys.modules])
+"""
+
+
+def probe(module: str) -> Dict[str, Any]:
+    """Import module in a fresh interpreter, return import time and the deferred dependencies it loaded."""
+    code = PROBE.format(module=module, deferred=DEFERRED)
+    output = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True).stdout.split()
+    return {"seconds": float(output[0]), "eager": output[1:]}
+
+
+def run(runs: int) -> List[Dict[str, Any]]:
+    """Return median import time and eagerly imported deferred dependencies of each module."""
+    results = []
+    for module in MODULES:
+        probes = [probe(module) for _ in range(runs)]
+        results.append(
+            {
+                "benchmark": "import_time",
+                "module": module,
+                "runs": runs,
+                "median_ms": round(statistics.median(p["seconds"] for p in probes) * 1000, 1),
+                "min_ms": round(min(p["seconds"] for p in probes) * 1000, 1),
+                "eager": probes[0]["eager"],
+            }
+        )
+    return results
+
+
+def main() -> None:
+    """Run benchmark, print results and exit with error on regression."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--max-ms", type=float, help="fail if the median import time of any module exceeds this value")
+    parser.add_argument("--json", action="store_true", help="print machine readable results")
+    args = parser.parse_args()
+    results = run(args.runs)
+    if args.json:
+        write_line(json.dumps(results))
+    else:
+        for result in results:
+            eager = ", ".join(result["eager"]) or "none"
+            write_line(f"{result['module']:40} median {result['median_ms']} ms, min {result['min_ms']} ms, eager: {eager}")
+    regression = any(result["eager"] for result in results)
+    if args.max_ms is not None:
+        regression |= any(result["median_ms"] > args.max_ms for result in results)
+    sys.exit(1 if regression else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Compare memory of API reservation objects and compact records.
+
+Usage: python -m benchmarks.bench_records_memory [--ports 2000] [--json]
+"""
+import argparse
+import gc
+import json
+import tracemalloc
+from typing import Any, Callable, Dict
+
+from cloudshell.traffic.helpers import compact_reservation, parse_location
+
+from . import write_line
+from .synthetic import reservation_description
+
+
+def measure(build: Callable[[], Any]) -> int:
+    """Return memory, in bytes, retained by the object returned by build."""
+    gc.collect()
+    tracemalloc.start()
+    obj = build()
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del obj
+    return size
+
+
+def run(ports: int) -> Dict[str, Any]:
+    """Measure API objects versus compact records for a reservation with the requested number of ports.
+
+    The compact records are measured with the API objects released, so strings the records share with the API objects are
+    counted as retained by the records.
+    """
+    api_bytes = measure(lambda: reservation_description(ports=ports, services=4, attributes=20))
+    parse_location.cache_clear()
+    compact_bytes = measure(lambda: compact_reservation(reservation_description(ports=ports, services=4, attributes=20)))
+    return {
+        "benchmark": "records_memory",
+        "ports": ports,
+        "api_bytes": api_bytes,
+        "compact_bytes": compact_bytes,
+        "ratio": round(api_bytes / compact_bytes, 2),
+    }
+
+
+def main() -> None:
+    """Run benchmark and print results."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--ports", type=int, default=2000)
+    parser.add_argument("--json", action="store_true", help="print machine readable results")
+    args = parser.parse_args()
+    result = run(args.ports)
+    if args.json:
+        write_line(json.dumps(result))
+    else:
+        write_line(
+            f"{result['ports']} ports: API objects {result['api_bytes']:,} B, compact records {result['compact_bytes']:,} B"
+        )
+        write_line(f"compact records are {result['ratio']}x smaller")
+
+
+if __name__ == "__main__":
+    main()
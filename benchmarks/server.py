@@ -0,0 +1,227 @@
+"""
+In-process stand-in for the CloudShell XML API and the attachments REST API.
+
+A single HTTP server serves both APIs, on a random local port, with synthetic reservations (see synthetic.py) and an
+optional simulated latency per request.
+"""
+import email
+import json
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from cloudshell.api.cloudshell_api import CloudShellAPISession
+
+from .synthetic import RESPONSE, reservation_details_xml
+
+API_URI = "/ResourceManagerApiService/"
+TOKEN = "benchmark-token"
+
+LOGON_BODY = '<Domain Name="Global" DomainId="1" Description=""/><Token Token="{token}"/><User Name="admin"/>'
+EMPTY_RESPONSE = (
+    '<Response CommandName="{command}" Success="true" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">'
+    "<ErrorCode>0</ErrorCode></Response>"
+)
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Request handler, state is kept on the server object."""
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    server: "StandInServer"
+
+    def log_message(self, *args: Any) -> None:  # pylint: disable=arguments-differ
+        """Do not log requests."""
+
+    def _reply(self, code: int, body: bytes, content_type: str, headers: Iterable[Tuple[str, str]] = ()) -> None:
+        """Send complete response."""
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _reply_json(self, content: Any) -> None:
+        """Send JSON response."""
+        self._reply(200, json.dumps(content).encode("utf-8"), "application/json")
+
+    def _body(self) -> bytes:
+        """Read request body, plain or chunked."""
+        if self.headers.get("Transfer-Encoding") == "chunked":
+            chunks: List[bytes] = []
+            while True:
+                size = int(self.rfile.readline().strip(), 16)
+                if not size:
+                    self.rfile.readline()
+                    return b"".join(chunks)
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def _handle(self) -> None:
+        """Count request, simulate latency and dispatch to XML API or REST API."""
+        body = self._body()
+        operation = self.path.split("?")[0].rstrip("/").split("/")[-1]
+        if self.path.startswith(API_URI):
+            self.server.count(operation)
+            time.sleep(self.server.latency)
+            self._reply(200, self.server.api_response(operation, body), "text/xml")
+        else:
+            self.server.count(f"REST {self.command} {self.path.split('/')[3]}")
+            time.sleep(self.server.latency)
+            self._rest(body)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _handle
+
+    def _rest(self, body: bytes) -> None:
+        """Serve attachments REST API."""
+        attachments = self.server.attachments
+        if self.server.take_failure():
+            self._reply(503, b"", "text/plain")
+        elif self.path.startswith("/API/Auth/Login"):
+            self._reply_json(self.server.login())
+        elif self.headers.get("Authorization") in self.server.expired:
+            self._reply(401, b"", "text/plain")
+        elif self.path.startswith("/API/Package/GetReservationAttachmentsDetails/"):
+            reservation_id = self.path.split("/")[-1]
+            self._reply_json({"Success": True, "AllAttachments": sorted(attachments.get(reservation_id, {}))})
+        elif self.path.startswith("/API/Package/AttachFileToReservation"):
+            message = email.message_from_bytes(f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + body)
+            parts: Dict[Any, Any] = {
+                part.get_param("name", header="content-disposition"): part.get_payload(decode=True)
+                for part in message.get_payload()
+                if isinstance(part, email.message.Message)
+            }
+            reservation_id = parts["reservationId"].decode()
+            attachments.setdefault(reservation_id, {})[parts["saveFileAs"].decode()] = parts["QualiPackage"]
+            self._reply_json({"Success": True})
+        elif self.path.startswith("/API/Package/DeleteFileFromReservation"):
+            data = json.loads(body)
+            attachments.get(data["reservationId"], {}).pop(data["FileName"], None)
+            self._reply_json({"Success": True})
+        elif self.path.startswith("/API/Package/GetReservationAttachment/"):
+            data = json.loads(body)
+            content = attachments[data["reservationId"]][data["FileName"]]
+            byte_range = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+            if byte_range and not self.server.ignore_range:
+                start = int(byte_range.group(1))
+                end = min(int(byte_range.group(2) or len(content) - 1), len(content) - 1)
+                if start >= len(content):
+                    self._reply(416, b"", "text/plain", [("Content-Range", f"bytes */{len(content)}")])
+                    return
+                content_range = f"bytes {start}-{end}/{len(content)}"
+                part = content[start:][: end - start + 1]
+                self._reply(206, part, self.server.attachment_type, [("Content-Range", content_range)])
+            else:
+                self._reply(200, content, self.server.attachment_type)
+        else:
+            self._reply(404, b"", "text/plain")
+
+
+class StandInServer(ThreadingHTTPServer):  # pylint: disable=too-many-instance-attributes
+    """Local CloudShell stand-in server.
+
+    :param latency: Simulated server latency, in seconds, of every request.
+    :param reservation: Size of synthetic reservations, see synthetic.reservation_details_xml.
+    :param ignore_range: Serve whole attachments regardless of Range header, as some servers do.
+
+    REST requests authorized by expired logins, see expire_logins, are answered with 401 and the next fail_requests REST
+    requests are answered with 503. Requests without authorization are served. Attachments are served with Content-Type
+    attachment_type.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, latency: float = 0.0, ignore_range: bool = False, **reservation: int) -> None:
+        """Bind to a random local port, the server is started with start()."""
+        super().__init__(("127.0.0.1", 0), StandInHandler)
+        self.latency = latency
+        self.ignore_range = ignore_range
+        self.attachment_type = "application/octet-stream"
+        self.fail_requests = 0
+        self.logins: List[str] = []
+        self.expired: Set[str] = set()
+        self.reservation = reservation
+        self.calls: Counter = Counter()
+        self.attachments: Dict[str, Dict[str, bytes]] = {}
+        self._details: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def host(self) -> str:
+        """Return host:port of the server."""
+        return f"127.0.0.1:{self.server_address[1]}"
+
+    def count(self, operation: str) -> None:
+        """Count request."""
+        with self._lock:
+            self.calls[operation] += 1
+
+    def api_response(self, operation: str, body: bytes) -> bytes:
+        """Return XML API response of the requested operation."""
+        if operation in ("Logon", "SecureLogon"):
+            logon = LOGON_BODY.format(token=TOKEN)
+            return RESPONSE.format(command=operation, response_type="LogonResponseInfo", body=logon).encode()
+        if operation == "GetReservationDetails":
+            reservation_id = re.search(rb"<reservationId>(.*?)</reservationId>", body).group(1).decode()  # type: ignore
+            with self._lock:
+                if reservation_id not in self._details:
+                    self._details[reservation_id] = reservation_details_xml(reservation_id, **self.reservation)
+                return self._details[reservation_id]
+        return EMPTY_RESPONSE.format(command=operation).encode()
+
+    def login(self) -> str:
+        """Return new REST authorization token."""
+        with self._lock:
+            self.logins.append(f"{TOKEN}-{len(self.logins)}")
+            return self.logins[-1]
+
+    def expire_logins(self) -> None:
+        """Expire all REST authorization tokens issued so far."""
+        with self._lock:
+            self.expired.update(f"Basic {token}" for token in self.logins)
+
+    def take_failure(self) -> bool:
+        """Return True if the current REST request should fail."""
+        with self._lock:
+            if self.fail_requests:
+                self.fail_requests -= 1
+                return True
+            return False
+
+    def handle_error(self, request: Any, client_address: Any) -> None:
+        """Ignore clients that close the connection early, e.g. ranged download of server that ignores Range header."""
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def session(self) -> CloudShellAPISession:
+        """Return CloudShell API session logged in to the server."""
+        address, port = self.server_address[:2]
+        return CloudShellAPISession(address, token_id=TOKEN, domain="Global", port=port)
+
+    def start(self) -> "StandInServer":
+        """Serve requests on a background thread."""
+        self._thread = threading.Thread(target=self.serve_forever, name="cloudshell-stand-in", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop serving and close the socket."""
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self) -> "StandInServer":
+        """Start server."""
+        return self.start()
+
+    def __exit__(self, *exc: Any) -> None:
+        """Stop server."""
+        self.stop()
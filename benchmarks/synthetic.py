@@ -0,0 +1,80 @@
+"""
+Synthetic CloudShell API responses of configurable size.
+"""
+from typing import Any
+from xml.sax.saxutils import quoteattr
+
+from cloudshell.api.cloudshell_api import ReservationDescriptionInfo
+from cloudshell.api.common_cloudshell_api import CommonApiResult, XMLWrapper
+
+CHASSIS_ADDRESS = "192.168.1.1"
+PORT_MODEL = "Ixia Chassis Shell 2G.GenericTrafficGeneratorPort"
+PORT_FAMILY = "CS_TrafficGeneratorPort"
+CONTROLLER_MODEL = "IxNetwork Controller Shell 2G"
+
+RESPONSE = (
+    '<Response CommandName="{command}" Success="true" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">'
+    '<ErrorCode>0</ErrorCode><ResponseInfo xsi:type="{response_type}">{body}</ResponseInfo></Response>'
+)
+
+
+def port_name(port: int, ports_per_module: int = 32) -> str:
+    """Return name of synthetic port resource."""
+    return f"Chassis/Module{port // ports_per_module + 1}/Port{port % ports_per_module + 1}"
+
+
+def port_address(port: int, ports_per_module: int = 32) -> str:
+    """Return full address of synthetic port resource."""
+    return f"{CHASSIS_ADDRESS}/M{port // ports_per_module + 1}/P{port % ports_per_module + 1}"
+
+
+def _attributes(count: int, prefix: str = "Attribute") -> str:
+    """Return AttributeValueInfo list XML."""
+    return "".join(f'<AttributeValueInfo Name="{prefix} {i}" Value="Value {i}"/>' for i in range(count))
+
+
+def reservation_details_xml(
+    reservation_id: str = "reservation", ports: int = 100, services: int = 1, connectors: int = 0, attributes: int = 10
+) -> bytes:
+    """Return GetReservationDetails response XML.
+
+    :param ports: Number of port resources.
+    :param services: Number of controller services.
+    :param connectors: Number of connectors between consecutive ports.
+    :param attributes: Number of attributes per service and per connector.
+    """
+    resources_xml = "".join(
+        f"<ReservedResourceInfo Name={quoteattr(port_name(i))} FullAddress={quoteattr(port_address(i))} "
+        f'ResourceFamilyName="{PORT_FAMILY}" ResourceModelName="{PORT_MODEL}" Shared="false" Availability="Available" '
+        f'CreatedInDomain="Global" FolderFullPath="Traffic"/>'
+        for i in range(ports)
+    )
+    services_xml = "".join(
+        f'<ServiceInstance Alias="Controller {i}" ServiceName="{CONTROLLER_MODEL}">'
+        f"<Attributes>{_attributes(attributes)}</Attributes></ServiceInstance>"
+        for i in range(services)
+    )
+    connectors_xml = "".join(
+        f"<Connector Source={quoteattr(port_name(i))} Target={quoteattr(port_name(i + 1))} "
+        f'Alias="Connector {i}" Direction="Bi" State="Connected" Type="Route">'
+        f"<Attributes>{_attributes(attributes)}</Attributes></Connector>"
+        for i in range(min(connectors, max(ports - 1, 0)))
+    )
+    body = (
+        f'<ReservationDescription Id="{reservation_id}" Name="Benchmark" Owner="admin" DomainName="Global">'
+        f"<Resources>{resources_xml}</Resources><Services>{services_xml}</Services>"
+        f"<Connectors>{connectors_xml}</Connectors></ReservationDescription>"
+    )
+    return RESPONSE.format(
+        command="GetReservationDetails", response_type="GetReservationDescriptionResponseInfo", body=body
+    ).encode("utf-8")
+
+
+def parse_response(xml: bytes) -> Any:
+    """Parse response XML into API response object, as CloudShellAPISession does."""
+    return CommonApiResult(XMLWrapper.parseXML(xml)).response_info
+
+
+def reservation_description(**kwargs: int) -> ReservationDescriptionInfo:
+    """Return real API ReservationDescriptionInfo object parsed from synthetic response, see reservation_details_xml."""
+    return parse_response(reservation_details_xml(**kwargs)).ReservationDescription  # type: ignore[arg-type]
@@ -0,0 +1,180 @@
+"""
+Process wide client side admission control of CloudShell API calls and REST requests.
+
+All call sites share one token bucket rate limiter and one concurrency cap. Waiting calls are admitted by priority,
+interactive commands first, then background polling, then logging, and in arrival order within the same priority.
+
+Admission control is disabled by default, enable it once at startup with admission.configure() or by setting the
+environment variable CLOUDSHELL_TRAFFIC_ADMISSION, e.g. "rate=20,burst=5,max_concurrency=4". Limits apply to calls started
+after configure(), calls already queued are re-evaluated against the new limits. While disabled no call takes the
+controller lock: wrap() returns sessions unchanged and RestJsonClient sends requests without entering admit().
+"""
+import heapq
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from enum import IntEnum
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from .metrics import SessionProxy, api_metrics
+
+ADMISSION_ENV_VAR = "CLOUDSHELL_TRAFFIC_ADMISSION"
+
+
+class Priority(IntEnum):
+    """Admission priority, lower value is admitted first."""
+
+    INTERACTIVE = 0
+    POLLING = 1
+    LOGGING = 2
+
+
+class AdmissionController:  # pylint: disable=too-many-instance-attributes
+    """Token bucket rate limiter and concurrency cap with priority queue."""
+
+    def __init__(self, rate: Optional[float] = None, burst: int = 1, max_concurrency: Optional[int] = None) -> None:
+        """Initialize controller, see configure."""
+        self._condition = threading.Condition()
+        self._waiters: List[Tuple[int, int]] = []
+        self._sequence = itertools.count()
+        self._in_flight = 0
+        self._stats: Dict[Priority, Dict[str, float]] = {}
+        self.rate: Optional[float] = None
+        self.burst = 1
+        self.max_concurrency: Optional[int] = None
+        self.enabled = False
+        self._tokens = 0.0
+        self._last_refill = time.monotonic()
+        self.configure(rate, burst, max_concurrency)
+
+    def configure(self, rate: Optional[float] = None, burst: int = 1, max_concurrency: Optional[int] = None) -> None:
+        """Set limits, None disables the limit and disabling both limits disables admission control.
+
+        :param rate: Maximum average number of calls per second.
+        :param burst: Maximum number of calls admitted at once after idle period.
+        :param max_concurrency: Maximum number of calls in flight.
+        """
+        with self._condition:
+            self.rate = rate
+            self.burst = max(burst, 1)
+            self.max_concurrency = max_concurrency
+            self.enabled = rate is not None or max_concurrency is not None
+            self._tokens = float(self.burst)
+            self._last_refill = time.monotonic()
+            self._condition.notify_all()
+
+    def acquire(self, priority: Priority = Priority.INTERACTIVE) -> float:
+        """Block until the call is admitted and return the time, in seconds, it waited in the queue."""
+        start = time.monotonic()
+        with self._condition:
+            waiter = (int(priority), next(self._sequence))
+            heapq.heappush(self._waiters, waiter)
+            while True:
+                timeout = None
+                if self._waiters[0] == waiter and (self.max_concurrency is None or self._in_flight < self.max_concurrency):
+                    timeout = self._take_token()
+                    if timeout is None:
+                        break
+                self._condition.wait(timeout)
+            heapq.heappop(self._waiters)
+            self._in_flight += 1
+            self._condition.notify_all()
+            waited = time.monotonic() - start
+            self._record(priority, waited)
+        if api_metrics.enabled:
+            api_metrics.record(f"admission wait {priority.name}", waited)
+        return waited
+
+    def release(self) -> None:
+        """Release admitted call."""
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify_all()
+
+    @contextmanager
+    def admit(self, priority: Priority = Priority.INTERACTIVE) -> Iterator[float]:
+        """Context manager that acquires admission on enter and releases it on exit, yields queue wait time."""
+        waited = self.acquire(priority)
+        try:
+            yield waited
+        finally:
+            self.release()
+
+    def wrap(self, cs_session: Any, priority: Priority = Priority.INTERACTIVE) -> Any:
+        """Return CloudShell session whose API calls are admitted with priority, or the session if admission is disabled."""
+        if not self.enabled:
+            return cs_session
+        if isinstance(cs_session, AdmittedSession):
+            cs_session = cs_session.wrapped
+        return AdmittedSession(cs_session, self, priority)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return current queue length and calls in flight, and per priority admitted calls and queue wait times."""
+        with self._condition:
+            return {
+                "queued": len(self._waiters),
+                "in_flight": self._in_flight,
+                "priorities": {priority.name: dict(stats) for priority, stats in sorted(self._stats.items())},
+            }
+
+    def reset_stats(self) -> None:
+        """Reset per priority counters."""
+        with self._condition:
+            self._stats.clear()
+
+    def _take_token(self) -> Optional[float]:
+        """Take token from the bucket and return None, or return the time until the next token if the bucket is empty."""
+        if self.rate is None:
+            return None
+        now = time.monotonic()
+        self._tokens = min(float(self.burst), self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return None
+        return (1 - self._tokens) / self.rate
+
+    def _record(self, priority: Priority, waited: float) -> None:
+        """Update queue wait counters, must be called with the lock acquired."""
+        stats = self._stats.setdefault(priority, {"admitted": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0})
+        stats["admitted"] += 1
+        stats["wait_seconds"] += waited
+        stats["max_wait_seconds"] = max(stats["max_wait_seconds"], waited)
+
+
+class AdmittedSession(SessionProxy):
+    """Proxy of CloudShell API session that admits every API method call through the admission controller."""
+
+    def __init__(self, cs_session: Any, controller: AdmissionController, priority: Priority) -> None:
+        """Wrap session, calls are admitted with priority."""
+        super().__init__(cs_session)
+        self.__dict__["_controller"] = controller
+        self.__dict__["_priority"] = priority
+
+    def _call(self, name: str, method: Callable, *args: Any, **kwargs: Any) -> Any:
+        """Wait for admission, call API method and release admission."""
+        with self._controller.admit(self._priority):
+            return method(*args, **kwargs)
+
+    @property
+    def priority(self) -> Priority:
+        """Return the priority of the session calls."""
+        return self._priority
+
+
+def _limits_from_env(env: Optional[str]) -> Dict[str, Any]:
+    """Return configure arguments from environment variable value "rate=<float>,burst=<int>,max_concurrency=<int>"."""
+    limits: Dict[str, Any] = {}
+    for item in (env or "").split(","):
+        name, _, value = item.partition("=")
+        name = name.strip()
+        if name == "rate":
+            limits[name] = float(value)
+        elif name in ("burst", "max_concurrency"):
+            limits[name] = int(value)
+    return limits
+
+
+admission = AdmissionController(**_limits_from_env(os.environ.get(ADMISSION_ENV_VAR)))
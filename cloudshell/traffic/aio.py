@@ -0,0 +1,288 @@
+"""
+asyncio variants of cloudshell traffic helpers for concurrent multi-sandbox orchestration.
+
+CloudShell APIs are blocking so each API call runs on a shared, bounded thread pool, while waits between polls are
+asyncio sleeps that do not hold a thread. Concurrent calls to the same CloudShell server are capped by a per server
+semaphore so a single event loop can manage hundreds of sandboxes without flooding any server.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from io import StringIO
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Optional, TypeVar, Union
+
+from cloudshell.shell.core.driver_context import ResourceCommandContext
+
+from . import helpers
+from .admission import Priority, admission
+from .helpers import (
+    WAIT_BACKOFF,
+    WAIT_INITIAL_INTERVAL,
+    WAIT_JITTER,
+    WAIT_MAX_INTERVAL,
+    AddResourcesReport,
+    ReservationIndex,
+    ResourceSpec,
+    WaitReport,
+    reservation_cache,
+    reservation_condition,
+    wait_intervals,
+)
+from .metrics import api_metrics
+from .rest_api_helpers import ATTACHMENTS_MAX_WORKERS, BulkResult, SandboxAttachments
+
+if TYPE_CHECKING:
+    from cloudshell.api.cloudshell_api import (
+        CloudShellAPISession,
+        ReservationDescriptionInfo,
+        ReservedResourceInfo,
+        ServiceInstance,
+    )
+    from cloudshell.workflow.orchestration.sandbox import Sandbox
+
+MAX_CONCURRENCY_PER_SERVER = 8
+MAX_WORKERS = 32
+
+T = TypeVar("T")
+
+_semaphores: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]] = weakref.WeakKeyDictionary()
+
+
+@lru_cache(maxsize=None)
+def _get_executor() -> ThreadPoolExecutor:
+    """Return the shared thread pool, create it on first use."""
+    return ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="cloudshell-traffic-aio")
+
+
+def _get_semaphore(server: str) -> asyncio.Semaphore:
+    """Return the semaphore that limits concurrent calls to the server from the running event loop.
+
+    Semaphores are dropped when their event loop is garbage collected. Semaphores that had waiters reference their loop, so
+    semaphores of closed loops are also dropped when a new loop calls its first server.
+    """
+    loop = asyncio.get_running_loop()
+    loop_semaphores = _semaphores.get(loop)
+    if loop_semaphores is None:
+        for closed_loop in [other for other in _semaphores if other.is_closed()]:
+            del _semaphores[closed_loop]
+        loop_semaphores = _semaphores[loop] = {}
+    if server not in loop_semaphores:
+        loop_semaphores[server] = asyncio.Semaphore(MAX_CONCURRENCY_PER_SERVER)
+    return loop_semaphores[server]
+
+
+def get_server(cs_object: Any) -> str:
+    """Return the address of the CloudShell server of a session, context, sandbox or attachments object."""
+    for path in ("host", "connectivity.server_address", "automation_api.host"):
+        obj = cs_object
+        try:
+            for attr in path.split("."):
+                obj = getattr(obj, attr)
+            return obj
+        except AttributeError:
+            pass
+    raise AttributeError(f"Could not get CloudShell server from {cs_object}")
+
+
+async def run_blocking(server: str, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run blocking function on the shared thread pool, limited by the server concurrency cap."""
+    async with _get_semaphore(server):
+        return await asyncio.get_running_loop().run_in_executor(_get_executor(), lambda: func(*args, **kwargs))
+
+
+async def get_reservation_description(
+    context_or_sandbox: Union[ResourceCommandContext, Sandbox], use_cache: bool = False
+) -> ReservationDescriptionInfo:
+    """Get reservation description."""
+    return await run_blocking(
+        get_server(context_or_sandbox), helpers.get_reservation_description, context_or_sandbox, use_cache=use_cache
+    )
+
+
+async def get_reservation_index(
+    context_or_sandbox: Union[ResourceCommandContext, Sandbox], use_cache: bool = False
+) -> ReservationIndex:
+    """Get index over reservation description."""
+    return await run_blocking(
+        get_server(context_or_sandbox), helpers.get_reservation_index, context_or_sandbox, use_cache=use_cache
+    )
+
+
+async def get_resources_from_reservation(
+    context_or_sandbox: Union[ResourceCommandContext, Sandbox], *resource_models: str, use_cache: bool = False
+) -> List[ReservedResourceInfo]:
+    """Get all resources with the requested resource model names."""
+    return (await get_reservation_index(context_or_sandbox, use_cache=use_cache)).get_resources(*resource_models)
+
+
+async def get_services_from_reservation(
+    context_or_sandbox: Union[ResourceCommandContext, Sandbox], *service_names: str, use_cache: bool = False
+) -> List[ServiceInstance]:
+    """Get all services with the requested service names."""
+    return (await get_reservation_index(context_or_sandbox, use_cache=use_cache)).get_services(*service_names)
+
+
+async def add_resource_to_db(
+    context: ResourceCommandContext,
+    resource_model: str,
+    resource_full_name: str,
+    resource_address: str = "na",
+    **attributes: str,
+) -> None:
+    """Add resource to cloudshell DB if not already exist."""
+    await run_blocking(
+        get_server(context),
+        helpers.add_resource_to_db,
+        context,
+        resource_model,
+        resource_full_name,
+        resource_address,
+        **attributes,
+    )
+
+
+async def add_resources_to_db(
+    context: ResourceCommandContext, specs: Iterable[ResourceSpec], update_existing: bool = False
+) -> AddResourcesReport:
+    """Add resources to cloudshell DB, skip resources that already exist, see helpers.add_resources_to_db."""
+    return await run_blocking(get_server(context), helpers.add_resources_to_db, context, list(specs), update_existing)
+
+
+# pylint: disable=too-many-arguments
+async def wait_until(
+    cs_session: CloudShellAPISession,
+    reservation_id: str,
+    predicate: Callable[[ReservationIndex], bool],
+    timeout: float = 4,
+    interval: float = WAIT_INITIAL_INTERVAL,
+    max_interval: float = WAIT_MAX_INTERVAL,
+    backoff: float = WAIT_BACKOFF,
+    jitter: float = WAIT_JITTER,
+    message: str = "Reservation condition not met",
+) -> WaitReport:
+    """Poll reservation details until predicate is True or timeout expires.
+
+    Same as helpers.wait_until but sleeps between polls do not block the event loop or hold a thread.
+    """
+    server = get_server(cs_session)
+    cs_session = admission.wrap(api_metrics.instrument(cs_session), Priority.POLLING)
+    start = time.monotonic()
+    polls = 0
+    for delay in wait_intervals(start + timeout, interval, max_interval, backoff, jitter):
+        await asyncio.sleep(delay)
+        polls += 1
+        if predicate(await run_blocking(server, reservation_cache.fetch_index, cs_session, reservation_id)):
+            return WaitReport(polls, time.monotonic() - start)
+    raise TimeoutError(f"{message} after {timeout} seconds")
+
+
+async def wait_for_reservation(
+    cs_session: CloudShellAPISession,
+    reservation_id: str,
+    resources_names: Optional[Iterable[str]] = None,
+    services_aliases: Optional[Iterable[str]] = None,
+    connectors_aliases: Optional[Iterable[str]] = None,
+    attributes: Optional[Dict[str, Dict[str, str]]] = None,
+    timeout: float = 4,
+    **kwargs: float,
+) -> WaitReport:
+    """Wait until all requested resources, services, connectors and service attribute values show in reservation details."""
+    predicate, message = reservation_condition(resources_names, services_aliases, connectors_aliases, attributes)
+    return await wait_until(cs_session, reservation_id, predicate, timeout, message=message, **kwargs)
+
+
+async def wait_for_resources(
+    cs_session: CloudShellAPISession, reservation_id: str, resources_names: Union[list, str], timeout: float = 4
+) -> WaitReport:
+    """Wait until all resources show in reservation details."""
+    if isinstance(resources_names, str):
+        resources_names = [resources_names]
+    return await wait_for_reservation(cs_session, reservation_id, resources_names=resources_names, timeout=timeout)
+
+
+async def wait_for_services(
+    cs_session: CloudShellAPISession, reservation_id: str, aliases: Union[list, str], timeout: float = 4
+) -> WaitReport:
+    """Wait until all services show in reservation details."""
+    if isinstance(aliases, str):
+        aliases = [aliases]
+    return await wait_for_reservation(cs_session, reservation_id, services_aliases=aliases, timeout=timeout)
+
+
+async def wait_for_connectors(
+    cs_session: CloudShellAPISession, reservation_id: str, aliases: Union[list, str], timeout: float = 4
+) -> WaitReport:
+    """Wait until all connectors show in reservation details."""
+    if isinstance(aliases, str):
+        aliases = [aliases]
+    return await wait_for_reservation(cs_session, reservation_id, connectors_aliases=aliases, timeout=timeout)
+
+
+async def wait_for_attribute(
+    cs_session: CloudShellAPISession,
+    reservation_id: str,
+    alias: str,
+    attribute_name: str,
+    attribute_value: str,
+    timeout: float = 4,
+) -> WaitReport:
+    """Wait until an attribute that was set is updated on the sandbox."""
+    attributes = {alias: {attribute_name: attribute_value}}
+    return await wait_for_reservation(cs_session, reservation_id, attributes=attributes, timeout=timeout)
+
+
+class AsyncSandboxAttachments:
+    """asyncio wrapper for SandboxAttachments."""
+
+    def __init__(self, host: str, token: str, logger: logging.Logger) -> None:
+        """Initialize the wrapped cloudshell REST client."""
+        self.attachments = SandboxAttachments(host, token, logger)
+
+    async def _run(self, func: Callable[..., T], *args: Any) -> T:
+        """Run blocking attachments operation on the shared thread pool."""
+        return await run_blocking(self.attachments.host.split(":")[0], func, *args)
+
+    async def login(self) -> None:
+        """Login to cloudshell."""
+        await self._run(self.attachments.login)
+
+    async def attach_new_file(self, reservation_id: str, file_data: Union[str, StringIO], file_name: str) -> None:
+        """Attach file to reservation."""
+        await self._run(self.attachments.attach_new_file, reservation_id, file_data, file_name)
+
+    async def get_attached_files(self, reservation_id: str) -> list:
+        """Get all attached file names from reservation."""
+        return await self._run(self.attachments.get_attached_files, reservation_id)
+
+    async def get_attached_file(self, reservation_id: str, file_name: str) -> bytes:
+        """Get attached file content from reservation."""
+        return await self._run(self.attachments.get_attached_file, reservation_id, file_name)
+
+    async def get_attached_files_content(
+        self,
+        reservation_id: str,
+        name_filter: Optional[Union[str, Callable[[str], bool]]] = None,
+        max_workers: int = ATTACHMENTS_MAX_WORKERS,
+    ) -> BulkResult:
+        """Get content of all, or all matching, attached files from reservation, see SandboxAttachments."""
+        return await self._run(self.attachments.get_attached_files_content, reservation_id, name_filter, max_workers)
+
+    async def attach_files(
+        self, reservation_id: str, files: Dict[str, Union[str, StringIO]], max_workers: int = ATTACHMENTS_MAX_WORKERS
+    ) -> BulkResult:
+        """Attach files to reservation in parallel, see SandboxAttachments."""
+        return await self._run(self.attachments.attach_files, reservation_id, files, max_workers)
+
+    async def remove_attached_files(
+        self,
+        reservation_id: str,
+        name_filter: Optional[Union[str, Callable[[str], bool]]] = None,
+        max_workers: int = ATTACHMENTS_MAX_WORKERS,
+    ) -> BulkResult:
+        """Remove all, or all matching, attached files from a sandbox, see SandboxAttachments."""
+        return await self._run(self.attachments.remove_attached_files, reservation_id, name_filter, max_workers)
@@ -1,53 +1,740 @@
 """
 Helpers for cloudshell traffic shells and scripts.
 """
+# pylint: disable=too-many-lines
+from __future__ import annotations
+
+import importlib
 import logging
+import queue
+import random
 import re
+import sys
+import threading
 import time
-from typing import List, Union
-
-from cloudshell.api.cloudshell_api import (
-    CloudShellAPISession,
-    CreateReservationResponseInfo,
-    ReservationDescriptionInfo,
-    ReservedResourceInfo,
-    ServiceInstance,
+from collections import OrderedDict, defaultdict
+from functools import lru_cache
+from logging.handlers import QueueHandler, QueueListener
+from types import MappingProxyType, ModuleType
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+    Union,
 )
+
 from cloudshell.shell.core.driver_context import ResourceCommandContext
-from cloudshell.shell.core.session.cloudshell_session import CloudShellSessionContext
-from cloudshell.workflow.orchestration.sandbox import Sandbox
+
+if TYPE_CHECKING:
+    from cloudshell.api.cloudshell_api import (
+        CloudShellAPISession,
+        Connector,
+        CreateReservationResponseInfo,
+        ReservationDescriptionInfo,
+        ReservedResourceInfo,
+        ResourceInfo,
+        ServiceInstance,
+    )
+    from cloudshell.workflow.orchestration.sandbox import Sandbox
+
+from .admission import Priority, admission
+from .metrics import SessionProxy, api_metrics
+
+RESERVATION_CACHE_TTL = 5
+RESERVATION_CACHE_SIZE = 64
+RESERVATION_CACHE_IDLE_TIMEOUT = 600
+
+CS_SESSION_IDLE_TIMEOUT = 600
+CS_SESSION_HEALTH_CHECK_INTERVAL = 60
+CS_AUTH_ERROR_CODES = ("100",)
+
+RESERVATION_OUTPUT_FLUSH_INTERVAL = 1.0
+RESERVATION_OUTPUT_MAX_BATCH = 100
+RESERVATION_OUTPUT_QUEUE_SIZE = 10000
+
+LOG_RATE_LIMIT_BURST = 10
+LOG_RATE_LIMIT_INTERVAL = 1.0
+LOG_RATE_LIMIT_MAX_KEYS = 4096
+
+LOCATION_CACHE_SIZE = 16384
+
+WAIT_INITIAL_INTERVAL = 0.05
+WAIT_MAX_INTERVAL = 1.0
+WAIT_BACKOFF = 2.0
+WAIT_JITTER = 0.1
+
+FIND_RESOURCES_MAX_RESULTS = 500
+ATTRIBUTES_BATCH_SIZE = 100
+
+EMPTY_ATTRIBUTES: Mapping[str, str] = MappingProxyType({})
+
+K = TypeVar("K")
+
+
+def _cloudshell_api() -> ModuleType:
+    """Return the CloudShell API module, imported on first use as it is a large part of the package import time."""
+    return importlib.import_module("cloudshell.api.cloudshell_api")
+
+
+def _group_by(items: Iterable[Any], key: Callable[[Any], K]) -> Mapping[K, tuple]:
+    """Group items by key into a read-only mapping of tuples, preserving the original order inside each group."""
+    groups = defaultdict(list)
+    for item in items:
+        groups[key(item)].append(item)
+    return MappingProxyType({k: tuple(v) for k, v in groups.items()})
+
+
+class ReservationIndex:
+    """Immutable lookup tables over a reservation description.
+
+    Built once per GetReservationDetails snapshot so repeated lookups are dict/set lookups and not list scans.
+    """
+
+    __slots__ = (
+        "description",
+        "resources_by_name",
+        "resources_by_model",
+        "resources_by_family",
+        "resources_by_address",
+        "services_by_alias",
+        "services_by_name",
+        "connectors_by_alias",
+        "connectors_by_endpoint",
+        "service_attributes",
+    )
+
+    description: ReservationDescriptionInfo
+    resources_by_name: Mapping[str, ReservedResourceInfo]
+    resources_by_model: Mapping[str, Tuple[ReservedResourceInfo, ...]]
+    resources_by_family: Mapping[str, Tuple[ReservedResourceInfo, ...]]
+    resources_by_address: Mapping[str, ReservedResourceInfo]
+    services_by_alias: Mapping[str, ServiceInstance]
+    services_by_name: Mapping[str, Tuple[ServiceInstance, ...]]
+    connectors_by_alias: Mapping[str, Connector]
+    connectors_by_endpoint: Mapping[str, Tuple[Connector, ...]]
+    service_attributes: Mapping[str, Mapping[str, str]]
+
+    def __init__(self, description: ReservationDescriptionInfo) -> None:
+        """Build all indexes from reservation description."""
+        resources = description.Resources
+        services = description.Services
+        connectors = description.Connectors
+        endpoints = [(c.Source, c) for c in connectors] + [(c.Target, c) for c in connectors if c.Target != c.Source]
+        init = super().__setattr__
+        init("description", description)
+        init("resources_by_name", MappingProxyType({r.Name: r for r in resources}))
+        init("resources_by_model", _group_by(resources, lambda r: r.ResourceModelName))
+        init("resources_by_family", _group_by(resources, lambda r: r.ResourceFamilyName))
+        init("resources_by_address", MappingProxyType({r.FullAddress: r for r in resources}))
+        init("services_by_alias", MappingProxyType({s.Alias: s for s in services}))
+        init("services_by_name", _group_by(services, lambda s: s.ServiceName))
+        init("connectors_by_alias", MappingProxyType({c.Alias: c for c in connectors}))
+        by_endpoint = _group_by(endpoints, lambda e: e[0])
+        init("connectors_by_endpoint", MappingProxyType({n: tuple(c for _, c in g) for n, g in by_endpoint.items()}))
+        init(
+            "service_attributes",
+            MappingProxyType({s.Alias: MappingProxyType({a.Name: a.Value for a in s.Attributes}) for s in services}),
+        )
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        """Reservation index is immutable."""
+        raise AttributeError(f"{self.__class__.__name__} is immutable")
+
+    def get_resources(self, *resource_models: str) -> List[ReservedResourceInfo]:
+        """Get all resources with the requested resource model names, in reservation order."""
+        if len(resource_models) == 1:
+            return list(self.resources_by_model.get(resource_models[0], ()))
+        models = set(resource_models)
+        return [r for r in self.description.Resources if r.ResourceModelName in models]
+
+    def get_resources_by_family(self, *resource_families: str) -> List[ReservedResourceInfo]:
+        """Get all resources with the requested resource family names, in reservation order."""
+        if len(resource_families) == 1:
+            return list(self.resources_by_family.get(resource_families[0], ()))
+        families = set(resource_families)
+        return [r for r in self.description.Resources if r.ResourceFamilyName in families]
+
+    def get_services(self, *service_names: str) -> List[ServiceInstance]:
+        """Get all services with the requested service names, in reservation order."""
+        if len(service_names) == 1:
+            return list(self.services_by_name.get(service_names[0], ()))
+        names = set(service_names)
+        return [s for s in self.description.Services if s.ServiceName in names]
+
+    def get_connectors(self, endpoint: str) -> Tuple[Connector, ...]:
+        """Get all connectors with the requested resource or service as source or target."""
+        return self.connectors_by_endpoint.get(endpoint, ())
+
+    def get_service_attribute(self, alias: str, attribute_name: str) -> Optional[str]:
+        """Get value of service attribute, None if the service or the attribute are not in the reservation."""
+        return self.service_attributes.get(alias, {}).get(attribute_name)
+
+    def has_resources(self, resources_names: Iterable[str]) -> bool:
+        """Return True if all requested resources are in the reservation."""
+        return all(name in self.resources_by_name for name in resources_names)
+
+    def has_services(self, aliases: Iterable[str]) -> bool:
+        """Return True if all requested services are in the reservation."""
+        return all(alias in self.services_by_alias for alias in aliases)
+
+    def has_connectors(self, aliases: Iterable[str]) -> bool:
+        """Return True if all requested connectors are in the reservation."""
+        return all(alias in self.connectors_by_alias for alias in aliases)
+
+
+class ReservationCache:  # pylint: disable=too-many-instance-attributes
+    """Per reservation cache of GetReservationDetails snapshots.
+
+    Snapshots are served from the cache only when the caller opts in and the snapshot is younger than the TTL. Every fetch,
+    cached or not, refreshes the snapshot so polling helpers keep it warm for readers. The cache keeps at most max_size
+    reservations, least recently fetched first out, and drops snapshots not refreshed for idle_timeout seconds.
+    """
+
+    def __init__(
+        self,
+        ttl: float = RESERVATION_CACHE_TTL,
+        max_size: int = RESERVATION_CACHE_SIZE,
+        idle_timeout: float = RESERVATION_CACHE_IDLE_TIMEOUT,
+    ) -> None:
+        """Initialize empty cache.
+
+        :param ttl: Maximum age, in seconds, of a snapshot that can be served from the cache.
+        :param max_size: Maximum number of cached reservations.
+        :param idle_timeout: Time, in seconds, after which a snapshot that was not refreshed is dropped.
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.hits = 0
+        self.misses = 0
+        self._snapshots: OrderedDict[str, Tuple[float, ReservationDescriptionInfo]] = OrderedDict()
+        self._indexes: Dict[str, ReservationIndex] = {}
+        self._lock = threading.Lock()
+
+    def get(
+        self, cs_session: CloudShellAPISession, reservation_id: str, use_cache: bool = True, ttl: Optional[float] = None
+    ) -> ReservationDescriptionInfo:
+        """Return reservation description, from cache if allowed and fresh, else from the server.
+
+        :param cs_session: CloudShell session used on cache miss.
+        :param reservation_id: Reservation ID.
+        :param use_cache: If False, always fetch from the server.
+        :param ttl: Override the cache TTL for this call.
+        """
+        if use_cache:
+            max_age = self.ttl if ttl is None else ttl
+            with self._lock:
+                snapshot = self._snapshots.get(reservation_id)
+                if snapshot and time.monotonic() - snapshot[0] < max_age:
+                    self.hits += 1
+                    return snapshot[1]
+        return self.fetch(cs_session, reservation_id)
+
+    def fetch(self, cs_session: CloudShellAPISession, reservation_id: str) -> ReservationDescriptionInfo:
+        """Fetch reservation description from the server and store it in the cache."""
+        cs_session = api_metrics.instrument(cs_session)
+        description = cs_session.GetReservationDetails(reservation_id, disableCache=True).ReservationDescription
+        with self._lock:
+            self.misses += 1
+            self._snapshots[reservation_id] = (time.monotonic(), description)
+            self._snapshots.move_to_end(reservation_id)
+            self._expire()
+        return description
+
+    def get_index(
+        self, cs_session: CloudShellAPISession, reservation_id: str, use_cache: bool = True, ttl: Optional[float] = None
+    ) -> ReservationIndex:
+        """Return index over the reservation description returned by get, build it only once per snapshot."""
+        return self._index(reservation_id, self.get(cs_session, reservation_id, use_cache, ttl))
+
+    def fetch_index(self, cs_session: CloudShellAPISession, reservation_id: str) -> ReservationIndex:
+        """Return index over the reservation description fetched from the server."""
+        return self._index(reservation_id, self.fetch(cs_session, reservation_id))
+
+    def _index(self, reservation_id: str, description: ReservationDescriptionInfo) -> ReservationIndex:
+        """Return cached index of the description, build and cache it if the description is new."""
+        with self._lock:
+            index = self._indexes.get(reservation_id)
+        if index is None or index.description is not description:
+            index = ReservationIndex(description)
+            with self._lock:
+                if reservation_id in self._snapshots:
+                    self._indexes[reservation_id] = index
+        return index
+
+    def invalidate(self, reservation_id: Optional[str] = None) -> None:
+        """Drop the snapshot of the requested reservation, or all snapshots if no reservation is specified."""
+        with self._lock:
+            if reservation_id is None:
+                self._snapshots.clear()
+                self._indexes.clear()
+            else:
+                self._snapshots.pop(reservation_id, None)
+                self._indexes.pop(reservation_id, None)
+
+    def stats(self) -> Dict[str, int]:
+        """Return cache counters."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._snapshots)}
+
+    def _expire(self) -> None:
+        """Drop idle snapshots and least recently fetched snapshots above max size, must be called with the lock acquired."""
+        now = time.monotonic()
+        while self._snapshots:
+            reservation_id, (fetched, _) = next(iter(self._snapshots.items()))
+            if len(self._snapshots) <= self.max_size and now - fetched <= self.idle_timeout:
+                break
+            del self._snapshots[reservation_id]
+            self._indexes.pop(reservation_id, None)
+
+    def reset_stats(self) -> None:
+        """Reset cache counters."""
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+
+reservation_cache = ReservationCache()
+
+
+class ResourceAttributesResolver:
+    """Cache of resource attribute names resolved from plain names to 2nd gen shell namespaced names.
+
+    The namespace (model or family) of an attribute does not change during the life of a resource so, unlike attribute
+    values, resolved names are cached until explicitly invalidated.
+    """
+
+    def __init__(self) -> None:
+        """Initialize empty cache."""
+        self.hits = 0
+        self.misses = 0
+        self._names: Dict[str, Dict[str, str]] = {}
+        self._model_names: Dict[str, Dict[str, str]] = {}
+        self._lock = threading.Lock()
+
+    def update(self, res_details: ResourceInfo) -> Dict[str, str]:
+        """Cache the attribute names of the resource details and return the map from requested to actual names.
+
+        Each actual name is mapped from itself and, for namespaced names, from the plain name. The first matching attribute
+        wins, as in the original linear scan.
+        """
+        prefixes = (f"{res_details.ResourceModelName}.", f"{res_details.ResourceFamilyName}.")
+        names: Dict[str, str] = {}
+        for attr in res_details.ResourceAttributes:
+            names.setdefault(attr.Name, attr.Name)
+            for prefix in prefixes:
+                if attr.Name.startswith(prefix):
+                    names.setdefault(attr.Name.replace(prefix, "", 1), attr.Name)
+        with self._lock:
+            self._names[res_details.Name] = names
+            self._model_names[res_details.ResourceModelName] = names
+        return names
+
+    def resolve(
+        self,
+        cs_session: CloudShellAPISession,
+        resource_name: str,
+        attributes: Iterable[str],
+        resource_model: Optional[str] = None,
+    ) -> Dict[str, str]:
+        """Return map from requested attribute names to actual attribute names.
+
+        Resource details are read from the server only if the resource is not cached or some attributes are not resolved.
+
+        :param resource_model: If specified, names resolved for any resource of the same model are used for a resource
+            not seen before. All resources of a model share the same attributes.
+        :raises KeyError: If some attributes do not exist on the resource.
+        """
+        attributes = list(attributes)
+        with self._lock:
+            names = self._names.get(resource_name)
+            if names is None and resource_model is not None:
+                names = self._model_names.get(resource_model)
+        if names is not None and all(attribute in names for attribute in attributes):
+            self.hits += 1
+        else:
+            self.misses += 1
+            names = self.update(api_metrics.instrument(cs_session).GetResourceDetails(resource_name))
+        missing = [attribute for attribute in attributes if attribute not in names]
+        if missing:
+            raise KeyError(f"Attributes {missing} not found on resource {resource_name}")
+        return {attribute: names[attribute] for attribute in attributes}
+
+    def invalidate(self, resource_name: Optional[str] = None) -> None:
+        """Drop the names of the requested resource, or all resources if no resource is specified."""
+        with self._lock:
+            if resource_name is None:
+                self._names.clear()
+                self._model_names.clear()
+            else:
+                self._names.pop(resource_name, None)
+
+    def stats(self) -> Dict[str, int]:
+        """Return cache counters."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._names)}
 
 
-class ReservationOutputHandler(logging.Handler):
-    """Logger handler to write log messages to reservation output."""
+resource_attributes_resolver = ResourceAttributesResolver()
 
-    def __init__(self, context_or_sandbox: Union[ResourceCommandContext, Sandbox]) -> None:
-        """Initialize session and sandbox ID."""
-        self.session = get_cs_session(context_or_sandbox)
+
+class CloudShellSessionPool:
+    """Thread safe pool of CloudShell API sessions keyed by server, token and domain.
+
+    Sessions not used for idle_timeout seconds are dropped. Sessions not used for health_check_interval seconds are checked
+    with a cheap API call before they are returned, and re-created (logged in again) if the check fails, e.g. when the
+    token expired. Sessions whose token expires while in use are recovered by RelogSession.
+    """
+
+    def __init__(
+        self, idle_timeout: float = CS_SESSION_IDLE_TIMEOUT, health_check_interval: float = CS_SESSION_HEALTH_CHECK_INTERVAL
+    ) -> None:
+        """Initialize empty pool."""
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.logins = 0
+        self.hits = 0
+        self._sessions: Dict[Tuple[str, str, str, str], Tuple[CloudShellAPISession, float]] = {}
+        self._lock = threading.Lock()
+        self._login_locks: Dict[Tuple[str, str, str, str], threading.Lock] = defaultdict(threading.Lock)
+
+    def get(self, server: str, token: str, domain: str = "Global", scheme: str = "http") -> CloudShellAPISession:
+        """Return pooled session, login only if there is no healthy session for server, token and domain."""
+        key = (server, token, domain, scheme)
+        with self._lock:
+            self._expire()
+            login_lock = self._login_locks[key]
+        with login_lock:
+            with self._lock:
+                session, last_used = self._sessions.get(key, (None, 0))
+            check = session is not None and time.monotonic() - last_used > self.health_check_interval
+            if check and not self._healthy(session):
+                session = None
+            login = session is None
+            if login:
+                session = _cloudshell_api().CloudShellAPISession(
+                    server, token_id=token, domain=domain, cloudshell_api_scheme=scheme
+                )
+            with self._lock:
+                self._sessions[key] = (session, time.monotonic())
+                self.logins += login
+                self.hits += not login
+            return session
+
+    def invalidate(self, session: Optional[CloudShellAPISession] = None) -> None:
+        """Drop the requested session, e.g. after authentication error, or all sessions if no session is specified."""
+        while hasattr(session, "wrapped"):
+            session = session.wrapped
+        with self._lock:
+            for key, (pooled_session, _) in list(self._sessions.items()):
+                if session is None or pooled_session is session:
+                    del self._sessions[key]
+
+    def stats(self) -> Dict[str, int]:
+        """Return pool counters."""
+        with self._lock:
+            return {"logins": self.logins, "hits": self.hits, "size": len(self._sessions)}
+
+    def _expire(self) -> None:
+        """Drop idle sessions, must be called with the pool lock acquired."""
+        now = time.monotonic()
+        for key, (_, last_used) in list(self._sessions.items()):
+            if now - last_used > self.idle_timeout:
+                del self._sessions[key]
+                self._login_locks.pop(key, None)
+
+    @staticmethod
+    def _healthy(session: CloudShellAPISession) -> bool:
+        """Return True if the session can still call the server."""
+        try:
+            session.GetServerDateAndTime()
+            return True
+        except Exception:  # pylint: disable=broad-except
+            return False
+
+
+def _is_auth_error(error: Exception) -> bool:
+    """Return True if the error is a CloudShell API authentication fault, by its error code (see CS_AUTH_ERROR_CODES).
+
+    The message is not checked, failed commands can mention tokens or logons of other systems in their messages.
+    """
+    api_error = importlib.import_module("cloudshell.api.common_cloudshell_api").CloudShellAPIError
+    return isinstance(error, api_error) and str(error.code) in CS_AUTH_ERROR_CODES
+
+
+class RelogSession(SessionProxy):  # pylint: disable=too-few-public-methods
+    """Proxy of pooled CloudShell API session that logs in again and retries once when an API call fails authentication.
+
+    The failed session is invalidated in the pool, so other users of the pool get the new session as well. Only calls
+    rejected with an authentication error code are retried, the server rejects them before it executes them, so retrying
+    non-idempotent calls such as ExecuteCommand is safe.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self, pool: CloudShellSessionPool, server: str, token: str, domain: str = "Global", scheme: str = "http"
+    ) -> None:
+        """Get session from the pool."""
+        super().__init__(pool.get(server, token, domain, scheme))
+        self.__dict__["_pool"] = pool
+        self.__dict__["_key"] = (server, token, domain, scheme)
+
+    def _call(self, name: str, method: Callable, *args: Any, **kwargs: Any) -> Any:
+        """Call API method, on authentication fault replace the session with a new login and call it again."""
+        session = self._session
+        try:
+            return method(*args, **kwargs)
+        except Exception as error:  # pylint: disable=broad-except
+            if not _is_auth_error(error):
+                raise
+            logging.getLogger(__name__).info("CloudShell API %s authentication failed, logging in again", name)
+        self._pool.invalidate(session)
+        self.__dict__["_session"] = self._pool.get(*self._key)
+        return getattr(self._session, name)(*args, **kwargs)
+
+
+cs_session_pool = CloudShellSessionPool()
+
+
+class ReservationOutputHandler(logging.Handler):  # pylint: disable=too-many-instance-attributes
+    """Logger handler to write log messages to reservation output.
+
+    By default each record is written synchronously. In batched mode records are queued and a background thread coalesces
+    them into one reservation output message per flush interval or batch size, so logging does not wait for the server.
+    """
+
+    _flush = object()
+    _stop = object()
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        context_or_sandbox: Union[ResourceCommandContext, Sandbox],
+        batched: bool = False,
+        flush_interval: float = RESERVATION_OUTPUT_FLUSH_INTERVAL,
+        max_batch: int = RESERVATION_OUTPUT_MAX_BATCH,
+        queue_size: int = RESERVATION_OUTPUT_QUEUE_SIZE,
+        block: bool = False,
+    ) -> None:
+        """Initialize session and sandbox ID, start background writer in batched mode.
+
+        :param batched: True - queue records and write them in batches from a background thread, False - write each record.
+        :param flush_interval: Maximum time, in seconds, a record waits in a batch.
+        :param max_batch: Maximum number of records in one reservation output message.
+        :param queue_size: Maximum number of queued records.
+        :param block: True - block the logging thread when the queue is full, False - drop the record and count it.
+        """
+        self.session = admission.wrap(get_cs_session(context_or_sandbox), Priority.LOGGING)
         self.sandbox_id = get_reservation_id(context_or_sandbox)
         super().__init__()
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.block = block
+        self.dropped = 0
+        self.failed = 0
+        self._queue: Optional[queue.Queue] = None
+        self._thread: Optional[threading.Thread] = None
+        if batched:
+            self._queue = queue.Queue(queue_size)
+            self._thread = threading.Thread(target=self._writer, name=f"reservation-output-{self.sandbox_id}", daemon=True)
+            self._thread.start()
 
     def emit(self, record: logging.LogRecord) -> None:
         """Log the specified logging record to reservation output."""
         log_entry = self.format(record)
-        self.session.WriteMessageToReservationOutput(self.sandbox_id, log_entry)
+        if self._queue is None:
+            self.session.WriteMessageToReservationOutput(self.sandbox_id, log_entry)
+            return
+        try:
+            self._queue.put(log_entry, block=self.block)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self) -> None:
+        """Write all queued records and wait until they are written."""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(self._flush)
+            self._queue.join()
+
+    def close(self) -> None:
+        """Write all queued records, stop the background writer and close the handler."""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(self._stop)
+            self._thread.join()
+        super().close()
+
+    def _writer(self) -> None:
+        """Background writer - coalesce queued records and write them to reservation output."""
+        batch: List[str] = []
+        taken = 0
+        deadline = None
+        while True:
+            try:
+                item = self._queue.get(timeout=None if deadline is None else max(deadline - time.monotonic(), 0))
+                taken += 1
+            except queue.Empty:
+                item = self._flush
+            if isinstance(item, str):
+                batch.append(item)
+                deadline = deadline or time.monotonic() + self.flush_interval
+                if len(batch) < self.max_batch:
+                    continue
+            if batch:
+                try:
+                    self.session.WriteMessageToReservationOutput(self.sandbox_id, "\n".join(batch))
+                except Exception:  # pylint: disable=broad-except
+                    self.failed += len(batch)
+            for _ in range(taken):
+                self._queue.task_done()
+            batch, taken, deadline = [], 0, None
+            if item is self._stop:
+                return
+
+
+class RateLimitFilter(logging.Filter):  # pylint: disable=too-many-instance-attributes,too-few-public-methods
+    """Logger filter that rate limits, or samples, repetitive log records.
+
+    Records are keyed by their call site (path and line number), so the filter never formats the message. Each call site
+    passes `burst` records per `interval` seconds, then one of every `sample` records, or none if sample is 0. The first
+    record passed in a new interval reports how many records of its call site were suppressed. Records above max_level are
+    never suppressed.
+
+    Add the filter to handlers, logger filters do not see records propagated from child loggers. The decision is stored on
+    the record per filter, so a filter shared by several handlers counts each record once, and filters with different
+    limits on different handlers each decide on their own.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        burst: int = LOG_RATE_LIMIT_BURST,
+        interval: float = LOG_RATE_LIMIT_INTERVAL,
+        sample: int = 0,
+        max_level: int = logging.INFO,
+        max_keys: int = LOG_RATE_LIMIT_MAX_KEYS,
+    ) -> None:
+        """Initialize empty call sites state.
+
+        :param burst: Number of records passed per call site per interval.
+        :param interval: Interval in seconds.
+        :param sample: Pass one of every `sample` records above the burst, 0 - suppress all records above the burst.
+        :param max_level: Highest rate limited level.
+        :param max_keys: Maximum number of tracked call sites, the state is reset when exceeded.
+        """
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self.sample = sample
+        self.max_level = max_level
+        self.max_keys = max_keys
+        self.suppressed = 0
+        self._sites: Dict[Tuple[str, int], List[Any]] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:  # noqa: A003
+        """Return True if the record should be logged."""
+        if record.levelno > self.max_level:
+            return True
+        decisions = record.__dict__.setdefault("rate_limit_passed", {})
+        passed = decisions.get(id(self))
+        if passed is None:
+            passed = decisions[id(self)] = self._pass(record)
+        return passed
+
+    def _pass(self, record: logging.LogRecord) -> bool:
+        """Count record of its call site and return True if it is within the rate limit or sampled."""
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            site = self._sites.get(key)
+            if site is None or now - site[0] >= self.interval:
+                if site is None and len(self._sites) >= self.max_keys:
+                    self._sites.clear()
+                suppressed = site[2] if site is not None else 0
+                self._sites[key] = [now, 1, 0]
+                if suppressed:
+                    record.msg = f"{record.msg} [{suppressed} similar records suppressed]"
+                return True
+            site[1] += 1
+            excess = site[1] - self.burst
+            if excess <= 0 or (self.sample and excess % self.sample == 0):
+                return True
+            site[2] += 1
+            self.suppressed += 1
+            return False
+
+
+class DeferredQueueHandler(QueueHandler):
+    """Queue handler that enqueues records as is, message formatting is left to the listener thread handlers.
+
+    Unlike QueueHandler, which formats the message before enqueueing it, the logging thread pays only the enqueue. Mutable
+    arguments changed right after the logging call may be logged with their new value.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """Return the record unchanged."""
+        return record
+
+
+def start_log_queue(logger: logging.Logger, *loggers: logging.Logger) -> QueueListener:
+    """Move the logger handlers behind a DeferredQueueHandler, served by a QueueListener thread, and return the listener.
+
+    :param logger: Logger whose handlers are moved to the listener.
+    :param loggers: More loggers, e.g. packages loggers, whose copies of the logger handlers are replaced by the queue handler.
+    """
+    handlers = [handler for handler in logger.handlers if not isinstance(handler, QueueHandler)]
+    queue_handler = DeferredQueueHandler(queue.SimpleQueue())
+    for target in (logger, *loggers):
+        for handler in handlers:
+            target.removeHandler(handler)
+        target.addHandler(queue_handler)
+    listener = QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+def stop_log_queue(listener: QueueListener, *loggers: logging.Logger) -> None:
+    """Log all queued records, stop the listener and move its handlers back to the loggers, see start_log_queue."""
+    listener.stop()
+    for target in loggers:
+        for handler in list(target.handlers):
+            if isinstance(handler, QueueHandler) and handler.queue is listener.queue:
+                target.removeHandler(handler)
+        for handler in listener.handlers:
+            target.addHandler(handler)
 
 
 def get_cs_session(cs_object: Union[ResourceCommandContext, Sandbox, CreateReservationResponseInfo]) -> CloudShellAPISession:
-    """Get CS session from context."""
+    """Get CS session from context.
+
+    Sessions for contexts are taken from cs_session_pool so one driver command logs in at most once, and log in again once
+    if an API call fails with an authentication error. When api_metrics is enabled the returned session records the
+    latency of all API calls. When admission control is enabled the returned session calls are admitted with interactive
+    priority.
+    """
     try:
-        return cs_object.automation_api
+        return admission.wrap(api_metrics.instrument(cs_object.automation_api))
     except AttributeError:
         pass
-    try:
-        return CloudShellSessionContext(cs_object).get_api()
-    except Exception:  # pylint: disable=broad-except
-        pass
-    return CloudShellAPISession(
-        cs_object.connectivity.server_address,
-        token_id=cs_object.connectivity.admin_auth_token,
-        domain=cs_object.reservation.domain,
+    connectivity = cs_object.connectivity
+    reservation = getattr(cs_object, "reservation", None) or getattr(cs_object, "remote_reservation", None)
+    cs_session = RelogSession(
+        cs_session_pool,
+        connectivity.server_address,
+        connectivity.admin_auth_token,
+        domain=getattr(reservation, "domain", None) or "Global",
+        scheme=getattr(connectivity, "cloudshell_api_scheme", None) or "http",
     )
+    return admission.wrap(api_metrics.instrument(cs_session))
 
 
 def get_reservation_id(cs_object: Union[CreateReservationResponseInfo, Sandbox, ResourceCommandContext]) -> str:
@@ -74,11 +761,35 @@ def get_reservation_id(cs_object: Union[CreateReservationResponseInfo, Sandbox,
     raise AttributeError(f"Could not get reservation ID from {cs_object}")
 
 
-def get_reservation_description(context_or_sandbox: Union[ResourceCommandContext, Sandbox]) -> ReservationDescriptionInfo:
-    """Get reservation description."""
+def get_reservation_description(
+    context_or_sandbox: Union[ResourceCommandContext, Sandbox], use_cache: bool = False
+) -> ReservationDescriptionInfo:
+    """Get reservation description.
+
+    :param context_or_sandbox: Context or sandbox of the reservation.
+    :param use_cache: True - return the cached snapshot if younger than reservation_cache.ttl, False - always fetch.
+    """
     reservation_id = get_reservation_id(context_or_sandbox)
     cs_session = get_cs_session(context_or_sandbox)
-    return cs_session.GetReservationDetails(reservation_id, disableCache=True).ReservationDescription
+    return reservation_cache.get(cs_session, reservation_id, use_cache=use_cache)
+
+
+def get_reservation_index(
+    context_or_sandbox: Union[ResourceCommandContext, Sandbox], use_cache: bool = False
+) -> ReservationIndex:
+    """Get index over reservation description.
+
+    :param context_or_sandbox: Context or sandbox of the reservation.
+    :param use_cache: True - index the cached snapshot if younger than reservation_cache.ttl, False - always fetch.
+    """
+    reservation_id = get_reservation_id(context_or_sandbox)
+    cs_session = get_cs_session(context_or_sandbox)
+    return reservation_cache.get_index(cs_session, reservation_id, use_cache=use_cache)
+
+
+def invalidate_reservation_description(context_or_sandbox: Union[ResourceCommandContext, Sandbox]) -> None:
+    """Drop the cached reservation description so the next read fetches it from the server."""
+    reservation_cache.invalidate(get_reservation_id(context_or_sandbox))
 
 
 def get_family_attribute(
@@ -88,16 +799,27 @@ def get_family_attribute(
 
     Supports 2nd gen shell namespace by pre-fixing family/model namespace.
     """
+    return get_family_attributes(context_or_sandbox, resource_name, [attribute])[attribute]
+
+
+def get_family_attributes(
+    context_or_sandbox: Union[ResourceCommandContext, Sandbox], resource_name: str, attributes: Iterable[str]
+) -> Dict[str, str]:
+    """Get values of resource attributes with a single GetResourceDetails call.
+
+    Supports 2nd gen shell namespace by pre-fixing family/model namespace.
+
+    :return: Dictionary {requested attribute name: value}.
+    """
+    attributes = list(attributes)
     cs_session = get_cs_session(context_or_sandbox)
     res_details = cs_session.GetResourceDetails(resource_name)
-    res_model = res_details.ResourceModelName
-    res_family = res_details.ResourceFamilyName
-
-    # check against all 3 possibilities
-    model_attribute = f"{res_model}.{attribute}"
-    family_attribute = f"{res_family}.{attribute}"
-    attribute_names = [attribute, model_attribute, family_attribute]
-    return [attr for attr in res_details.ResourceAttributes if attr.Name in attribute_names][0].Value
+    names = resource_attributes_resolver.update(res_details)
+    values = {attr.Name: attr.Value for attr in res_details.ResourceAttributes}
+    missing = [attribute for attribute in attributes if attribute not in names]
+    if missing:
+        raise KeyError(f"Attributes {missing} not found on resource {resource_name}")
+    return {attribute: values[names[attribute]] for attribute in attributes}
 
 
 def set_family_attribute(
@@ -107,16 +829,109 @@ def set_family_attribute(
 
     Supports 2nd gen shell namespace by pre-fixing family/model namespace.
     """
+    set_family_attributes(context_or_sandbox, resource_name, {attribute: value})
+
+
+def set_family_attributes(
+    context_or_sandbox: Union[ResourceCommandContext, Sandbox], resource_name: str, attributes: Dict[str, str]
+) -> None:
+    """Set values of resource attributes with a single SetAttributesValues call.
+
+    Supports 2nd gen shell namespace by pre-fixing family/model namespace. Attribute names are resolved from
+    resource_attributes_resolver so GetResourceDetails is called only for resources not seen before.
+
+    :param attributes: Dictionary {attribute name: value}.
+    """
+    if not attributes:
+        return
     cs_session = get_cs_session(context_or_sandbox)
-    res_details = cs_session.GetResourceDetails(resource_name)
-    res_model = res_details.ResourceModelName
-    res_family = res_details.ResourceFamilyName
+    names = resource_attributes_resolver.resolve(cs_session, resource_name, attributes)
+    api = _cloudshell_api()
+    names_values = [api.AttributeNameValue(names[attribute], value) for attribute, value in attributes.items()]
+    cs_session.SetAttributesValues([api.ResourceAttributesUpdateRequest(resource_name, names_values)])
+    invalidate_reservation_description(context_or_sandbox)
+
+
+class ResourceSpec(NamedTuple):
+    """Specification of a resource to add to cloudshell DB."""
+
+    model: str
+    full_name: str
+    address: str = "na"
+    attributes: Mapping[str, str] = EMPTY_ATTRIBUTES
+
+
+class AddResourcesReport(NamedTuple):
+    """Full names of resources created and of resources skipped because they already exist."""
+
+    created: List[str]
+    skipped: List[str]
+
+
+def _find_existing_resources(cs_session: CloudShellAPISession, specs: List[ResourceSpec]) -> Set[str]:
+    """Return the full names of the requested resources that already exist in cloudshell DB.
+
+    Resources are looked up with one FindResources call per model and root resource (e.g. chassis), that returns the root
+    and its sub resources of the model, so resources of the same model under other roots do not fill the results. If the
+    results are truncated, the query is repeated with a larger maxResults.
+    """
+    existing: Set[str] = set()
+    for (model, root), root_specs in _group_by(specs, lambda spec: (spec.model, spec.full_name.split("/")[0])).items():
+        max_results = FIND_RESOURCES_MAX_RESULTS
+        while True:
+            found = cs_session.FindResources(
+                resourceModel=model, resourceFullName=root, exactName=True, includeSubResources=True, maxResults=max_results
+            ).Resources
+            if len(found) < max_results:
+                break
+            max_results *= 4
+        names = {resource.FullName for resource in found}
+        existing.update(spec.full_name for spec in root_specs if spec.full_name in names)
+    return existing
+
+
+def add_resources_to_db(
+    context: ResourceCommandContext, specs: Iterable[ResourceSpec], update_existing: bool = False
+) -> AddResourcesReport:
+    """Add resources to cloudshell DB, skip resources that already exist.
+
+    Missing resources are created with a single CreateResources call and added to the reservation domain with a single
+    AddResourcesToDomain call. Attributes are written with one SetAttributesValues call per ATTRIBUTES_BATCH_SIZE
+    resources, attribute names are resolved once per model.
+
+    :param update_existing: True - write the attributes of existing resources too, e.g. to complete a previous run that
+        failed after the resources were created, False - do not touch existing resources.
+    """
+    specs = list({spec.full_name: spec for spec in specs}.values())
+    if not specs:
+        return AddResourcesReport([], [])
+    cs_session = get_cs_session(context)
+    existing = _find_existing_resources(cs_session, specs)
+    missing = [spec for spec in specs if spec.full_name not in existing]
+    report = AddResourcesReport(
+        [spec.full_name for spec in missing], [spec.full_name for spec in specs if spec.full_name in existing]
+    )
+    if not missing and not update_existing:
+        return report
+
+    api = _cloudshell_api()
+    if missing:
+        resources_info = [api.ResourceInfoDto("", spec.model, spec.full_name, spec.address, "", "", "") for spec in missing]
+        cs_session.CreateResources(resources_info)
+        if context.reservation.domain != "Global":
+            cs_session.AddResourcesToDomain(domainName=context.reservation.domain, resourcesNames=report.created)
 
-    model_attribute = f"{res_model}.{attribute}"
-    family_attribute = f"{res_family}.{attribute}"
-    attribute_names = [attribute, model_attribute, family_attribute]
-    actual_attribute = [attr for attr in res_details.ResourceAttributes if attr.Name in attribute_names][0].Name
-    cs_session.SetAttributeValue(resource_name, actual_attribute, value)
+    requests = []
+    for spec in specs if update_existing else missing:
+        if spec.attributes:
+            names = resource_attributes_resolver.resolve(cs_session, spec.full_name, spec.attributes, spec.model)
+            names_values = [api.AttributeNameValue(names[attribute], value) for attribute, value in spec.attributes.items()]
+            requests.append(api.ResourceAttributesUpdateRequest(spec.full_name, names_values))
+    for start in range(0, len(requests), ATTRIBUTES_BATCH_SIZE):
+        end = start + ATTRIBUTES_BATCH_SIZE
+        cs_session.SetAttributesValues(requests[start:end])
+    invalidate_reservation_description(context)
+    return report
 
 
 def add_resource_to_db(
@@ -127,95 +942,246 @@ def add_resource_to_db(
     **attributes: str,
 ) -> None:
     """Add resource to cloudshell DB if not already exist."""
-    cs_session = get_cs_session(context)
-    resources_w_requested_name = cs_session.FindResources(resourceFullName=resource_full_name).Resources
-    if len(resources_w_requested_name) > 0:
-        return
-    cs_session.CreateResource(resourceModel=resource_model, resourceName=resource_full_name, resourceAddress=resource_address)
-    if context.reservation.domain != "Global":
-        cs_session.AddResourcesToDomain(domainName=context.reservation.domain, resourcesNames=[resource_full_name])
-    for attribute, value in attributes.items():
-        set_family_attribute(context, resource_full_name, attribute, value)
+    add_resources_to_db(context, [ResourceSpec(resource_model, resource_full_name, resource_address, attributes)])
+
+
+class WaitReport(NamedTuple):
+    """Result of a successful wait."""
+
+    polls: int
+    elapsed: float
+
+
+def wait_intervals(deadline: float, interval: float, max_interval: float, backoff: float, jitter: float) -> Iterable[float]:
+    """Yield the delays to sleep before each poll, starting with 0 and ending with a poll at the deadline."""
+    yield 0
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        yield min(interval * random.uniform(1 - jitter, 1 + jitter), remaining)
+        interval = min(interval * backoff, max_interval)
+
+
+# pylint: disable=too-many-arguments
+def wait_until(
+    cs_session: CloudShellAPISession,
+    reservation_id: str,
+    predicate: Callable[[ReservationIndex], bool],
+    timeout: float = 4,
+    interval: float = WAIT_INITIAL_INTERVAL,
+    max_interval: float = WAIT_MAX_INTERVAL,
+    backoff: float = WAIT_BACKOFF,
+    jitter: float = WAIT_JITTER,
+    message: str = "Reservation condition not met",
+) -> WaitReport:
+    """Poll reservation details until predicate is True or timeout expires.
+
+    The interval between polls starts at `interval` and grows by `backoff` up to `max_interval`. Each interval is randomized
+    by +/- `jitter` fraction so concurrent waits do not poll the server in lockstep. The last poll is done at the deadline.
+    Polls are admitted with polling priority, behind interactive calls, when admission control is enabled.
+
+    :param cs_session: CloudShell session.
+    :param reservation_id: Reservation ID.
+    :param predicate: Function that gets the index of a fresh reservation snapshot and returns True when the wait is over.
+    :param timeout: Timeout in seconds, measured with monotonic clock.
+    :param message: Timeout error message, " after {timeout} seconds" is appended.
+    :raises TimeoutError: If predicate is not True before timeout.
+    """
+    cs_session = admission.wrap(api_metrics.instrument(cs_session), Priority.POLLING)
+    start = time.monotonic()
+    polls = 0
+    for delay in wait_intervals(start + timeout, interval, max_interval, backoff, jitter):
+        time.sleep(delay)
+        polls += 1
+        if predicate(reservation_cache.fetch_index(cs_session, reservation_id)):
+            return WaitReport(polls, time.monotonic() - start)
+    raise TimeoutError(f"{message} after {timeout} seconds")
+
+
+def reservation_condition(
+    resources_names: Optional[Iterable[str]] = None,
+    services_aliases: Optional[Iterable[str]] = None,
+    connectors_aliases: Optional[Iterable[str]] = None,
+    attributes: Optional[Dict[str, Dict[str, str]]] = None,
+) -> Tuple[Callable[[ReservationIndex], bool], str]:
+    """Return combined predicate over reservation index and its description for timeout messages.
+
+    See wait_for_reservation for parameters.
+    """
+    resources_names = list(resources_names or [])
+    services_aliases = list(services_aliases or [])
+    connectors_aliases = list(connectors_aliases or [])
+    attributes = attributes or {}
+
+    def predicate(index: ReservationIndex) -> bool:
+        if not index.has_resources(resources_names) or not index.has_services(services_aliases):
+            return False
+        if not index.has_connectors(connectors_aliases):
+            return False
+        return all(
+            index.get_service_attribute(alias, name) == value
+            for alias, values in attributes.items()
+            for name, value in values.items()
+        )
+
+    conditions = []
+    if resources_names:
+        conditions.append(f"Resources {resources_names} in reservation")
+    if services_aliases:
+        conditions.append(f"Services {services_aliases} in reservation")
+    if connectors_aliases:
+        conditions.append(f"Connectors {connectors_aliases} in reservation")
+    if attributes:
+        conditions.append(f"Services attributes {attributes} in reservation")
+    message = "Not all of: " + ", ".join(conditions)
+    return predicate, message
+
+
+def wait_for_reservation(
+    cs_session: CloudShellAPISession,
+    reservation_id: str,
+    resources_names: Optional[Iterable[str]] = None,
+    services_aliases: Optional[Iterable[str]] = None,
+    connectors_aliases: Optional[Iterable[str]] = None,
+    attributes: Optional[Dict[str, Dict[str, str]]] = None,
+    timeout: float = 4,
+    **kwargs: float,
+) -> WaitReport:
+    """Wait until all requested resources, services, connectors and service attribute values show in reservation details.
+
+    All conditions are checked on the same snapshot so each poll costs a single GetReservationDetails call.
+
+    :param attributes: Dictionary {service alias: {attribute name: expected value}}.
+    :param kwargs: Additional wait_until parameters (interval, max_interval, backoff, jitter).
+    """
+    predicate, message = reservation_condition(resources_names, services_aliases, connectors_aliases, attributes)
+    return wait_until(cs_session, reservation_id, predicate, timeout, message=message, **kwargs)
 
 
 def wait_for_resources(
-    cs_session: CloudShellAPISession, reservation_id: str, resources_names: Union[list, str], timeout: int = 4
-) -> None:
+    cs_session: CloudShellAPISession, reservation_id: str, resources_names: Union[list, str], timeout: float = 4
+) -> WaitReport:
     """Wait until all resources show in reservation details."""
     if isinstance(resources_names, str):
         resources_names = [resources_names]
-    for _ in range(timeout + 1):
-        all_resources = cs_session.GetReservationDetails(reservation_id).ReservationDescription.Resources
-        new_resources = [r for r in all_resources if r.Name in resources_names]
-        if len(new_resources) == len(resources_names):
-            return
-        time.sleep(1)
-    raise TimeoutError(f"Resources {resources_names} not in reservation after {timeout} seconds")
+    return wait_until(
+        cs_session,
+        reservation_id,
+        lambda index: index.has_resources(resources_names),
+        timeout,
+        message=f"Resources {resources_names} not in reservation",
+    )
 
 
 def wait_for_services(
-    cs_session: CloudShellAPISession, reservation_id: str, aliases: Union[list, str], timeout: int = 4
-) -> None:
+    cs_session: CloudShellAPISession, reservation_id: str, aliases: Union[list, str], timeout: float = 4
+) -> WaitReport:
     """Wait until all services show in reservation details."""
     if isinstance(aliases, str):
         aliases = [aliases]
-    for _ in range(timeout + 1):
-        all_services = cs_session.GetReservationDetails(reservation_id).ReservationDescription.Services
-        new_services = [s for s in all_services if s.Alias in aliases]
-        if len(new_services) == len(aliases):
-            return
-        time.sleep(1)
-    raise TimeoutError(f"Services {aliases} not in reservation after {timeout} seconds")
+    return wait_until(
+        cs_session,
+        reservation_id,
+        lambda index: index.has_services(aliases),
+        timeout,
+        message=f"Services {aliases} not in reservation",
+    )
 
 
 def wait_for_connectors(
-    cs_session: CloudShellAPISession, reservation_id: str, aliases: Union[list, str], timeout: int = 4
-) -> None:
+    cs_session: CloudShellAPISession, reservation_id: str, aliases: Union[list, str], timeout: float = 4
+) -> WaitReport:
     """Wait until all connectors show in reservation details."""
     if isinstance(aliases, str):
         aliases = [aliases]
-    for _ in range(timeout + 1):
-        all_connectors = cs_session.GetReservationDetails(reservation_id).ReservationDescription.Connectors
-        new_connectors = [c for c in all_connectors if c.Alias in aliases]
-        if len(new_connectors) == len(aliases):
-            return
-        time.sleep(1)
-    raise TimeoutError(f"Connectors {aliases} not in reservation after {timeout} seconds")
+    return wait_until(
+        cs_session,
+        reservation_id,
+        lambda index: index.has_connectors(aliases),
+        timeout,
+        message=f"Connectors {aliases} not in reservation",
+    )
 
 
-# pylint: disable=too-many-arguments
 def wait_for_attribute(
     cs_session: CloudShellAPISession,
     reservation_id: str,
     alias: str,
     attribute_name: str,
     attribute_value: str,
-    timeout: int = 4,
-) -> None:
-    """Wait until an attribute that was set is updated on the sandbox."""
-    for _ in range(timeout + 1):
-        all_services = cs_session.GetReservationDetails(reservation_id).ReservationDescription.Services
-        service = [s for s in all_services if s.Alias == alias][0]
-        current_attribute_value = [a.Value for a in service.Attributes if a.Name == attribute_name][0]
-        if current_attribute_value == attribute_value:
-            return
-        time.sleep(1)
+    timeout: float = 4,
+) -> WaitReport:
+    """Wait until an attribute that was set is updated on the sandbox.
+
+    :raises TimeoutError: If the attribute is not updated before timeout.
+    """
+    return wait_until(
+        cs_session,
+        reservation_id,
+        lambda index: index.get_service_attribute(alias, attribute_name) == attribute_value,
+        timeout,
+        message=f"Attribute {alias}.{attribute_name} not set to {attribute_value}",
+    )
 
 
 def get_resources_from_reservation(
-    context_or_sandbox: Union[ResourceCommandContext, Sandbox], *resource_models: str
-) -> List[ReservedResourceInfo]:
-    """Get all resources with the requested resource model names."""
-    resources = get_reservation_description(context_or_sandbox).Resources
-    return [r for r in resources if r.ResourceModelName in resource_models]
+    context_or_sandbox: Union[ResourceCommandContext, Sandbox],
+    *resource_models: str,
+    use_cache: bool = False,
+    compact: bool = False,
+) -> List[Union[ReservedResourceInfo, ResourceRecord]]:
+    """Get all resources with the requested resource model names.
+
+    :param compact: True - return compact ResourceRecord objects, False - return the API ReservedResourceInfo objects.
+    """
+    resources = get_reservation_index(context_or_sandbox, use_cache=use_cache).get_resources(*resource_models)
+    return [compact_resource(r) for r in resources] if compact else resources  # type: ignore[misc]
 
 
 def get_services_from_reservation(
-    context_or_sandbox: Union[ResourceCommandContext, Sandbox], *service_names: str
-) -> List[ServiceInstance]:
-    """Get all services with the requested service names."""
-    services = get_reservation_description(context_or_sandbox).Services
-    return [s for s in services if s.ServiceName in service_names]
+    context_or_sandbox: Union[ResourceCommandContext, Sandbox],
+    *service_names: str,
+    use_cache: bool = False,
+    compact: bool = False,
+) -> List[Union[ServiceInstance, ServiceRecord]]:
+    """Get all services with the requested service names.
+
+    :param compact: True - return compact ServiceRecord objects, False - return the API ServiceInstance objects.
+    """
+    services = get_reservation_index(context_or_sandbox, use_cache=use_cache).get_services(*service_names)
+    return [compact_service(s) for s in services] if compact else services  # type: ignore[misc]
+
+
+LOCATION_CLEANUP_PATTERN = re.compile(r"M|PG[0-9]+/|P")
+LOCATION_PATTERN = re.compile(r"^(?P<chassis>[^/]+)(?:/M(?P<module>[^/]*))?(?:/PG(?P<port_group>[^/]*))?/P(?P<port>[^/]*)$")
+
+
+class PortLocation(NamedTuple):
+    """Port location parsed from port full address."""
+
+    chassis: str
+    module: Optional[str]
+    port_group: Optional[str]
+    port: str
+
+    def __str__(self) -> str:
+        """Return location in get_location format ip/module/port."""
+        return "/".join(field for field in (self.chassis, self.module, self.port) if field is not None)
+
+
+@lru_cache(maxsize=LOCATION_CACHE_SIZE)
+def parse_location(full_address: str) -> PortLocation:
+    """Parse port full address in format ip/Mmodule[/PGgroup]/Pport into PortLocation, results are cached by address.
+
+    Fields are interned as the same chassis, modules and port numbers repeat across many ports.
+
+    :raises ValueError: If full address is not a port address.
+    """
+    match = LOCATION_PATTERN.match(full_address)
+    if not match:
+        raise ValueError(f"{full_address} is not a port full address")
+    return PortLocation(*(field and sys.intern(field) for field in match.groups()))
 
 
 def get_location(port_resource: ReservedResourceInfo) -> str:
@@ -223,4 +1189,90 @@ def get_location(port_resource: ReservedResourceInfo) -> str:
 
     :param port_resource: Port resource object.
     """
-    return re.sub(r"M|PG[0-9]+/|P", "", port_resource.FullAddress)
+    return LOCATION_CLEANUP_PATTERN.sub("", port_resource.FullAddress)
+
+
+def get_locations(port_resources: Iterable[ReservedResourceInfo]) -> List[PortLocation]:
+    """Parse locations of all port resources.
+
+    :param port_resources: Port resources objects.
+    """
+    return [parse_location(port.FullAddress) for port in port_resources]
+
+
+def get_locations_index(port_resources: Iterable[ReservedResourceInfo]) -> Dict[str, ReservedResourceInfo]:
+    """Return reverse index from port location in get_location format (ip/module/port) to port resource.
+
+    Used to map TG statistics, reported by location, back to CloudShell ports.
+
+    :param port_resources: Port resources objects.
+    """
+    return {str(parse_location(port.FullAddress)): port for port in port_resources}
+
+
+class ResourceRecord(NamedTuple):
+    """Compact, immutable record of reserved resource."""
+
+    name: str
+    model: str
+    family: str
+    full_address: str
+    location: Optional[PortLocation]
+    attributes: Mapping[str, str]
+
+
+class ServiceRecord(NamedTuple):
+    """Compact, immutable record of reserved service."""
+
+    alias: str
+    name: str
+    attributes: Mapping[str, str]
+
+
+class CompactReservation(NamedTuple):
+    """Compact records of all reservation resources and services."""
+
+    resources: Tuple[ResourceRecord, ...]
+    services: Tuple[ServiceRecord, ...]
+
+
+def _intern_attributes(attributes: Iterable[Any]) -> Mapping[str, str]:
+    """Return attributes as a dictionary with interned names and values, shared empty mapping if there are no attributes."""
+    interned = {sys.intern(a.Name): sys.intern(a.Value or "") for a in attributes}
+    return interned or EMPTY_ATTRIBUTES
+
+
+def _compact_location(full_address: str) -> Optional[PortLocation]:
+    """Return the cached port location, None if the address is not a port address."""
+    try:
+        return parse_location(full_address)
+    except ValueError:
+        return None
+
+
+def compact_resource(resource: ReservedResourceInfo, attributes: Iterable[Any] = ()) -> ResourceRecord:
+    """Convert reserved resource into compact record.
+
+    Reservation details do not return resources attributes, pass ResourceDetails.ResourceAttributes to include them.
+    """
+    return ResourceRecord(
+        resource.Name,
+        sys.intern(resource.ResourceModelName),
+        sys.intern(resource.ResourceFamilyName),
+        resource.FullAddress,
+        _compact_location(resource.FullAddress),
+        _intern_attributes(attributes),
+    )
+
+
+def compact_service(service: ServiceInstance) -> ServiceRecord:
+    """Convert service instance into compact record."""
+    return ServiceRecord(service.Alias, sys.intern(service.ServiceName), _intern_attributes(service.Attributes))
+
+
+def compact_reservation(description: ReservationDescriptionInfo) -> CompactReservation:
+    """Convert reservation description into compact records, so the API objects can be released."""
+    return CompactReservation(
+        tuple(compact_resource(r) for r in description.Resources),
+        tuple(compact_service(s) for s in description.Services),
+    )
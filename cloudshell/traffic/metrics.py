@@ -0,0 +1,263 @@
+"""
+Optional instrumentation of CloudShell API calls and REST requests made by cloudshell traffic helpers.
+
+Instrumentation is disabled by default, enable it with api_metrics.enable() or by setting the environment variable
+CLOUDSHELL_TRAFFIC_METRICS=1. When disabled, CloudShell sessions are not wrapped at all and REST requests pay a single
+attribute check.
+"""
+import logging
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, float("inf"))
+
+METRICS_ENV_VAR = "CLOUDSHELL_TRAFFIC_METRICS"
+PROMETHEUS_PREFIX = "cloudshell_traffic_api"
+
+
+class MethodStats:
+    """Count, errors, latency histogram, request bytes and response bytes of a single method.
+
+    Request bytes of CloudShell API calls are the length of their string arguments. Response bytes are known only for REST
+    requests (Content-Length), CloudShell API sessions do not expose the size of their responses.
+    """
+
+    __slots__ = ("count", "errors", "seconds", "max_seconds", "request_bytes", "response_bytes", "buckets")
+
+    def __init__(self) -> None:
+        """Initialize empty stats."""
+        self.count = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+
+    def add(self, seconds: float, request_bytes: int, response_bytes: int, error: bool) -> None:
+        """Add single call."""
+        self.count += 1
+        self.errors += error
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.request_bytes += request_bytes
+        self.response_bytes += response_bytes
+        self.buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+    def quantile(self, quantile: float) -> float:
+        """Return the upper bound of the histogram bucket of the requested quantile, capped by the max latency."""
+        rank = quantile * self.count
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.buckets):
+            cumulative += count
+            if cumulative >= rank:
+                return min(bound, self.max_seconds)
+        return self.max_seconds
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return stats as dictionary, histogram buckets are cumulative as in Prometheus."""
+        cumulative, buckets = 0, {}
+        for bound, count in zip(LATENCY_BUCKETS, self.buckets):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "seconds": self.seconds,
+            "max_seconds": self.max_seconds,
+            "request_bytes": self.request_bytes,
+            "response_bytes": self.response_bytes,
+            "buckets": buckets,
+        }
+
+
+class ApiMetrics:
+    """Thread safe registry of per method stats."""
+
+    def __init__(self, enabled: bool = False) -> None:
+        """Initialize empty registry."""
+        self.enabled = enabled
+        self._methods: Dict[str, MethodStats] = {}
+        self._lock = threading.Lock()
+
+    def enable(self) -> None:
+        """Start recording."""
+        self.enabled = True
+
+    def disable(self) -> None:
+        """Stop recording, recorded stats are kept."""
+        self.enabled = False
+
+    def reset(self) -> None:
+        """Drop all recorded stats."""
+        with self._lock:
+            self._methods.clear()
+
+    def record(
+        self, method: str, seconds: float, request_bytes: int = 0, response_bytes: int = 0, error: bool = False
+    ) -> None:
+        """Record single call of method."""
+        with self._lock:
+            stats = self._methods.get(method)
+            if stats is None:
+                stats = self._methods[method] = MethodStats()
+            stats.add(seconds, request_bytes, response_bytes, error)
+
+    def call(self, method: str, func: Callable, *args: Any, **kwargs: Any) -> Any:
+        """Call function and record its latency under the method name.
+
+        Request bytes are estimated from the length of string and bytes arguments, the response size is not known.
+        """
+        request_bytes = sum(len(arg) for arg in (*args, *kwargs.values()) if isinstance(arg, (str, bytes)))
+        start = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            self.record(method, time.perf_counter() - start, request_bytes, error=True)
+            raise
+        self.record(method, time.perf_counter() - start, request_bytes)
+        return result
+
+    def instrument(self, cs_session: Any) -> Any:
+        """Return CloudShell session that records all API calls, or the session itself if instrumentation is disabled.
+
+        Sessions already instrumented, directly or under another proxy such as admission.AdmittedSession, are returned as is.
+        """
+        if not self.enabled or isinstance(cs_session, InstrumentedSession):
+            return cs_session
+        if isinstance(getattr(cs_session, "wrapped", None), InstrumentedSession):
+            return cs_session
+        return InstrumentedSession(cs_session, self)
+
+    def to_dict(self) -> Dict[str, Dict[str, Any]]:
+        """Return {method: stats dictionary}."""
+        with self._lock:
+            return {method: stats.to_dict() for method, stats in sorted(self._methods.items())}
+
+    def to_prometheus(self) -> str:
+        """Return stats in Prometheus text exposition format."""
+        lines: List[str] = [
+            f"# HELP {PROMETHEUS_PREFIX}_call_seconds Latency of CloudShell API calls and REST requests.",
+            f"# TYPE {PROMETHEUS_PREFIX}_call_seconds histogram",
+        ]
+        counters: List[Tuple[str, str, int]] = []
+        for method, stats in self.to_dict().items():
+            label = f'method="{method}"'
+            for bound, count in stats["buckets"].items():
+                le = "+Inf" if bound == "inf" else bound
+                lines.append(f'{PROMETHEUS_PREFIX}_call_seconds_bucket{{{label},le="{le}"}} {count}')
+            lines.append(f"{PROMETHEUS_PREFIX}_call_seconds_sum{{{label}}} {stats['seconds']}")
+            lines.append(f"{PROMETHEUS_PREFIX}_call_seconds_count{{{label}}} {stats['count']}")
+            counters.append(("errors_total", label, stats["errors"]))
+            counters.append(("request_bytes_total", label, stats["request_bytes"]))
+            counters.append(("response_bytes_total", label, stats["response_bytes"]))
+        for name, help_text in (
+            ("errors_total", "Failed calls."),
+            ("request_bytes_total", "Request bytes, string arguments of CloudShell API calls."),
+            ("response_bytes_total", "Response bytes, REST requests only."),
+        ):
+            lines.append(f"# HELP {PROMETHEUS_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{name} counter")
+            lines.extend(
+                f"{PROMETHEUS_PREFIX}_{name}{{{label}}} {value}" for counter, label, value in counters if counter == name
+            )
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str) -> None:
+        """Write stats to Prometheus text file.
+
+        The file is replaced atomically so node exporter textfile collector never reads a partial file.
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        with tempfile.NamedTemporaryFile("w", dir=directory, suffix=".tmp", delete=False) as temp_file:
+            temp_file.write(self.to_prometheus())
+        os.replace(temp_file.name, path)
+
+    def log_summary(self, logger: logging.Logger, level: int = logging.INFO) -> None:
+        """Log one line per method, slowest total time first.
+
+        Lines are logged after the lock is released, as logging to reservation output may itself make recorded API calls.
+        """
+        with self._lock:
+            lines = [
+                (
+                    method,
+                    stats.count,
+                    stats.errors,
+                    stats.seconds,
+                    stats.seconds / stats.count,
+                    stats.quantile(0.5),
+                    stats.quantile(0.95),
+                    stats.max_seconds,
+                    stats.request_bytes,
+                    stats.response_bytes,
+                )
+                for method, stats in sorted(self._methods.items(), key=lambda item: item[1].seconds, reverse=True)
+            ]
+        for line in lines:
+            logger.log(
+                level,
+                "%s: count=%d errors=%d total=%.3fs mean=%.3fs p50<=%.3fs p95<=%.3fs max=%.3fs request=%dB response=%dB",
+                *line,
+            )
+
+
+class SessionProxy:
+    """Base proxy of CloudShell API session, subclasses implement _call to add behavior to every API method call.
+
+    API methods are the CamelCase callables of the session, all other attributes are read from, and set on, the wrapped
+    session. Subclasses keep their own state in __dict__ so it is not set on the wrapped session.
+    """
+
+    def __init__(self, cs_session: Any) -> None:
+        """Wrap session."""
+        self.__dict__["_session"] = cs_session
+
+    def __getattr__(self, name: str) -> Any:
+        """Return session attribute, API methods are wrapped with _call."""
+        attr = getattr(self._session, name)
+        if not name[:1].isupper() or not callable(attr):
+            return attr
+
+        def proxied(*args: Any, **kwargs: Any) -> Any:
+            return self._call(name, attr, *args, **kwargs)
+
+        return proxied
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        """Set attribute on wrapped session."""
+        setattr(self._session, name, value)
+
+    @property
+    def wrapped(self) -> Any:
+        """Return the wrapped session."""
+        return self._session
+
+    def _call(self, name: str, method: Callable, *args: Any, **kwargs: Any) -> Any:
+        """Call API method of the wrapped session."""
+        return method(*args, **kwargs)
+
+
+class InstrumentedSession(SessionProxy):  # pylint: disable=too-few-public-methods
+    """Proxy of CloudShell API session that records the latency of every API method call."""
+
+    def __init__(self, cs_session: Any, metrics: ApiMetrics) -> None:
+        """Wrap session."""
+        super().__init__(cs_session)
+        self.__dict__["_metrics"] = metrics
+
+    def _call(self, name: str, method: Callable, *args: Any, **kwargs: Any) -> Any:
+        """Call API method and record its latency."""
+        return self._metrics.call(name, method, *args, **kwargs)
+
+
+def _enabled_from_env(env: Optional[str]) -> bool:
+    """Return True if environment variable value turns instrumentation on."""
+    return (env or "").lower() in ("1", "true", "yes", "on")
+
+
+api_metrics = ApiMetrics(enabled=_enabled_from_env(os.environ.get(METRICS_ENV_VAR)))
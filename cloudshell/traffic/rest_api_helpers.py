@@ -1,16 +1,109 @@
 """
 Helpers wrapping some Cloudshell REST API calls that has no official python API.
 """
+from __future__ import annotations
+
 import json
 import logging
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatch
+from functools import lru_cache
 from io import StringIO
-from json import JSONDecodeError
-from typing import Union
+from typing import IO, TYPE_CHECKING, Any, Callable, Dict, Iterable, Iterator, NamedTuple, Optional, Tuple, TypeVar, Union
+
+from .admission import Priority, admission
+from .metrics import api_metrics
+
+if TYPE_CHECKING:
+    from requests import Response, Session
+
+try:
+    import orjson
+
+    def json_loads(data: bytes) -> Any:
+        """Parse JSON with orjson."""
+        return orjson.loads(data)  # pylint: disable=no-member
+
+except ImportError:
+
+    def json_loads(data: bytes) -> Any:
+        """Parse JSON with standard json module."""
+        return json.loads(data.decode("utf-8"))
+
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+REST_POOL_SIZE = 16
+REST_CONNECT_TIMEOUT = 10
+REST_READ_TIMEOUT = 300
+REST_RETRIES = 3
+REST_BACKOFF_FACTOR = 0.5
+REST_RETRY_STATUSES = (502, 503, 504)
+REST_LOGIN_CHECK_INTERVAL = 60
+
+ATTACHMENTS_MAX_WORKERS = 8
+ATTACHMENTS_REGISTRY_SIZE = 16
+
+T = TypeVar("T")
 
-from requests import Response, Session
-from urllib3 import disable_warnings
 
-disable_warnings()
+def iter_chunks(
+    source: Union[str, bytes, IO, Iterable[Union[str, bytes]]], chunk_size: int = STREAM_CHUNK_SIZE
+) -> Iterator[bytes]:
+    """Yield bytes chunks of about chunk_size from a string, a file-like object or an iterable of string/bytes chunks.
+
+    Small chunks are coalesced so the upload is not sent as a flood of tiny writes.
+    """
+    if isinstance(source, (str, bytes)):
+        source = [source]
+    elif hasattr(source, "read"):
+        source = _iter_file(source, chunk_size)  # type: ignore[arg-type]
+    buffer = bytearray()
+    for chunk in source:
+        buffer += chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+        if len(buffer) >= chunk_size:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+def _iter_file(file_obj: IO, chunk_size: int) -> Iterator[Union[str, bytes]]:
+    """Yield chunks read from file-like object until EOF."""
+    while True:
+        chunk = file_obj.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def gzip_chunks(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Compress bytes chunks on the fly into gzip format."""
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def _multipart_stream(boundary: str, data: dict, field: str, file_name: str, chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Yield multipart/form-data body with form fields followed by one streamed file field."""
+    for name, value in data.items():
+        yield f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode("utf-8")
+    yield (
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{file_name}"\r\n'
+        f"Content-Type: application/octet-stream\r\n\r\n"
+    ).encode("utf-8")
+    for chunk in chunks:
+        if chunk:
+            yield chunk
+    yield f"\r\n--{boundary}--\r\n".encode("utf-8")
 
 
 class RestClientException(Exception):
@@ -21,14 +114,81 @@ class RestClientUnauthorizedException(RestClientException):
     """Unauthorized access exception."""
 
 
+class RestResponse(NamedTuple):
+    """Validated response with its body parsed at most once."""
+
+    response: Response
+    content: Any
+    is_json: bool
+
+
+def is_binary(response: Response) -> bool:
+    """Return True if the response content type is not JSON and not text, so there is no point trying to parse it."""
+    content_type = response.headers.get("Content-Type", "").lower()
+    return bool(content_type) and "json" not in content_type and not content_type.startswith("text/")
+
+
+class BulkResult(NamedTuple):
+    """Per file results and errors of bulk attachments operation."""
+
+    results: Dict[str, Any]
+    errors: Dict[str, Exception]
+
+
+@lru_cache(maxsize=None)
+def _disable_warnings() -> None:
+    """Disable urllib3 insecure request warnings, once, as all requests are sent with verify=False."""
+    from urllib3 import disable_warnings  # pylint: disable=import-outside-toplevel
+
+    disable_warnings()
+
+
+def _http_session(pool_size: int, retries: int, backoff_factor: float) -> Session:
+    """Return requests session with connections pool and retries.
+
+    requests and urllib3 are imported here, on first client creation, as they are a large part of the package import time.
+    """
+    # pylint: disable=import-outside-toplevel
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    _disable_warnings()
+    session = requests.Session()
+    retry = Retry(total=retries, backoff_factor=backoff_factor, status_forcelist=REST_RETRY_STATUSES, raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
 class RestJsonClient:
     """CloudShell REST client."""
 
-    def __init__(self, host: str, use_https: bool = True) -> None:
-        """Init REST session."""
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        host: str,
+        use_https: bool = True,
+        pool_size: int = REST_POOL_SIZE,
+        timeout: Tuple[float, float] = (REST_CONNECT_TIMEOUT, REST_READ_TIMEOUT),
+        retries: int = REST_RETRIES,
+        backoff_factor: float = REST_BACKOFF_FACTOR,
+        priority: Priority = Priority.INTERACTIVE,
+    ) -> None:
+        """Init REST session.
+
+        :param pool_size: Maximum number of kept-alive connections to the host.
+        :param timeout: (connect timeout, read timeout) in seconds.
+        :param retries: Number of retries, with exponential backoff, of idempotent requests (GET, PUT, DELETE...) on
+            connection errors and on 502/503/504 responses. POST requests are never retried.
+        :param priority: Admission priority of the client requests when admission control is enabled.
+        """
         self._host = host
         self._use_https = use_https
-        self.session = Session()
+        self.timeout = timeout
+        self.priority = priority
+        self.session = _http_session(pool_size, retries, backoff_factor)
 
     def _build_url(self, uri: str) -> str:
         """Build full URI from relative URI."""
@@ -43,60 +203,124 @@ class RestJsonClient:
             url = uri
         return url
 
-    def _valid(self, response: Response) -> Response:
-        """Validate response."""
+    def _send(self, method: str, uri: str, **kwargs: Any) -> Response:
+        """Send request, admitted by admission control if enabled.
+
+        Streamed responses hold the admission only until the response headers are received.
+        """
+        url = self._build_url(uri)
+        if not admission.enabled:
+            return self._request(method, url, **kwargs)
+        with admission.admit(self.priority):
+            return self._request(method, url, **kwargs)
+
+    def _request(self, method: str, url: str, **kwargs: Any) -> Response:
+        """Send request, record its latency and response size in api_metrics if enabled."""
+        if not api_metrics.enabled:
+            return self.session.request(method, url, verify=False, timeout=self.timeout, **kwargs)
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, url, verify=False, timeout=self.timeout, **kwargs)
+        except Exception:
+            api_metrics.record(f"REST {method}", time.perf_counter() - start, error=True)
+            raise
+        size = int(response.headers.get("Content-Length", 0))
+        api_metrics.record(
+            f"REST {method}", time.perf_counter() - start, response_bytes=size, error=response.status_code >= 400
+        )
+        return response
+
+    def _valid(self, response: Response) -> RestResponse:
+        """Validate response and return it with its content parsed as JSON, or raw bytes if it is not JSON."""
         if response.status_code in [200, 201, 204]:
+            if is_binary(response) or not response.content:
+                return RestResponse(response, response.content, False)
             try:
-                content = json.loads(response.content.decode("utf-8"))
-            except JSONDecodeError:
-                content = response.content.decode("utf-8")
+                content = json_loads(response.content)
+            except ValueError:
+                return RestResponse(response, response.content, False)
             if isinstance(content, dict) and not content["Success"]:
                 raise RestClientException(self.__class__.__name__, f"fRequest failed: {content['ErrorMessage']}")
-            return response
+            return RestResponse(response, content, True)
         if response.status_code in [401]:
             raise RestClientUnauthorizedException(self.__class__.__name__, "Incorrect login or password")
         raise RestClientException(self.__class__.__name__, f"fRequest failed: {response.status_code}, {response.text}")
 
     def request_put(self, uri: str, data: dict) -> str:
         """PUT."""
-        response = self.session.put(self._build_url(uri), data, verify=False)
-        return self._valid(response).json()
+        response = self._send("PUT", uri, data=data)
+        return self._valid(response).content
 
     def request_post(self, uri: str, data: dict) -> Union[bytes, dict]:
         """POST."""
-        response = self.session.post(self._build_url(uri), json=data, verify=False)
-        try:
-            return self._valid(response).json()
-        except JSONDecodeError:
-            return self._valid(response).content
+        response = self._send("POST", uri, json=data)
+        return self._valid(response).content
 
     def request_post_files(self, uri: str, data: dict, files: dict) -> dict:
         """POST files."""
-        response = self.session.post(self._build_url(uri), data=data, files=files, verify=False)
-        return self._valid(response).json()
+        response = self._send("POST", uri, data=data, files=files)
+        return self._valid(response).content
+
+    # pylint: disable=too-many-arguments
+    def request_post_stream(self, uri: str, data: dict, field: str, file_name: str, chunks: Iterable[bytes]) -> dict:
+        """POST file as streamed multipart body (chunked transfer encoding) so the file is never held in memory."""
+        boundary = os.urandom(16).hex()
+        headers = {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+        body = _multipart_stream(boundary, data, field, file_name, chunks)
+        response = self._send("POST", uri, data=body, headers=headers)
+        return self._valid(response).content
+
+    def request_post_raw(self, uri: str, data: dict, headers: Optional[dict] = None) -> Response:
+        """POST and return the response with its body not read yet, so binary content can be streamed.
+
+        All success (2xx) responses are returned unread, whatever their content type, and 416 (range not satisfiable) is
+        returned for the caller to handle. Other responses are validated, which raises.
+        """
+        response = self._send("POST", uri, json=data, headers=headers, stream=True)
+        if 200 <= response.status_code < 300 or response.status_code == 416:
+            return response
+        return self._valid(response).response
 
     def request_get(self, uri: str) -> Response:
         """GET."""
-        response = self.session.get(self._build_url(uri), verify=False)
-        return self._valid(response)
+        response = self._send("GET", uri)
+        return self._valid(response).response
+
+    def request_get_json(self, uri: str) -> Any:
+        """GET and return parsed JSON content, or raw bytes if the content is not JSON."""
+        response = self._send("GET", uri)
+        return self._valid(response).content
 
     def request_delete(self, uri: str) -> bytes:
         """DELETE."""
-        response = self.session.delete(self._build_url(uri), verify=False)
+        response = self._send("DELETE", uri)
         return self._valid(response).content
 
 
 class SandboxAttachments:
     """Cloudshell REST API wrappers to manage sandbox attachments."""
 
-    def __init__(self, host: str, token: str, logger: logging.Logger) -> None:
-        """Initialize cloudshell REST client."""
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        host: str,
+        token: str,
+        logger: logging.Logger,
+        use_https: bool = False,
+        pool_size: int = REST_POOL_SIZE,
+        timeout: Tuple[float, float] = (REST_CONNECT_TIMEOUT, REST_READ_TIMEOUT),
+        retries: int = REST_RETRIES,
+        backoff_factor: float = REST_BACKOFF_FACTOR,
+    ) -> None:
+        """Initialize cloudshell REST client, see RestJsonClient for the connection parameters."""
         self.host = host
         if ":" not in self.host:
             self.host += ":9000"
-        self._logger = logger
+        self.logger = logger
         self._token = token
-        self.__rest_client = RestJsonClient(self.host, False)
+        self.__rest_client = RestJsonClient(self.host, use_https, pool_size, timeout, retries, backoff_factor)
+        self.logged_in = False
+        self._last_authorized = 0.0
 
     def login(self) -> None:
         """Login to cloudshell."""
@@ -104,27 +328,231 @@ class SandboxAttachments:
         json_data = {"token": self._token}
         result = self.__rest_client.request_put(uri, json_data).replace('"', "")
         self.__rest_client.session.headers.update(authorization=f"Basic {result}")
+        self.logged_in = True
+        self._last_authorized = time.monotonic()
+
+    def _call(self, request: Callable[[], T]) -> T:
+        """Run request, login again and retry once if the authorization expired."""
+        try:
+            result = request()
+        except RestClientUnauthorizedException:
+            self.logger.debug("REST authorization expired, login again")
+            self.login()
+            result = request()
+        self._last_authorized = time.monotonic()
+        return result
+
+    def _check_login(self) -> None:
+        """Login if not logged in or if the authorization was not used for REST_LOGIN_CHECK_INTERVAL seconds.
+
+        Login is a single small request, cheaper than any authorized request that could verify the authorization.
+        """
+        if not self.logged_in or time.monotonic() - self._last_authorized > REST_LOGIN_CHECK_INTERVAL:
+            self.login()
 
     def attach_new_file(self, reservation_id: str, file_data: Union[str, StringIO], file_name: str) -> None:
         """Attach file to reservation."""
-        file_to_upload = {"QualiPackage": file_data}
         data = {"reservationId": reservation_id, "saveFileAs": file_name, "overwriteIfExists": "true"}
-        self.__rest_client.request_post_files("API/Package/AttachFileToReservation", data=data, files=file_to_upload)
+
+        def request() -> dict:
+            if hasattr(file_data, "seek"):
+                file_data.seek(0)  # type: ignore[union-attr]
+            file_to_upload = {"QualiPackage": file_data}
+            return self.__rest_client.request_post_files(
+                "API/Package/AttachFileToReservation", data=data, files=file_to_upload
+            )
+
+        self._call(request)
+
+    def attach_new_file_stream(
+        self, reservation_id: str, file_data: Union[str, bytes, IO, Iterable[Union[str, bytes]]], file_name: str
+    ) -> None:
+        """Attach file to reservation, streaming its content from a file-like object or an iterable of chunks.
+
+        Seekable file objects are rewound and uploaded again if the authorization expired. Other streams can not be replayed,
+        so the login is refreshed before the upload if the authorization was not used recently.
+        """
+        data = {"reservationId": reservation_id, "saveFileAs": file_name, "overwriteIfExists": "true"}
+
+        def request() -> dict:
+            return self.__rest_client.request_post_stream(
+                "API/Package/AttachFileToReservation", data, "QualiPackage", file_name, iter_chunks(file_data)
+            )
+
+        if hasattr(file_data, "seek") and file_data.seekable():  # type: ignore[union-attr]
+            position = file_data.tell()  # type: ignore[union-attr]
+
+            def replay() -> dict:
+                file_data.seek(position)  # type: ignore[union-attr]
+                return request()
+
+            self._call(replay)
+        else:
+            self._check_login()
+            request()
 
     def get_attached_files(self, reservation_id: str) -> list:
         """Get all attached file names from reservation."""
         uri = f"API/Package/GetReservationAttachmentsDetails/{reservation_id}"
-        result = self.__rest_client.request_get(uri).json()
+        result = self._call(lambda: self.__rest_client.request_get_json(uri))
         return result["AllAttachments"]
 
     def get_attached_file(self, reservation_id: str, file_name: str) -> bytes:
         """Get attached file content from reservation."""
         uri = f"API/Package/GetReservationAttachment/{reservation_id}"
         data = {"reservationId": reservation_id, "FileName": file_name, "SaveToFolderPath": r"na"}
-        return self.__rest_client.request_post(uri, data)  # type: ignore[return-value]
+        return self._call(lambda: self.__rest_client.request_post(uri, data))  # type: ignore[return-value]
+
+    # pylint: disable=too-many-arguments,too-many-locals
+    def download_attached_file(
+        self,
+        reservation_id: str,
+        file_name: str,
+        target: Union[str, os.PathLike, IO[bytes]],
+        byte_range: Optional[Tuple[int, Optional[int]]] = None,
+        resume: bool = False,
+        progress: Optional[Callable[[int, Optional[int]], None]] = None,
+        chunk_size: int = STREAM_CHUNK_SIZE,
+    ) -> int:
+        """Download attached file from reservation in chunks, so memory does not grow with the file size.
 
-    def remove_attached_files(self, reservation_id: str) -> None:
-        """Remove all attached files from a sandbox."""
-        for file_name in self.get_attached_files(reservation_id):
-            file_to_delete = {"reservationId": reservation_id, "FileName": file_name}
-            self.__rest_client.request_post("API/Package/DeleteFileFromReservation", data=file_to_delete)
+        If the server ignores the Range header the requested range is cut on the client side.
+
+        :param target: Path or writable binary file object.
+        :param byte_range: (first byte, last byte or None for end of file) to download only part of the file.
+        :param resume: If target is an existing path, download only the missing tail and append it.
+        :param progress: Callback called after each chunk with (bytes written, total bytes or None if unknown).
+        :return: Number of bytes written in this call.
+        """
+        start, end = byte_range or (0, None)
+        if resume and isinstance(target, (str, os.PathLike)) and os.path.exists(target):
+            start = os.path.getsize(target)
+        headers = {"Range": f"bytes={start}-{'' if end is None else end}"} if start or end is not None else None
+        uri = f"API/Package/GetReservationAttachment/{reservation_id}"
+        data = {"reservationId": reservation_id, "FileName": file_name, "SaveToFolderPath": r"na"}
+        response = self._call(lambda: self.__rest_client.request_post_raw(uri, data, headers))
+        if response.status_code == 416:
+            response.close()
+            return 0
+        skip = start if response.status_code == 200 else 0
+        length = None if end is None else end - start + 1
+        content_length = response.headers.get("Content-Length")
+        total = length or (int(content_length) - skip if content_length else None)
+
+        file_obj: IO[bytes]
+        if isinstance(target, (str, os.PathLike)):
+            file_obj = open(target, "ab" if resume and start else "wb")  # pylint: disable=consider-using-with
+        else:
+            file_obj = target
+        written = 0
+        try:
+            for chunk in response.iter_content(chunk_size):
+                if skip:
+                    chunk, skip = chunk[skip:], max(skip - len(chunk), 0)
+                if length is not None:
+                    chunk = chunk[: length - written]
+                file_obj.write(chunk)
+                written += len(chunk)
+                if progress:
+                    progress(written, total)
+                if length is not None and written >= length:
+                    break
+        finally:
+            response.close()
+            if file_obj is not target:
+                file_obj.close()
+        return written
+
+    def remove_attached_file(self, reservation_id: str, file_name: str) -> None:
+        """Remove attached file from a sandbox."""
+        data = {"reservationId": reservation_id, "FileName": file_name}
+        self._call(lambda: self.__rest_client.request_post("API/Package/DeleteFileFromReservation", data=data))
+
+    def remove_attached_files(
+        self,
+        reservation_id: str,
+        name_filter: Optional[Union[str, Callable[[str], bool]]] = None,
+        max_workers: int = ATTACHMENTS_MAX_WORKERS,
+    ) -> BulkResult:
+        """Remove all, or all matching, attached files from a sandbox in parallel.
+
+        :param name_filter: Glob pattern or predicate on file name, None - all files.
+        """
+        file_names = self._filter(self.get_attached_files(reservation_id), name_filter)
+        return self._run_bulk(lambda file_name: self.remove_attached_file(reservation_id, file_name), file_names, max_workers)
+
+    def attach_files(
+        self, reservation_id: str, files: Dict[str, Union[str, StringIO]], max_workers: int = ATTACHMENTS_MAX_WORKERS
+    ) -> BulkResult:
+        """Attach files to reservation in parallel.
+
+        :param files: Dictionary {file name: file data}.
+        """
+        return self._run_bulk(
+            lambda file_name: self.attach_new_file(reservation_id, files[file_name], file_name), files, max_workers
+        )
+
+    def get_attached_files_content(
+        self,
+        reservation_id: str,
+        name_filter: Optional[Union[str, Callable[[str], bool]]] = None,
+        max_workers: int = ATTACHMENTS_MAX_WORKERS,
+    ) -> BulkResult:
+        """Get content of all, or all matching, attached files from reservation in parallel.
+
+        :param name_filter: Glob pattern or predicate on file name, None - all files.
+        :return: BulkResult with results {file name: content}.
+        """
+        file_names = self._filter(self.get_attached_files(reservation_id), name_filter)
+        return self._run_bulk(lambda file_name: self.get_attached_file(reservation_id, file_name), file_names, max_workers)
+
+    @staticmethod
+    def _filter(file_names: Iterable[str], name_filter: Optional[Union[str, Callable[[str], bool]]]) -> list:
+        """Return file names that match glob pattern or predicate."""
+        if name_filter is None:
+            return list(file_names)
+        if isinstance(name_filter, str):
+            pattern = name_filter
+            return [file_name for file_name in file_names if fnmatch(file_name, pattern)]
+        return [file_name for file_name in file_names if name_filter(file_name)]
+
+    def _run_bulk(self, operation: Callable[[str], Any], file_names: Iterable[str], max_workers: int) -> BulkResult:
+        """Run operation on all files on a bounded thread pool that shares the REST session, collect per file errors."""
+        result = BulkResult({}, {})
+
+        def run(file_name: str) -> None:
+            try:
+                result.results[file_name] = operation(file_name)
+            except Exception as error:  # pylint: disable=broad-except
+                self.logger.warning("Attachment operation on %s failed: %s", file_name, error)
+                result.errors[file_name] = error
+
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sandbox-attachments") as executor:
+            list(executor.map(run, file_names))
+        return result
+
+
+_attachments_registry: OrderedDict[Tuple[str, str], SandboxAttachments] = OrderedDict()
+_attachments_registry_lock = threading.Lock()
+
+
+def get_sandbox_attachments(host: str, token: str, logger: logging.Logger) -> SandboxAttachments:
+    """Return logged in SandboxAttachments for host and token from process wide registry.
+
+    Reusing the same object reuses its pooled keep-alive connections and authorization header, so repeated uploads do not
+    pay TCP setup and login on every call. The registry keeps the ATTACHMENTS_REGISTRY_SIZE most recently used objects, so
+    short-lived tokens do not accumulate. The returned object logs to the logger of the latest caller.
+    """
+    with _attachments_registry_lock:
+        attachments = _attachments_registry.get((host, token))
+        if attachments is None:
+            attachments = SandboxAttachments(host, token, logger)
+            _attachments_registry[(host, token)] = attachments
+            while len(_attachments_registry) > ATTACHMENTS_REGISTRY_SIZE:
+                _attachments_registry.popitem(last=False)
+        else:
+            _attachments_registry.move_to_end((host, token))
+            attachments.logger = logger
+    if not attachments.logged_in:
+        attachments.login()
+    return attachments
@@ -1,17 +1,56 @@
 """
 Base classes and helpers for traffic generators shells.
 """
+import csv
+import hashlib
+import importlib
+import io
+import json
 import logging
+import os
+import tempfile
+import threading
 import time
-from typing import Optional
+from array import array
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from logging.handlers import QueueHandler, QueueListener
+from types import ModuleType
+from typing import (
+    IO,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
 
-from cloudshell.logging.qs_logger import get_qs_logger
 from cloudshell.shell.core.context_utils import get_resource_name
 from cloudshell.shell.core.driver_context import CancellationContext, InitCommandContext, ResourceCommandContext
 from cloudshell.shell.core.resource_driver_interface import ResourceDriverInterface
 
-from .helpers import get_cs_session, get_reservation_id
-from .rest_api_helpers import SandboxAttachments
+from .helpers import (
+    RateLimitFilter,
+    ReservationOutputHandler,
+    get_cs_session,
+    get_family_attributes,
+    get_location,
+    get_reservation_id,
+    get_reservation_index,
+    start_log_queue,
+    stop_log_queue,
+)
+from .metrics import api_metrics
+from .rest_api_helpers import get_sandbox_attachments, gzip_chunks, iter_chunks
 
 TGN_CHASSIS_FAMILY = "CS_TrafficGeneratorChassis"
 TGN_CONTROLLER_FAMILY = "CS_TrafficGeneratorController"
@@ -30,8 +69,20 @@ STC_CONTROLLER_MODEL = "STC Controller Shell 2G"
 XENA_CHASSIS_MODEL = "Xena Chassis Shell 2G"
 XENA_CONTROLLER_MODEL = "Xena Controller Shell 2G"
 
+KEEP_ALIVE_TICK = 2
+KEEP_ALIVE_HEARTBEAT_INTERVAL = 60
 
-keep_alive_reservations = []
+TG_SESSIONS_MAX = 8
+
+TOPOLOGY_MAX_WORKERS = 8
+TOPOLOGY_CACHE_DIR = os.path.join(tempfile.gettempdir(), "cloudshell-traffic-topology")
+TOPOLOGY_CACHE_MAX_AGE = 3600
+
+STATS_CAPACITY = 3600
+STATS_SUMMARY_HEADER = ("Name", "Counter", "Last", "Delta", "Rate", "P50 Rate", "P95 Rate", "Max Rate")
+
+keep_alive_reservations: Set[str] = set()
+keep_alive_reservations_lock = threading.Lock()
 
 
 def is_blocking(blocking: str) -> bool:
@@ -44,63 +95,725 @@ def is_blocking(blocking: str) -> bool:
 
 def enqueue_keep_alive(context: ResourceCommandContext) -> None:
     """Enqueue TgControllerDriver.keep_alive command to run in the background."""
-    if context.reservation.reservation_id in keep_alive_reservations:
-        return
+    reservation_id = get_reservation_id(context)
+    with keep_alive_reservations_lock:
+        if reservation_id in keep_alive_reservations:
+            return
+        keep_alive_reservations.add(reservation_id)
     cs_session = get_cs_session(context)
     resource_name = get_resource_name(context=context)
-    cs_session.EnqueueCommand(
-        reservationId=get_reservation_id(context), targetName=resource_name, targetType="Service", commandName="keep_alive"
-    )
-    keep_alive_reservations.append(context.reservation.reservation_id)
+    try:
+        cs_session.EnqueueCommand(
+            reservationId=reservation_id, targetName=resource_name, targetType="Service", commandName="keep_alive"
+        )
+    except Exception:
+        release_keep_alive(reservation_id)
+        raise
+
+
+def release_keep_alive(reservation_id: str) -> None:
+    """Forget keep alive of reservation, so enqueue_keep_alive will enqueue a new keep_alive command for it."""
+    with keep_alive_reservations_lock:
+        keep_alive_reservations.discard(reservation_id)
+
+
+class KeepAliveManager:  # pylint: disable=too-many-instance-attributes
+    """Multiplex keep alive of all reservations served by a driver instance on a single scheduler thread.
+
+    Each keep_alive command registers its reservation and blocks on an event. Every tick the scheduler checks all
+    cancellation contexts, releases cancelled reservations and calls the heartbeat callback of reservations whose last
+    heartbeat is older than heartbeat_interval.
+    """
+
+    def __init__(
+        self,
+        heartbeat: Callable[[str], None],
+        tick: float = KEEP_ALIVE_TICK,
+        heartbeat_interval: float = KEEP_ALIVE_HEARTBEAT_INTERVAL,
+    ) -> None:
+        """Initialize manager, the scheduler thread is started on first registration.
+
+        :param heartbeat: Callback with reservation ID, used to ping the TG session of the reservation.
+        """
+        self.heartbeat = heartbeat
+        self.tick = tick
+        self.heartbeat_interval = heartbeat_interval
+        self.logger = logging.getLogger(__name__)
+        self._reservations: Dict[str, Tuple[CancellationContext, threading.Event, float]] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def __contains__(self, reservation_id: str) -> bool:
+        """Return True if reservation is registered."""
+        return reservation_id in self._reservations
+
+    def __len__(self) -> int:
+        """Return number of registered reservations."""
+        return len(self._reservations)
 
+    def register(self, reservation_id: str, cancellation_context: CancellationContext) -> threading.Event:
+        """Register reservation and return the event that is set when its keep alive ends."""
+        with self._lock:
+            if reservation_id in self._reservations:
+                return self._reservations[reservation_id][1]
+            released = threading.Event()
+            self._reservations[reservation_id] = (cancellation_context, released, time.monotonic())
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="keep-alive-scheduler", daemon=True)
+                self._thread.start()
+        return released
 
+    def unregister(self, reservation_id: str) -> None:
+        """Unregister reservation and release its keep alive command."""
+        with self._lock:
+            _, released, _ = self._reservations.pop(reservation_id, (None, None, None))
+        if released:
+            released.set()
+        release_keep_alive(reservation_id)
+
+    def stop(self) -> None:
+        """Unregister all reservations and stop the scheduler thread."""
+        for reservation_id in list(self._reservations):
+            self.unregister(reservation_id)
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def _run(self) -> None:
+        """Scheduler loop."""
+        while not self._stop.wait(self.tick):
+            with self._lock:
+                reservations = list(self._reservations.items())
+            for reservation_id, (cancellation_context, _, last_heartbeat) in reservations:
+                if cancellation_context.is_cancelled:
+                    self.unregister(reservation_id)
+                    continue
+                if time.monotonic() - last_heartbeat < self.heartbeat_interval:
+                    continue
+                try:
+                    self.heartbeat(reservation_id)
+                except Exception as error:  # pylint: disable=broad-except
+                    self.logger.warning("Keep alive heartbeat of reservation %s failed: %s", reservation_id, error)
+                with self._lock:
+                    if reservation_id in self._reservations:
+                        self._reservations[reservation_id] = self._reservations[reservation_id][:2] + (time.monotonic(),)
+
+
+def iter_csv(rows: Iterable[Union[str, bytes, Sequence]]) -> Iterator[Union[str, bytes]]:
+    """Yield CSV text chunks from rows - sequences are formatted as CSV lines, str/bytes chunks are passed as is."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    for row in rows:
+        if isinstance(row, (str, bytes)):
+            yield row
+            continue
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+# pylint: disable=too-many-arguments
 def attach_stats_csv(
-    context: ResourceCommandContext, logger: logging.Logger, view_name: str, output: str, suffix: str = "csv"
+    context: ResourceCommandContext,
+    logger: logging.Logger,
+    view_name: str,
+    output: Union[str, IO, Iterable[Union[str, bytes, Sequence]]],
+    suffix: str = "csv",
+    compress: bool = False,
 ) -> str:
-    """Attach statistics CSV to reservation."""
-    quali_api_helper = SandboxAttachments(context.connectivity.server_address, context.connectivity.admin_auth_token, logger)
-    quali_api_helper.login()
+    """Attach statistics CSV to reservation.
+
+    :param output: Statistics view - full string, file-like object or iterable of rows (sequences) or text chunks. Anything
+        but a plain string is streamed to the server chunk by chunk so memory does not grow with the view size.
+    :param compress: True - gzip the file on the fly and add .gz to its name.
+    """
+    quali_api_helper = get_sandbox_attachments(
+        context.connectivity.server_address, context.connectivity.admin_auth_token, logger
+    )
     full_file_name = view_name.replace(" ", "_") + "_" + time.ctime().replace(" ", "_") + "." + suffix
-    quali_api_helper.attach_new_file(get_reservation_id(context), file_data=output, file_name=full_file_name)
+    if isinstance(output, str) and not compress:
+        quali_api_helper.attach_new_file(get_reservation_id(context), file_data=output, file_name=full_file_name)
+    else:
+        if isinstance(output, str) or hasattr(output, "read"):
+            chunks = iter_chunks(output)  # type: ignore[arg-type]
+        else:
+            chunks = iter_chunks(iter_csv(output))  # type: ignore[arg-type]
+        if compress:
+            chunks = gzip_chunks(chunks)
+            full_file_name += ".gz"
+        quali_api_helper.attach_new_file_stream(get_reservation_id(context), file_data=chunks, file_name=full_file_name)
     get_cs_session(context).WriteMessageToReservationOutput(
         get_reservation_id(context), f"Statistics view saved in attached file - {full_file_name}"
     )
     return full_file_name
 
 
+class TgSessionRegistry:  # pylint: disable=too-many-instance-attributes
+    """Thread safe LRU registry of TG API sessions keyed by reservation ID and controller address.
+
+    Sessions are created on first use with the create callback and reused by later commands. When the registry is full,
+    the least recently used session is evicted and closed with the close callback.
+    """
+
+    def __init__(
+        self,
+        create: Callable[[str, str], Any],
+        close: Callable[[Any], None],
+        max_sessions: int = TG_SESSIONS_MAX,
+    ) -> None:
+        """Initialize empty registry.
+
+        :param create: Callback with reservation ID and controller address that returns new TG session.
+        :param close: Callback that closes TG session.
+        :param max_sessions: Maximum number of open sessions.
+        """
+        self.create = create
+        self.close = close
+        self.max_sessions = max_sessions
+        self.logger = logging.getLogger(__name__)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._sessions: OrderedDict[Tuple[str, str], Any] = OrderedDict()
+        self._lock = threading.Lock()
+        self._create_locks: Dict[Tuple[str, str], threading.Lock] = defaultdict(threading.Lock)
+
+    def __len__(self) -> int:
+        """Return number of open sessions."""
+        return len(self._sessions)
+
+    def __contains__(self, key: Tuple[str, str]) -> bool:
+        """Return True if there is an open session for (reservation ID, controller address)."""
+        return key in self._sessions
+
+    def get(self, reservation_id: str, address: str) -> Any:
+        """Return open session of reservation and controller, create it if there is no open session."""
+        key = (reservation_id, address)
+        with self._lock:
+            create_lock = self._create_locks[key]
+        with create_lock:
+            with self._lock:
+                if key in self._sessions:
+                    self._sessions.move_to_end(key)
+                    self.hits += 1
+                    return self._sessions[key]
+            session = self.create(reservation_id, address)
+            with self._lock:
+                self.misses += 1
+                self._sessions[key] = session
+                evicted = []
+                while len(self._sessions) > self.max_sessions:
+                    evicted.append(self._sessions.popitem(last=False))
+                    self.evictions += 1
+        for evicted_key, evicted_session in evicted:
+            self._close(evicted_key, evicted_session)
+        return session
+
+    def release(self, reservation_id: str, address: Optional[str] = None) -> None:
+        """Close the sessions of the reservation, all controllers or the requested controller only."""
+        with self._lock:
+            keys = [key for key in self._sessions if key[0] == reservation_id and address in (None, key[1])]
+            sessions = [(key, self._sessions.pop(key)) for key in keys]
+            for key in keys:
+                self._create_locks.pop(key, None)
+        for key, session in sessions:
+            self._close(key, session)
+
+    def close_all(self) -> None:
+        """Close all sessions."""
+        with self._lock:
+            sessions = list(self._sessions.items())
+            self._sessions.clear()
+            self._create_locks.clear()
+        for key, session in sessions:
+            self._close(key, session)
+
+    def stats(self) -> Dict[str, int]:
+        """Return registry counters."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "size": len(self._sessions)}
+
+    def _close(self, key: Tuple[str, str], session: Any) -> None:
+        """Close session, errors are logged and ignored so one broken session does not block the others."""
+        try:
+            self.close(session)
+        except Exception as error:  # pylint: disable=broad-except
+            self.logger.warning("Failed to close TG session of reservation %s controller %s: %s", *key, error)
+
+
+class TgPort(NamedTuple):
+    """TG port resolved from reservation."""
+
+    logical_name: str
+    location: str
+    resource_name: str
+    full_address: str
+
+
+def _topology_cache_path(cache_dir: str, reservation_id: str, ports: Iterable[Tuple[str, str]]) -> str:
+    """Return cache file path of the reservation ports, keyed by reservation ID and (name, address) of all ports."""
+    digest = hashlib.sha1(json.dumps(sorted(ports)).encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir, f"{reservation_id}-{digest}.json")
+
+
+def _read_topology_cache(cache_path: str, max_age: float) -> Optional[Dict[str, TgPort]]:
+    """Return cached ports map, or None if there is no cached map, it is older than max_age seconds or it can not be read."""
+    try:
+        age = time.time() - os.path.getmtime(cache_path)
+        if age > max_age:
+            return None
+        with open(cache_path, encoding="utf-8") as cache_file:
+            ports = {name: TgPort(*port) for name, port in json.load(cache_file).items()}
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, TypeError, AttributeError) as error:
+        logging.getLogger(__name__).warning("Ignoring unreadable TG ports cache %s: %s", cache_path, error)
+        return None
+    logging.getLogger(__name__).info("Serving TG ports from cache %s resolved %d seconds ago", cache_path, age)
+    return ports
+
+
+def _write_topology_cache(cache_path: str, ports: Dict[str, TgPort], max_age: float) -> None:
+    """Write ports map to cache atomically, so concurrent readers never see a partial file.
+
+    Cached maps, and leftover temporary files, older than max_age seconds are removed, so the cache directory does not grow
+    with every reservation.
+    """
+    cache_dir = os.path.dirname(cache_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    now = time.time()
+    for entry in os.scandir(cache_dir):
+        try:
+            if entry.name.endswith((".json", ".tmp")) and now - entry.stat().st_mtime > max_age:
+                os.remove(entry.path)
+        except OSError:
+            pass
+    with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=cache_dir, suffix=".tmp", delete=False) as temp_file:
+        json.dump({name: list(port) for name, port in ports.items()}, temp_file)
+    os.replace(temp_file.name, cache_path)
+
+
+def resolve_tg_ports(
+    context: ResourceCommandContext,
+    max_workers: int = TOPOLOGY_MAX_WORKERS,
+    use_cache: bool = False,
+    cache_dir: str = TOPOLOGY_CACHE_DIR,
+    cache_max_age: float = TOPOLOGY_CACHE_MAX_AGE,
+) -> Dict[str, TgPort]:
+    """Return {logical name: port} of all TG ports in the reservation, ports without logical name are skipped.
+
+    Reservation details are read once and the Logical Name attributes of all ports are read in parallel with a bounded
+    thread pool.
+
+    :param use_cache: True - read/write the result from/to on disk cache so repeated commands in the same sandbox skip
+        resolution. The cache key includes the names and addresses of all ports but not their logical names, as reading them
+        is the cost the cache saves, so logical names changed after the map was cached are seen only when the cached map is
+        older than cache_max_age seconds. Serving a cached map is logged, unreadable cached maps are resolved again and
+        cached maps older than cache_max_age are removed when a new map is cached.
+    :raises ValueError: If two ports have the same logical name.
+    """
+    reservation_id = get_reservation_id(context)
+    resources = get_reservation_index(context).get_resources_by_family(TGN_PORT_FAMILY)
+    cache_path = _topology_cache_path(cache_dir, reservation_id, [(r.Name, r.FullAddress) for r in resources])
+    cached = _read_topology_cache(cache_path, cache_max_age) if use_cache else None
+    if cached is not None:
+        return cached
+
+    def logical_name(resource_name: str) -> str:
+        return get_family_attributes(context, resource_name, ["Logical Name"])["Logical Name"].strip()
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(resources) or 1)) as executor:
+        logical_names = list(executor.map(logical_name, [r.Name for r in resources]))
+    ports: Dict[str, TgPort] = {}
+    for name, resource in zip(logical_names, resources):
+        if not name:
+            continue
+        if name in ports:
+            raise ValueError(f"Ports {ports[name].resource_name} and {resource.Name} have the same logical name {name}")
+        ports[name] = TgPort(name, get_location(resource), resource.Name, resource.FullAddress)
+
+    if use_cache:
+        _write_topology_cache(cache_path, ports, cache_max_age)
+    return ports
+
+
+@lru_cache(maxsize=None)
+def _numpy() -> Optional[ModuleType]:
+    """Return numpy, imported on first use as it is heavy, or None if it is not installed."""
+    try:
+        return importlib.import_module("numpy")
+    except ImportError:
+        return None
+
+
+def _percentile(values: Sequence[float], percent: float) -> float:
+    """Return percentile with linear interpolation between closest ranks, as numpy.percentile default method."""
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * percent / 100
+    low = int(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+
+class TgStatsCollector:
+    """Fixed memory store of periodic TG statistics samples with delta, rate and percentile aggregation.
+
+    Each name (port, stream...) has a ring buffer of the last capacity samples, stored as a flat array of doubles, one row
+    of (timestamp, counter values) per sample. Buffers grow with the samples up to capacity and then wrap, so thousands of
+    names with few samples each cost only the samples. Aggregations run vectorized over a snapshot copy of the buffer with
+    numpy when installed, or in pure python otherwise. Counters that go backwards (cleared statistics) count from zero.
+    """
+
+    def __init__(self, counters: Sequence[str], capacity: int = STATS_CAPACITY, use_numpy: Optional[bool] = None) -> None:
+        """Initialize empty collector.
+
+        :param counters: Names of the collected counters, in the order of sample values.
+        :param capacity: Maximum number of samples kept per name, older samples are overwritten.
+        :param use_numpy: True - require numpy, False - do not use numpy, None - use numpy if installed.
+        """
+        self.counters = tuple(counters)
+        self.capacity = capacity
+        self._width = len(self.counters) + 1
+        self._buffers: Dict[str, array] = {}
+        self._sizes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._np = _numpy() if use_numpy is not False else None
+        if use_numpy and self._np is None:
+            raise ImportError("numpy is not installed")
+
+    def __len__(self) -> int:
+        """Return number of names."""
+        return len(self._buffers)
+
+    @property
+    def names(self) -> List[str]:
+        """Return names, in order of first sample."""
+        return list(self._buffers)
+
+    def add_sample(
+        self, name: str, values: Union[Mapping[str, float], Sequence[float]], timestamp: Optional[float] = None
+    ) -> None:
+        """Add sample of counter values.
+
+        :param values: {counter: value} or values in the order of counters.
+        :param timestamp: Sample time in seconds, defaults to now.
+        """
+        if isinstance(values, Mapping):
+            values = [values[counter] for counter in self.counters]
+        row = array("d", [time.time() if timestamp is None else timestamp, *values])
+        with self._lock:
+            buffer = self._buffers.get(name)
+            if buffer is None:
+                buffer = self._buffers[name] = array("d")
+            size = self._sizes.get(name, 0)
+            if size < self.capacity:
+                buffer.extend(row)
+            else:
+                start = size % self.capacity * self._width
+                buffer[slice(start, start + self._width)] = row
+            self._sizes[name] = size + 1
+
+    def add_view(
+        self, view: Mapping[str, Union[Mapping[str, float], Sequence[float]]], timestamp: Optional[float] = None
+    ) -> None:
+        """Add one sample per name of a statistics view {name: values}, all with the same timestamp."""
+        timestamp = time.time() if timestamp is None else timestamp
+        for name, values in view.items():
+            self.add_sample(name, values, timestamp)
+
+    def samples(self, name: str) -> List[Tuple[float, ...]]:
+        """Return (timestamp, counter values...) rows of name, oldest first."""
+        with self._lock:
+            buffer, size = self._buffers[name], self._sizes[name]
+            starts = range(0, min(size, self.capacity) * self._width, self._width)
+            rows = [tuple(buffer[slice(start, start + self._width)]) for start in starts]
+        head = size % self.capacity if size > self.capacity else 0
+        return rows[head:] + rows[:head]
+
+    def _ordered(self, name: str) -> Any:
+        """Return numpy (samples, width) array of name, oldest first.
+
+        The buffer is copied once, in order, under the lock. The numpy view of the buffer is released before the lock, as
+        an array with an exported buffer cannot grow.
+        """
+        with self._lock:
+            size = self._sizes[name]
+            head = size % self.capacity if size > self.capacity else 0
+            view = self._np.frombuffer(self._buffers[name], dtype=float).reshape(-1, self._width)
+            data = self._np.concatenate((view[head:], view[:head]))
+            del view
+        return data
+
+    def rates(self, name: str) -> Dict[str, List[float]]:
+        """Return {counter: per second rates between consecutive samples}."""
+        if self._np is not None:
+            rates = self._np_rates(self._ordered(name))
+            return {counter: rates[:, i].tolist() for i, counter in enumerate(self.counters)}
+        rows = self.samples(name)
+        return {counter: self._py_rates(rows, i + 1) for i, counter in enumerate(self.counters)}
+
+    def summary(self, name: str) -> Dict[str, Dict[str, float]]:
+        """Return {counter: {last, delta, rate, p50, p95, max}}.
+
+        delta is the counter increase over all kept samples, rate the mean rate over the same period, p50/p95/max the
+        percentiles of the rates between consecutive samples.
+        """
+        if self._np is not None:
+            return self._np_summary(self._ordered(name))
+        return self._py_summary(self.samples(name))
+
+    def _np_deltas(self, data: Any) -> Any:
+        """Return counter increases between consecutive samples."""
+        values = data[:, 1:]
+        deltas = self._np.diff(values, axis=0)
+        return self._np.where(deltas < 0, values[1:], deltas)
+
+    def _np_rates(self, data: Any) -> Any:
+        """Return per second counter rates between consecutive samples, 0 for samples with the same timestamp."""
+        deltas = self._np_deltas(data)
+        intervals = self._np.diff(data[:, 0])[:, None]
+        return self._np.divide(deltas, intervals, out=self._np.zeros_like(deltas), where=intervals > 0)
+
+    def _np_summary(self, data: Any) -> Dict[str, Dict[str, float]]:
+        """Vectorized summary."""
+        elapsed = data[-1, 0] - data[0, 0] if len(data) else 0.0
+        deltas = self._np_deltas(data).sum(axis=0)
+        rates = self._np_rates(data)
+        if len(rates):
+            p50, p95 = self._np.percentile(rates, [50, 95], axis=0)
+            peak = rates.max(axis=0)
+        else:
+            p50 = p95 = peak = self._np.zeros(len(self.counters))
+        return {
+            counter: {
+                "last": float(data[-1, i + 1]) if len(data) else 0.0,
+                "delta": float(deltas[i]),
+                "rate": float(deltas[i] / elapsed) if elapsed > 0 else 0.0,
+                "p50": float(p50[i]),
+                "p95": float(p95[i]),
+                "max": float(peak[i]),
+            }
+            for i, counter in enumerate(self.counters)
+        }
+
+    @staticmethod
+    def _py_deltas(rows: List[Tuple[float, ...]], column: int) -> List[float]:
+        """Return counter increases between consecutive samples."""
+        return [new[column] - old[column] if new[column] >= old[column] else new[column] for old, new in zip(rows, rows[1:])]
+
+    def _py_rates(self, rows: List[Tuple[float, ...]], column: int) -> List[float]:
+        """Return per second counter rates between consecutive samples, 0 for samples with the same timestamp."""
+        intervals = [new[0] - old[0] for old, new in zip(rows, rows[1:])]
+        deltas = self._py_deltas(rows, column)
+        return [delta / interval if interval > 0 else 0.0 for delta, interval in zip(deltas, intervals)]
+
+    def _py_summary(self, rows: List[Tuple[float, ...]]) -> Dict[str, Dict[str, float]]:
+        """Pure python summary."""
+        elapsed = rows[-1][0] - rows[0][0] if rows else 0.0
+        summary = {}
+        for i, counter in enumerate(self.counters):
+            delta = sum(self._py_deltas(rows, i + 1))
+            rates = self._py_rates(rows, i + 1) or [0.0]
+            summary[counter] = {
+                "last": rows[-1][i + 1] if rows else 0.0,
+                "delta": delta,
+                "rate": delta / elapsed if elapsed > 0 else 0.0,
+                "p50": _percentile(rates, 50),
+                "p95": _percentile(rates, 95),
+                "max": max(rates),
+            }
+        return summary
+
+    def iter_samples_rows(self) -> Iterator[Sequence]:
+        """Yield CSV rows of all samples - header, then (name, timestamp, counter values...) rows, name by name."""
+        yield ("Name", "Timestamp", *self.counters)
+        for name in self.names:
+            for row in self.samples(name):
+                yield (name, *row)
+
+    def iter_summary_rows(self) -> Iterator[Sequence]:
+        """Yield CSV rows of the summary - header, then one (name, counter, aggregations...) row per name and counter."""
+        yield STATS_SUMMARY_HEADER
+        for name in self.names:
+            for counter, aggregations in self.summary(name).items():
+                yield (name, counter, *aggregations.values())
+
+    def attach(
+        self,
+        context: ResourceCommandContext,
+        logger: logging.Logger,
+        view_name: str,
+        summary: bool = False,
+        compress: bool = False,
+    ) -> str:
+        """Stream samples, or summary, CSV to reservation attachment, see attach_stats_csv."""
+        rows = self.iter_summary_rows() if summary else self.iter_samples_rows()
+        return attach_stats_csv(context, logger, view_name, rows, compress=compress)
+
+
 class TgControllerDriver(ResourceDriverInterface):
-    """Base class for all TG controller drivers."""
+    """Base class for all TG controller drivers.
+
+    Drivers that keep TG API sessions between commands override create_tg_session/close_tg_session and get the session
+    of the command with get_tg_session. At most tg_sessions_max sessions are kept open, least recently used first out.
+    """
+
+    tg_sessions_max = TG_SESSIONS_MAX
 
     def __init__(self) -> None:
         """Initialize object variables, actual initialization is performed in initialize method."""
         self.logger: logging.Logger = None
+        self.packages_loggers: Dict[str, Union[int, str]] = {}
+        self.log_listener: Optional[QueueListener] = None
+        self.keep_alive_manager = KeepAliveManager(self.keep_alive_heartbeat)
+        self.tg_sessions = TgSessionRegistry(self.create_tg_session, self.close_tg_session, self.tg_sessions_max)
 
     def initialize(self, context: InitCommandContext) -> None:
         """Default implementation for abstract method."""
         self.init_loggers(name=context.resource.name)
 
     def cleanup(self) -> None:
-        """Default empty implementation for abstract method."""
+        """Default implementation for abstract method - release keep alive commands, TG sessions and output handlers.
+
+        If api_metrics is enabled, a summary of CloudShell API calls is logged before the handlers are closed. If
+        init_loggers started a log queue, all queued records are logged and the handlers are moved back to the loggers
+        before the output handlers are closed, so output handlers behind the queue are flushed and closed as well.
+        """
+        self.keep_alive_manager.stop()
+        self.tg_sessions.close_all()
+        if self.logger is None:
+            return
+        self.logger.debug("TG sessions %s", self.tg_sessions.stats())
+        if api_metrics.enabled:
+            self.logger.info("CloudShell API calls summary:")
+            api_metrics.log_summary(self.logger)
+        if self.log_listener is not None:
+            packages_loggers = [logging.getLogger(name) for name in self.packages_loggers]
+            stop_log_queue(self.log_listener, self.logger, *packages_loggers)
+            self.log_listener = None
+        self._close_output_handlers()
+
+    def _close_output_handlers(self, reservation_id: Optional[str] = None) -> None:
+        """Close and remove reservation output handlers of the reservation, or of all reservations if not specified.
+
+        Handlers are removed from the shell and packages loggers, and from the running log queue listener, before they are
+        closed.
+        """
+
+        def closed(handler: logging.Handler) -> bool:
+            return isinstance(handler, ReservationOutputHandler) and reservation_id in (None, handler.sandbox_id)
+
+        handlers = [handler for handler in self.logger.handlers if closed(handler)]
+        if self.log_listener is not None:
+            handlers += [handler for handler in self.log_listener.handlers if closed(handler)]
+            self.log_listener.handlers = tuple(handler for handler in self.log_listener.handlers if not closed(handler))
+        for target in (self.logger, *(logging.getLogger(name) for name in self.packages_loggers)):
+            for handler in handlers:
+                target.removeHandler(handler)
+        for handler in handlers:
+            handler.close()
+
+    # pylint: disable=too-many-arguments
+    def init_loggers(
+        self,
+        name: str,
+        log_group: str = "traffic_shells",
+        packages_loggers: Optional[Union[Iterable[str], Mapping[str, Union[int, str]]]] = None,
+        level: Union[int, str] = logging.DEBUG,
+        rate_limit: Optional[RateLimitFilter] = None,
+        use_queue: bool = False,
+    ) -> None:
+        """Initialize TG loggers.
+
+        :param packages_loggers: Vendor packages loggers that log to the shell handlers. List of names - packages log with
+            the shell level, {name: level} - per package level, e.g. {"ixnetwork_restpy": logging.INFO}.
+        :param level: Shell logger level, can be changed at runtime with set_log_level.
+        :param rate_limit: Filter that rate limits, or samples, repetitive records of the shell and packages loggers,
+            including records of their child loggers.
+        :param use_queue: True - the handlers are served by a background QueueListener so logging calls only enqueue the
+            record, False - the handlers format and write the record on the logging thread.
+        """
+        # qs_logger is imported on first use as most commands never initialize the loggers.
+        from cloudshell.logging.qs_logger import get_qs_logger  # pylint: disable=import-outside-toplevel
 
-    def init_loggers(self, name: str, log_group: str = "traffic_shells", packages_loggers: Optional[list] = None) -> None:
-        """Initialize TG loggers."""
         self.logger = get_qs_logger(log_group=log_group, log_file_prefix=name)
-        self.logger.setLevel(logging.DEBUG)
+        self.logger.setLevel(level)
+        if isinstance(packages_loggers, Mapping):
+            self.packages_loggers = dict(packages_loggers)
+        else:
+            self.packages_loggers = {package_logger_name: level for package_logger_name in packages_loggers or []}
 
-        for package_logger_name in packages_loggers or []:
+        loggers = [self.logger]
+        for package_logger_name, package_level in self.packages_loggers.items():
             package_logger = logging.getLogger(package_logger_name)
-            package_logger.setLevel(self.logger.level)
+            package_logger.setLevel(package_level)
             for handler in self.logger.handlers:
                 if handler not in package_logger.handlers:
                     package_logger.addHandler(handler)
+            loggers.append(package_logger)
+
+        # qs loggers are shared by log group, the queue is started once per logger.
+        if use_queue and not any(isinstance(handler, QueueHandler) for handler in self.logger.handlers):
+            self.log_listener = start_log_queue(*loggers)
+        # Logger filters do not see records propagated from child loggers, e.g. ixnetwork_restpy.connection, so the filter
+        # is added to the handlers, or to the queue handler, shared by the shell and packages loggers.
+        if rate_limit is not None:
+            for handler in self.logger.handlers:
+                handler.addFilter(rate_limit)
+
+    def set_log_level(self, level: Union[int, str], packages: Optional[Iterable[str]] = None) -> None:
+        """Change the shell logger level, and packages loggers levels, at runtime, e.g. to switch DEBUG on and off.
+
+        :param packages: Packages loggers to change, default all packages loggers initialized by init_loggers.
+        """
+        self.logger.setLevel(level)
+        for package_logger_name in self.packages_loggers if packages is None else packages:
+            logging.getLogger(package_logger_name).setLevel(level)
 
     def keep_alive(self, context: ResourceCommandContext, cancellation_context: CancellationContext) -> None:
         """A bg command that runs forever to keep the shell, thus the session to the TG, up and running between commands.
 
         It is the shell driver responsibility to call enqueue_keep_alive during before it creates the session to the TG,
         usually in load_config command.
+
+        The command blocks until its reservation is released by the keep_alive_manager, which serves all reservations of
+        the driver instance from one scheduler thread and calls keep_alive_heartbeat periodically. When the command ends,
+        only its own reservation is released, see release_reservation, keep alive of other reservations goes on.
+        """
+        if self.logger:
+            self.keep_alive_manager.logger = self.logger
+            self.tg_sessions.logger = self.logger
+        reservation_id = get_reservation_id(context)
+        self.keep_alive_manager.register(reservation_id, cancellation_context).wait()
+        self.release_reservation(reservation_id)
+
+    def release_reservation(self, reservation_id: str) -> None:
+        """Release keep alive, TG sessions and reservation output handlers of a single reservation.
+
+        Called when the keep_alive command of the reservation ends. Override to release more per reservation resources,
+        driver wide resources are released by cleanup.
         """
-        while not cancellation_context.is_cancelled:
-            time.sleep(2)
-        if cancellation_context.is_cancelled:
-            self.cleanup()
+        self.keep_alive_manager.unregister(reservation_id)
+        self.tg_sessions.release(reservation_id)
+        if self.logger is not None:
+            self._close_output_handlers(reservation_id)
+
+    def keep_alive_heartbeat(self, reservation_id: str) -> None:
+        """Default empty implementation - override to ping the TG session of the reservation so it does not time out."""
+
+    def get_tg_session(self, context: ResourceCommandContext, address: Optional[str] = None) -> Any:
+        """Return the TG session of the reservation and controller, reuse the open session if any.
+
+        :param address: Controller address, defaults to the address of the driver resource.
+        """
+        return self.tg_sessions.get(get_reservation_id(context), address or context.resource.address)
+
+    def create_tg_session(self, reservation_id: str, address: str) -> Any:
+        """Create TG session to the controller, override in drivers that use get_tg_session."""
+        raise NotImplementedError(f"{self.__class__.__name__} does not implement create_tg_session")
+
+    def close_tg_session(self, session: Any) -> None:
+        """Default empty implementation - override to disconnect the TG session and release its resources."""
@@ -0,0 +1,224 @@
+"""
+Watch reservations for changes and notify subscribers with structured diffs.
+
+All subscribers of a reservation share one ReservationWatcher, so N listeners cost one GetReservationDetails per interval.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Callable, Dict, List, Mapping, NamedTuple, Optional, Tuple, Union
+
+from cloudshell.shell.core.driver_context import ResourceCommandContext
+
+from .admission import Priority, admission
+from .helpers import ReservationIndex, get_cs_session, get_reservation_id, reservation_cache
+
+if TYPE_CHECKING:
+    from cloudshell.api.cloudshell_api import CloudShellAPISession, Connector
+    from cloudshell.workflow.orchestration.sandbox import Sandbox
+
+WATCH_INTERVAL = 2.0
+
+AttributesChanges = Dict[str, Dict[str, Tuple[Optional[str], Optional[str]]]]
+
+
+class ReservationDiff(NamedTuple):
+    """Changes between two reservation snapshots.
+
+    Resources are identified by name, services by alias and connectors by connector_key. attributes_changed maps service
+    alias or connector key to {attribute name: (old value, new value)}, None value means the attribute does not exist.
+    """
+
+    resources_added: Tuple[str, ...] = ()
+    resources_removed: Tuple[str, ...] = ()
+    services_added: Tuple[str, ...] = ()
+    services_removed: Tuple[str, ...] = ()
+    connectors_added: Tuple[str, ...] = ()
+    connectors_removed: Tuple[str, ...] = ()
+    attributes_changed: Mapping[str, Mapping[str, Tuple[Optional[str], Optional[str]]]] = MappingProxyType({})
+
+    def __bool__(self) -> bool:
+        """Return True if there is any change."""
+        return any(self)
+
+
+def connector_key(connector: Connector) -> str:
+    """Return connector alias, or source->target for connectors without alias."""
+    return connector.Alias or f"{connector.Source}->{connector.Target}"
+
+
+def _added_removed(old: Mapping[str, object], new: Mapping[str, object]) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+    """Return keys added to and removed from mapping, in mapping order."""
+    return tuple(key for key in new if key not in old), tuple(key for key in old if key not in new)
+
+
+def _attributes_changes(old: Mapping[str, Mapping[str, str]], new: Mapping[str, Mapping[str, str]]) -> AttributesChanges:
+    """Return attributes changes of objects in both snapshots."""
+    changes: AttributesChanges = {}
+    for key in new.keys() & old.keys():
+        old_attributes, new_attributes = old[key], new[key]
+        if old_attributes == new_attributes:
+            continue
+        changes[key] = {
+            name: (old_attributes.get(name), new_attributes.get(name))
+            for name in {**old_attributes, **new_attributes}
+            if old_attributes.get(name) != new_attributes.get(name)
+        }
+    return changes
+
+
+def _connectors_attributes(index: ReservationIndex) -> Dict[str, Dict[str, str]]:
+    """Return {connector key: {attribute name: value}}."""
+    return {connector_key(c): {a.Name: a.Value for a in c.Attributes} for c in index.description.Connectors}
+
+
+def diff_reservations(old: ReservationIndex, new: ReservationIndex) -> ReservationDiff:
+    """Return changes from old reservation snapshot to new reservation snapshot."""
+    old_connectors, new_connectors = _connectors_attributes(old), _connectors_attributes(new)
+    return ReservationDiff(
+        *_added_removed(old.resources_by_name, new.resources_by_name),
+        *_added_removed(old.services_by_alias, new.services_by_alias),
+        *_added_removed(old_connectors, new_connectors),
+        attributes_changed={
+            **_attributes_changes(old.service_attributes, new.service_attributes),
+            **_attributes_changes(old_connectors, new_connectors),
+        },
+    )
+
+
+class ReservationWatcher:  # pylint: disable=too-many-instance-attributes
+    """Poll single reservation and call all subscribers with the diff of every change.
+
+    The poller thread is started on first subscription and stopped when the last subscriber unsubscribes.
+    """
+
+    def __init__(self, cs_session: CloudShellAPISession, reservation_id: str, interval: float = WATCH_INTERVAL) -> None:
+        """Initialize watcher, the first snapshot is fetched on first subscription."""
+        self.cs_session = cs_session
+        self.reservation_id = reservation_id
+        self.interval = interval
+        self.logger = logging.getLogger(__name__)
+        self.snapshot: Optional[ReservationIndex] = None
+        self._callbacks: List[Callable[[ReservationDiff], None]] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def __len__(self) -> int:
+        """Return number of subscribers."""
+        return len(self._callbacks)
+
+    def subscribe(self, callback: Callable[[ReservationDiff], None]) -> Callable[[], None]:
+        """Subscribe callback to reservation changes and return function that unsubscribes it.
+
+        If the poller is not running, the first snapshot is fetched, without holding the lock, before the callback is
+        registered, so a failed fetch raises and leaves nothing subscribed.
+        """
+        snapshot: Optional[ReservationIndex] = None
+        while True:
+            with self._lock:
+                if self._thread is not None or snapshot is not None:
+                    if self._thread is None:
+                        self.snapshot = snapshot
+                        self._thread = threading.Thread(
+                            target=self._run, name=f"reservation-watcher-{self.reservation_id}", daemon=True
+                        )
+                        self._thread.start()
+                    self._callbacks.append(callback)
+                    self._stop.clear()
+                    return lambda: self.unsubscribe(callback)
+            snapshot = reservation_cache.fetch_index(self.cs_session, self.reservation_id)
+
+    def unsubscribe(self, callback: Callable[[ReservationDiff], None]) -> None:
+        """Unsubscribe callback, the poller thread exits if it was the last subscriber."""
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+            if not self._callbacks:
+                self._stop.set()
+
+    def stop(self) -> None:
+        """Stop polling and wait for the poller thread to exit, subscribers are kept until they unsubscribe."""
+        with self._lock:
+            self._stop.set()
+            thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def poll(self) -> ReservationDiff:
+        """Fetch reservation details, call subscribers if the reservation changed and return the diff.
+
+        The fetch is admitted with polling priority when admission control is enabled.
+        """
+        index = reservation_cache.fetch_index(admission.wrap(self.cs_session, Priority.POLLING), self.reservation_id)
+        with self._lock:
+            diff = diff_reservations(self.snapshot, index) if self.snapshot is not None else ReservationDiff()
+            self.snapshot = index
+            callbacks = list(self._callbacks)
+        if diff:
+            for callback in callbacks:
+                try:
+                    callback(diff)
+                except Exception as error:  # pylint: disable=broad-except
+                    self.logger.warning("Reservation %s watcher callback failed: %s", self.reservation_id, error)
+        return diff
+
+    def _run(self) -> None:
+        """Poller loop, exits when stopped and not resubscribed meanwhile."""
+        while True:
+            if self._stop.wait(self.interval):
+                with self._lock:
+                    if self._stop.is_set():
+                        self._thread = None
+                        return
+                continue
+            try:
+                self.poll()
+            except Exception as error:  # pylint: disable=broad-except
+                self.logger.warning("Reservation %s watcher poll failed: %s", self.reservation_id, error)
+
+
+_watchers: Dict[str, ReservationWatcher] = {}
+_watchers_lock = threading.Lock()
+
+
+def watch_reservation(
+    context_or_sandbox: Union[ResourceCommandContext, Sandbox],
+    callback: Callable[[ReservationDiff], None],
+    interval: float = WATCH_INTERVAL,
+) -> Callable[[], None]:
+    """Subscribe callback to changes of the reservation and return function that unsubscribes it.
+
+    All subscribers of a reservation share one watcher. The interval of the first subscriber is used. The session login and
+    the first snapshot fetch are done without holding the registry lock, so they never block subscriptions to other
+    reservations.
+    """
+    reservation_id = get_reservation_id(context_or_sandbox)
+    with _watchers_lock:
+        watcher = _watchers.get(reservation_id)
+    if watcher is None:
+        new_watcher = ReservationWatcher(get_cs_session(context_or_sandbox), reservation_id, interval)
+        with _watchers_lock:
+            watcher = _watchers.setdefault(reservation_id, new_watcher)
+
+    def release() -> None:
+        with _watchers_lock:
+            if not watcher and _watchers.get(reservation_id) is watcher:
+                del _watchers[reservation_id]
+
+    try:
+        unsubscribe = watcher.subscribe(callback)
+    except Exception:
+        release()
+        raise
+    with _watchers_lock:
+        # The watcher could be released by its last subscriber while this subscription fetched the first snapshot.
+        _watchers.setdefault(reservation_id, watcher)
+
+    def unsubscribe_and_release() -> None:
+        unsubscribe()
+        release()
+
+    return unsubscribe_and_release
@@ -0,0 +1,99 @@
+"""
+Offline stand-ins for CloudShell API objects, shared by tests that do not need a live CloudShell server.
+"""
+# CloudShell API method and argument names are CamelCase.
+# pylint: disable=invalid-name
+from types import SimpleNamespace
+
+
+def reservation_description(ports: int = 4) -> SimpleNamespace:
+    """Build synthetic reservation description with ports, one service and one connector."""
+    resources = [
+        SimpleNamespace(
+            Name=f"chassis/Module1/Port{i}",
+            ResourceModelName="Port Model",
+            ResourceFamilyName="CS_TrafficGeneratorPort",
+            FullAddress=f"192.168.1.1/M1/P{i}",
+        )
+        for i in range(ports)
+    ]
+    attributes = [SimpleNamespace(Name="Test Attribute", Value="1")]
+    services = [SimpleNamespace(Alias="Controller", ServiceName="Controller Model", Attributes=attributes)]
+    connectors = [SimpleNamespace(Alias="c1", Source=resources[0].Name, Target=resources[1].Name, Attributes=[])]
+    return SimpleNamespace(Resources=resources, Services=services, Connectors=connectors)
+
+
+class FakeSession:  # pylint: disable=too-many-instance-attributes
+    """Offline stand-in for CloudShellAPISession that serves a fixed reservation description."""
+
+    def __init__(self, description: SimpleNamespace) -> None:
+        """Initialize served description and calls counter."""
+        self.description = description
+        self.calls = 0
+        self.resource_details = SimpleNamespace(
+            Name="port",
+            ResourceModelName="Port Model",
+            ResourceFamilyName="CS_TrafficGeneratorPort",
+            ResourceAttributes=[
+                SimpleNamespace(Name="Port Model.Logical Name", Value="Port 1"),
+                SimpleNamespace(Name="CS_TrafficGeneratorPort.Media Type", Value="Fiber"),
+                SimpleNamespace(Name="Location", Value="Lab"),
+            ],
+        )
+        self.set_requests: list = []
+        self.messages: list = []
+        self.db_resources: list = []
+        self.domain_resources: list = []
+        self.find_calls = 0
+
+    def GetReservationDetails(self, reservationId: str, disableCache: bool = False) -> SimpleNamespace:
+        """Return the fixed reservation description."""
+        self.calls += 1
+        return SimpleNamespace(ReservationDescription=self.description)
+
+    def GetResourceDetails(self, resourceFullPath: str) -> SimpleNamespace:
+        """Return the fixed resource details."""
+        self.calls += 1
+        return self.resource_details
+
+    def WriteMessageToReservationOutput(self, reservationId: str, message: str) -> None:
+        """Record reservation output messages."""
+        self.calls += 1
+        self.messages.append(message)
+
+    def SetAttributesValues(self, resourcesAttributesUpdateRequests: list) -> None:
+        """Record set attributes requests."""
+        self.calls += 1
+        self.set_requests.extend(resourcesAttributesUpdateRequests)
+
+    def FindResources(
+        self,
+        resourceModel: str = "",
+        resourceFullName: str = "",
+        exactName: bool = True,
+        includeSubResources: bool = True,
+        maxResults: int = 500,
+    ) -> SimpleNamespace:
+        """Return DB resources that match the model and the full name, or are sub resources of the full name."""
+        self.calls += 1
+        self.find_calls += 1
+
+        def matches(resource: SimpleNamespace) -> bool:
+            if resourceModel and resource.Model != resourceModel:
+                return False
+            if not resourceFullName or resource.FullName == resourceFullName:
+                return True
+            return includeSubResources and resource.FullName.startswith(resourceFullName + "/")
+
+        resources = [SimpleNamespace(FullName=r.FullName, ResourceModelName=r.Model) for r in self.db_resources if matches(r)]
+        return SimpleNamespace(Resources=resources[:maxResults])
+
+    def CreateResources(self, resourceInfoDtos: list) -> None:
+        """Add resources to DB."""
+        self.calls += 1
+        self.db_resources.extend(resourceInfoDtos)
+
+    def AddResourcesToDomain(self, domainName: str, resourcesNames: list) -> None:
+        """Record resources added to domain."""
+        self.calls += 1
+        self.domain_resources.extend(resourcesNames)
@@ -0,0 +1,98 @@
+"""
+Test admission control.
+"""
+import threading
+import time
+from types import SimpleNamespace
+from typing import List
+
+import pytest
+
+from cloudshell.traffic import helpers
+from cloudshell.traffic.admission import AdmissionController, AdmittedSession, Priority, _limits_from_env, admission
+from cloudshell.traffic.helpers import ReservationOutputHandler, wait_for_resources
+from tests.fakes import FakeSession
+
+
+def test_rate_and_concurrency() -> None:
+    """Test token bucket spaces calls by the rate after the burst and concurrency cap limits calls in flight."""
+    controller = AdmissionController(rate=50, burst=2)
+    start = time.monotonic()
+    waits = []
+    for _ in range(6):
+        with controller.admit() as waited:
+            waits.append(waited)
+    assert time.monotonic() - start >= 4 / 50 * 0.9
+    assert waits[0] < 0.01 < waits[-1]
+
+    controller.configure(max_concurrency=2)
+    in_flight: List[int] = []
+    lock = threading.Lock()
+    active = [0]
+
+    def call() -> None:
+        with controller.admit(Priority.POLLING):
+            with lock:
+                active[0] += 1
+                in_flight.append(active[0])
+            time.sleep(0.01)
+            with lock:
+                active[0] -= 1
+
+    threads = [threading.Thread(target=call) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert max(in_flight) == 2
+    stats = controller.stats()
+    assert stats["in_flight"] == 0 and stats["queued"] == 0
+    assert stats["priorities"]["POLLING"]["admitted"] == 8
+    assert stats["priorities"]["POLLING"]["max_wait_seconds"] > 0
+
+
+def test_priority_order() -> None:
+    """Test queued calls are admitted by priority, then by arrival."""
+    controller = AdmissionController(max_concurrency=1)
+    order: List[str] = []
+    controller.acquire()
+
+    def call(name: str, priority: Priority) -> None:
+        with controller.admit(priority):
+            order.append(name)
+
+    threads = []
+    for name, priority in (("log", Priority.LOGGING), ("poll", Priority.POLLING), ("command", Priority.INTERACTIVE)):
+        threads.append(threading.Thread(target=call, args=(name, priority)))
+        threads[-1].start()
+        while controller.stats()["queued"] < len(threads):
+            time.sleep(0.001)
+    controller.release()
+    for thread in threads:
+        thread.join()
+    assert order == ["command", "poll", "log"]
+
+
+def test_call_sites(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test sessions are wrapped only when enabled, with the priority of the call site."""
+    session = FakeSession(SimpleNamespace(Resources=[], Services=[], Connectors=[]))
+    sandbox = SimpleNamespace(id="id", automation_api=session)
+    assert helpers.get_cs_session(sandbox) is session
+
+    monkeypatch.setattr(admission, "enabled", True)
+    admission.reset_stats()
+    cs_session = helpers.get_cs_session(sandbox)
+    assert isinstance(cs_session, AdmittedSession) and cs_session.priority == Priority.INTERACTIVE
+    assert admission.wrap(cs_session, Priority.POLLING).wrapped is session
+    handler = ReservationOutputHandler(sandbox)
+    assert handler.session.priority == Priority.LOGGING
+    handler.session.WriteMessageToReservationOutput("id", "message")
+    wait_for_resources(session, "id", [], timeout=1)
+    assert set(admission.stats()["priorities"]) == {"POLLING", "LOGGING"}
+
+
+def test_limits_from_env() -> None:
+    """Test environment variable parsing."""
+    assert not _limits_from_env(None)
+    assert _limits_from_env("rate=2.5, burst=5,max_concurrency=4") == {"rate": 2.5, "burst": 5, "max_concurrency": 4}
+    assert AdmissionController(**_limits_from_env("max_concurrency=4")).enabled
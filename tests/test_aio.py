@@ -0,0 +1,54 @@
+"""
+Test aio helpers.
+"""
+import asyncio
+import gc
+import logging
+
+import pytest
+
+from benchmarks.server import StandInServer
+from cloudshell.traffic import aio
+from tests.fakes import FakeSession, reservation_description
+
+
+def test_concurrent_waits() -> None:
+    """Test many concurrent waits on one event loop and that semaphores of closed loops are dropped."""
+    session = FakeSession(reservation_description())
+    session.host = "localhost"
+
+    async def wait_all() -> list:
+        return await asyncio.gather(*[aio.wait_for_resources(session, "id", "chassis/Module1/Port0") for _ in range(50)])
+
+    reports = asyncio.run(wait_all())
+    assert all(report.polls == 1 for report in reports)
+    assert session.calls == 50
+    with pytest.raises(TimeoutError):
+        asyncio.run(aio.wait_for_attribute(session, "id", "Controller", "Test Attribute", "2", timeout=0.2))
+
+    async def only_running_loop() -> bool:
+        aio._get_semaphore("localhost")  # pylint: disable=protected-access
+        return list(aio._semaphores) == [asyncio.get_running_loop()]  # pylint: disable=protected-access
+
+    assert asyncio.run(only_running_loop())
+    gc.collect()
+    assert not aio._semaphores  # pylint: disable=protected-access
+
+
+def test_async_attachments() -> None:
+    """Test async bulk attachments operations return their per file results."""
+
+    async def run(attachments: aio.AsyncSandboxAttachments) -> list:
+        await attachments.login()
+        attached = await attachments.attach_files("id", {"test1.txt": "Hello World 1", "test2.txt": "Hello World 2"})
+        content = await attachments.get_attached_files_content("id", "*1.txt")
+        removed = await attachments.remove_attached_files("id")
+        return [attached, content, removed, await attachments.get_attached_files("id")]
+
+    with StandInServer() as server:
+        attached, content, removed, left = asyncio.run(
+            run(aio.AsyncSandboxAttachments(server.host, "token", logging.getLogger()))
+        )
+    assert sorted(attached.results) == sorted(removed.results) == ["test1.txt", "test2.txt"]
+    assert content.results == {"test1.txt": b"Hello World 1"}
+    assert not attached.errors and not removed.errors and not left
@@ -3,16 +3,41 @@ Test test_helpers.
 """
 # pylint: disable=redefined-outer-name
 import logging
+import time
+from types import SimpleNamespace
 from typing import Iterable
 
 import pytest
 from shellfoundry_traffic.test_helpers import TgTestHelpers, create_session_from_config
 
+from cloudshell.api import cloudshell_api
 from cloudshell.api.cloudshell_api import CloudShellAPISession
+from cloudshell.api.common_cloudshell_api import CloudShellAPIError
 from cloudshell.logging.qs_logger import get_qs_logger
 from cloudshell.sandbox_rest.sandbox_api import SandboxRestApiSession
-from cloudshell.traffic.helpers import ReservationOutputHandler, get_reservation_id
+from cloudshell.traffic import helpers
+from cloudshell.traffic.helpers import (
+    CloudShellSessionPool,
+    PortLocation,
+    RelogSession,
+    ReservationCache,
+    ReservationIndex,
+    ReservationOutputHandler,
+    ResourceSpec,
+    add_resources_to_db,
+    compact_reservation,
+    get_family_attributes,
+    get_location,
+    get_locations,
+    get_locations_index,
+    get_reservation_id,
+    resource_attributes_resolver,
+    set_family_attributes,
+    wait_for_attribute,
+    wait_for_reservation,
+)
 from cloudshell.workflow.orchestration.sandbox import Sandbox
+from tests.fakes import FakeSession, reservation_description
 
 logger = get_qs_logger()
 logger.setLevel(logging.DEBUG)
@@ -60,3 +85,220 @@ def test_log_to_reservation_output(sandbox: Sandbox, rest_api: SandboxRestApiSes
     logger.info("Hello World")
     output = rest_api.get_sandbox_output(get_reservation_id(sandbox))
     assert output["entries"][0]["text"] == "Hello World"
+
+
+def test_reservation_cache() -> None:
+    """Test reservation cache hits, misses, TTL and invalidation."""
+    session = FakeSession(SimpleNamespace(Resources=[], Services=[], Connectors=[]))
+    cache = ReservationCache(ttl=60)
+    cache.get(session, "id", use_cache=False)
+    cache.get(session, "id")
+    cache.get(session, "id")
+    assert session.calls == 1
+    assert cache.stats() == {"hits": 2, "misses": 1, "size": 1}
+    cache.get(session, "id", ttl=0)
+    assert session.calls == 2
+    cache.invalidate("id")
+    cache.get(session, "id")
+    assert session.calls == 3
+
+    cache = ReservationCache(ttl=60, max_size=2)
+    for reservation_id in ("r1", "r2", "r1", "r3"):
+        cache.get_index(session, reservation_id)
+    assert cache.stats()["size"] == 2
+    cache.get(session, "r1")
+    cache.get(session, "r2")
+    assert cache.stats()["hits"] == 1
+    cache.idle_timeout = 0.05
+    time.sleep(0.1)
+    cache.fetch(session, "r4")
+    assert cache.stats()["size"] == 1
+
+
+def test_reservation_index() -> None:
+    """Test reservation index lookups, lookups of several models keep reservation order."""
+    description = reservation_description()
+    description.Resources[1].ResourceModelName = "Other Model"
+    index = ReservationIndex(description)
+    assert len(index.get_resources("Port Model", "Port Model")) == 3
+    assert index.get_resources("Port Model", "Other Model") == description.Resources
+    assert index.get_resources("Other Model", "Port Model") == description.Resources
+    index = ReservationIndex(reservation_description())
+    assert not index.get_resources("Other Model")
+    assert index.get_resources_by_family("CS_TrafficGeneratorPort")[0].Name == "chassis/Module1/Port0"
+    assert index.resources_by_address["192.168.1.1/M1/P2"].Name == "chassis/Module1/Port2"
+    assert index.get_services("Controller Model")[0].Alias == "Controller"
+    assert index.get_connectors("chassis/Module1/Port1")[0].Alias == "c1"
+    assert index.get_service_attribute("Controller", "Test Attribute") == "1"
+    assert index.get_service_attribute("Controller", "Missing") is None
+    assert index.has_resources(["chassis/Module1/Port0", "chassis/Module1/Port3"])
+    assert not index.has_services(["Controller", "Missing"])
+    assert index.has_connectors(["c1"])
+    with pytest.raises(AttributeError):
+        index.description = None
+
+
+def test_family_attributes() -> None:
+    """Test bulk get and set of namespaced attributes."""
+    session = FakeSession(SimpleNamespace(Resources=[], Services=[], Connectors=[]))
+    context = SimpleNamespace(automation_api=session, id="id")
+    resource_attributes_resolver.invalidate()
+    values = get_family_attributes(context, "port", ["Logical Name", "Media Type", "Location"])
+    assert values == {"Logical Name": "Port 1", "Media Type": "Fiber", "Location": "Lab"}
+    set_family_attributes(context, "port", {"Logical Name": "Port 2", "CS_TrafficGeneratorPort.Media Type": "Copper"})
+    assert session.calls == 2
+    names_values = session.set_requests[0].AttributeNamesValues
+    assert [(a.Name, a.Value) for a in names_values] == [
+        ("Port Model.Logical Name", "Port 2"),
+        ("CS_TrafficGeneratorPort.Media Type", "Copper"),
+    ]
+    with pytest.raises(KeyError):
+        get_family_attributes(context, "port", ["Missing"])
+
+
+def test_wait_for_reservation() -> None:
+    """Test combined wait and attribute wait timeout."""
+    session = FakeSession(reservation_description())
+    report = wait_for_reservation(
+        session,
+        "id",
+        resources_names=["chassis/Module1/Port0"],
+        services_aliases=["Controller"],
+        connectors_aliases=["c1"],
+        attributes={"Controller": {"Test Attribute": "1"}},
+    )
+    assert report.polls == 1
+    with pytest.raises(TimeoutError):
+        wait_for_attribute(session, "id", "Controller", "Test Attribute", "2", timeout=0.2)
+    assert session.calls > 2
+
+
+def test_batched_reservation_output() -> None:
+    """Test batched reservation output handler coalesces records and flushes on close."""
+    session = FakeSession(SimpleNamespace(Resources=[], Services=[], Connectors=[]))
+    handler = ReservationOutputHandler(SimpleNamespace(automation_api=session, id="id"), batched=True, flush_interval=60)
+    batch_logger = logging.getLogger("test_batched_reservation_output")
+    batch_logger.addHandler(handler)
+    for i in range(5):
+        batch_logger.warning("message %s", i)
+    handler.close()
+    batch_logger.removeHandler(handler)
+    assert session.messages == ["\n".join(f"message {i}" for i in range(5))]
+
+
+def test_cs_session_pool(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test session pool reuse, health check, idle expiry, and single re-login on authentication error codes only."""
+    created = []
+    commands: list = []
+    token_valid = [True]
+
+    class PooledSession:
+        """Offline stand-in for CloudShellAPISession that counts logins."""
+
+        # pylint: disable=invalid-name
+
+        def __init__(self, host: str, **kwargs: str) -> None:
+            """Record login."""
+            self.healthy = token_valid[0]
+            created.append(self)
+
+        def GetServerDateAndTime(self) -> None:
+            """Fail if session is not healthy."""
+            if not self.healthy:
+                raise ConnectionError()
+
+        def GetReservationDetails(self, reservation_id: str) -> str:
+            """Fail with authentication fault if session is not healthy."""
+            if not self.healthy:
+                raise CloudShellAPIError("100", "Token expired", "")
+            return reservation_id
+
+        def ExecuteCommand(self, reservation_id: str, command: str) -> None:
+            """Count command and fail with command error that mentions a token."""
+            commands.append(command)
+            raise CloudShellAPIError("1", "IxNetwork rejected the API token", "")
+
+    monkeypatch.setattr(cloudshell_api, "CloudShellAPISession", PooledSession)
+    pool = CloudShellSessionPool(idle_timeout=60, health_check_interval=0)
+    session = pool.get("localhost", "token")
+    assert pool.get("localhost", "token") is session
+    assert pool.get("localhost", "other token") is not session
+    session.healthy = False
+    assert pool.get("localhost", "token") is not session
+    assert pool.stats() == {"logins": 3, "hits": 1, "size": 2}
+    pool.idle_timeout = 0
+    pool.get("localhost", "token")
+    assert len(created) == 4
+
+    pool.health_check_interval = pool.idle_timeout = 60
+    relog_session = RelogSession(pool, "localhost", "token")
+    relog_session.wrapped.healthy = False
+    assert relog_session.GetReservationDetails("id") == "id"
+    assert len(created) == 5 and relog_session.wrapped is created[-1]
+    assert pool.get("localhost", "token") is created[-1]
+    created[-1].healthy = token_valid[0] = False
+    with pytest.raises(CloudShellAPIError):
+        relog_session.GetReservationDetails("id")
+    assert len(created) == 6
+    with pytest.raises(CloudShellAPIError):
+        relog_session.ExecuteCommand("id", "start")
+    assert commands == ["start"] and len(created) == 6
+
+
+def test_locations() -> None:
+    """Test bulk port locations parsing and reverse index."""
+    ports = reservation_description().Resources
+    ports[1].FullAddress = "192.168.1.1/M1/PG2/P1"
+    assert get_locations(ports)[:2] == [
+        PortLocation("192.168.1.1", "1", None, "0"),
+        PortLocation("192.168.1.1", "1", "2", "1"),
+    ]
+    assert [str(location) for location in get_locations(ports)] == [get_location(port) for port in ports]
+    assert get_locations_index(ports)["192.168.1.1/1/1"] is ports[1]
+
+
+def test_compact_reservation() -> None:
+    """Test conversion of reservation description into compact records."""
+    compact = compact_reservation(reservation_description())
+    assert compact.resources[2].name == "chassis/Module1/Port2"
+    assert compact.resources[2].location == PortLocation("192.168.1.1", "1", None, "2")
+    assert compact.resources[0].family is compact.resources[3].family
+    assert compact.services[0].attributes == {"Test Attribute": "1"}
+
+
+def test_add_resources_to_db(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test bulk add resources creates only missing resources with constant number of API calls."""
+    session = FakeSession(SimpleNamespace(Resources=[], Services=[], Connectors=[]))
+    context = SimpleNamespace(
+        connectivity=SimpleNamespace(server_address="localhost"),
+        reservation=SimpleNamespace(reservation_id="id", domain="Lab"),
+    )
+    context.automation_api = session
+    resource_attributes_resolver.invalidate()
+    helpers.add_resource_to_db(context, "Port Model", "chassis/port0", **{"Logical Name": "Port 0"})
+    specs = [ResourceSpec("Port Model", f"chassis/port{i}", attributes={"Logical Name": f"Port {i}"}) for i in range(200)]
+    session.calls = 0
+    report = add_resources_to_db(context, specs)
+    assert report.skipped == ["chassis/port0"]
+    assert len(report.created) == 199
+    assert session.domain_resources == [f"chassis/port{i}" for i in range(200)]
+    assert len(session.set_requests) == 200
+    assert session.set_requests[-1].AttributeNamesValues[0].Name == "Port Model.Logical Name"
+    # FindResources + CreateResources + AddResourcesToDomain + 2 SetAttributesValues batches.
+    assert session.calls == 5
+    assert add_resources_to_db(context, specs).created == []
+
+    # Resources of the same model under another chassis do not truncate the lookup.
+    session.db_resources.extend(SimpleNamespace(FullName=f"other/port{i}", Model="Port Model") for i in range(600))
+    session.calls = session.find_calls = 0
+    specs.append(ResourceSpec("Port Model", "chassis/port200"))
+    assert add_resources_to_db(context, specs).created == ["chassis/port200"]
+    assert session.find_calls == 1
+    monkeypatch.setattr(helpers, "FIND_RESOURCES_MAX_RESULTS", 100)
+    assert not add_resources_to_db(context, specs).created
+    assert session.find_calls == 1 + 2
+
+    session.set_requests.clear()
+    report = add_resources_to_db(context, specs, update_existing=True)
+    assert not report.created and len(report.skipped) == 201
+    assert len(session.set_requests) == 200
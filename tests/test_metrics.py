@@ -0,0 +1,63 @@
+"""
+Test metrics.
+"""
+import logging
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+from cloudshell.traffic.metrics import ApiMetrics, InstrumentedSession, api_metrics
+from cloudshell.traffic.rest_api_helpers import RestJsonClient
+from tests.fakes import FakeSession
+
+
+def test_instrumented_session(tmp_path: Path, caplog: pytest.LogCaptureFixture) -> None:
+    """Test API calls are recorded only when enabled and exported as dict, Prometheus text and log summary."""
+    session = FakeSession(SimpleNamespace(Resources=[], Services=[], Connectors=[]))
+    metrics = ApiMetrics()
+    assert metrics.instrument(session) is session
+    metrics.enable()
+    instrumented = metrics.instrument(session)
+    assert isinstance(instrumented, InstrumentedSession)
+    assert metrics.instrument(instrumented) is instrumented
+    instrumented.GetReservationDetails("id")
+    instrumented.WriteMessageToReservationOutput("id", "hello")
+    instrumented.WriteMessageToReservationOutput("id", "world")
+    assert instrumented.calls == 3
+
+    stats = metrics.to_dict()
+    assert stats["GetReservationDetails"]["count"] == 1
+    assert stats["WriteMessageToReservationOutput"]["count"] == 2
+    assert stats["WriteMessageToReservationOutput"]["request_bytes"] == 14
+    assert stats["WriteMessageToReservationOutput"]["buckets"]["inf"] == 2
+
+    path = tmp_path / "metrics.prom"
+    metrics.write_prometheus(str(path))
+    text = path.read_text()
+    assert 'cloudshell_traffic_api_call_seconds_count{method="WriteMessageToReservationOutput"} 2' in text
+    assert 'le="+Inf"' in text
+
+    with caplog.at_level(logging.INFO):
+        metrics.log_summary(logging.getLogger())
+    assert "GetReservationDetails: count=1 errors=0" in caplog.text
+
+
+def test_rest_metrics(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test REST requests are recorded with response size and errors."""
+    response = requests.Response()
+    response.status_code = 404
+    response._content = b"not found"  # pylint: disable=protected-access
+    response.headers["Content-Length"] = "9"
+    client = RestJsonClient("localhost")
+    monkeypatch.setattr(client.session, "request", lambda *args, **kwargs: response)
+    monkeypatch.setattr(api_metrics, "enabled", True)
+    api_metrics.reset()
+    with pytest.raises(Exception):
+        client.request_get("/api")
+    stats = api_metrics.to_dict()["REST GET"]
+    assert stats["count"] == 1
+    assert stats["errors"] == 1
+    assert stats["response_bytes"] == 9 and stats["request_bytes"] == 0
+    api_metrics.reset()
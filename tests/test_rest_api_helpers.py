@@ -2,15 +2,32 @@
 Test test_helpers.
 """
 # pylint: disable=redefined-outer-name
+import gzip
 import logging
+from collections import OrderedDict
+from io import BytesIO, StringIO
+from pathlib import Path
+from typing import List, Optional, Tuple
 
 import pytest
+import requests
 from shellfoundry_traffic.test_helpers import TgTestHelpers, create_session_from_config
 
+from benchmarks.server import StandInServer
 from cloudshell.api.cloudshell_api import CloudShellAPISession
 from cloudshell.logging.qs_logger import get_qs_logger
+from cloudshell.traffic import rest_api_helpers
 from cloudshell.traffic.helpers import get_reservation_id
-from cloudshell.traffic.rest_api_helpers import RestClientException, RestClientUnauthorizedException, SandboxAttachments
+from cloudshell.traffic.rest_api_helpers import (
+    RestClientException,
+    RestClientUnauthorizedException,
+    RestJsonClient,
+    SandboxAttachments,
+    get_sandbox_attachments,
+    gzip_chunks,
+    iter_chunks,
+)
+from cloudshell.traffic.tg import iter_csv
 
 RESERVATION_NAME = "testing 1 2 3"
 
@@ -60,3 +77,132 @@ def test_negative(test_helpers: TgTestHelpers) -> None:
     quali_api.login()
     with pytest.raises(RestClientException):
         quali_api.attach_new_file("Invalid", "Hello World 1", "test1.txt")
+
+
+def test_stream_chunks() -> None:
+    """Test coalescing of streamed rows into chunks and on the fly gzip compression."""
+    rows = (["Port", "Tx", "Rx"] if i == 0 else [f"Port {i}", i, i] for i in range(10000))
+    chunks = list(iter_chunks(iter_csv(rows), chunk_size=1024))
+    assert all(len(chunk) >= 1024 for chunk in chunks[:-1])
+    content = b"".join(chunks)
+    assert content.startswith(b"Port,Tx,Rx\nPort 1,1,1\n")
+    assert gzip.decompress(b"".join(gzip_chunks(iter(chunks)))) == content
+
+
+def _response(content: bytes, content_type: str) -> requests.Response:
+    """Build response object with status OK."""
+    response = requests.Response()
+    response.status_code = 200
+    response._content = content  # pylint: disable=protected-access
+    response.headers["Content-Type"] = content_type
+    return response
+
+
+def test_valid() -> None:
+    """Test response validation parses JSON once and skips binary content."""
+    # pylint: disable=protected-access
+    client = RestJsonClient("localhost")
+    result = client._valid(_response(b'{"Success": true, "AllAttachments": []}', "application/json"))
+    assert result.is_json and result.content["AllAttachments"] == []
+    result = client._valid(_response(b'{"Success": false}', "application/octet-stream"))
+    assert not result.is_json and result.content == b'{"Success": false}'
+    result = client._valid(_response(b"Hello World", "text/plain"))
+    assert not result.is_json and result.content == b"Hello World"
+    with pytest.raises(RestClientException):
+        client._valid(_response(b'{"Success": false, "ErrorMessage": "error"}', "application/json"))
+
+
+def test_bulk_attachments() -> None:
+    """Test bulk attachments operations against local stand-in server, with glob filter and per file errors."""
+    closed = StringIO()
+    closed.close()
+    with StandInServer() as server:
+        attachments = SandboxAttachments(server.host, "token", logger)
+        attachments.login()
+        files = {f"test{i}.txt": f"Hello World {i}" for i in range(4)}
+        result = attachments.attach_files("id", {**files, "info.log": "log", "closed.txt": closed}, max_workers=3)
+        assert set(result.results) == {*files, "info.log"}
+        assert list(result.errors) == ["closed.txt"] and isinstance(result.errors["closed.txt"], ValueError)
+
+        result = attachments.get_attached_files_content("id", "test*.txt")
+        assert result.results == {name: content.encode() for name, content in files.items()} and not result.errors
+        result = attachments.get_attached_files_content("id", lambda name: name.endswith(".log"))
+        assert result.results == {"info.log": b"log"}
+
+        result = attachments.remove_attached_files("id", "test[01].txt")
+        assert sorted(result.results) == ["test0.txt", "test1.txt"]
+        assert attachments.get_attached_files("id") == ["info.log", "test2.txt", "test3.txt"]
+        attachments.remove_attached_files("id")
+        assert not attachments.get_attached_files("id")
+
+
+@pytest.mark.parametrize("attachment_type", ["application/octet-stream", "text/csv"])
+@pytest.mark.parametrize("ignore_range", [False, True])
+def test_download_attached_file(tmp_path: Path, ignore_range: bool, attachment_type: str) -> None:
+    """Test ranged, resumed and already complete downloads, with server that honors or ignores Range header."""
+    content = bytes(range(256)) * 1000
+    with StandInServer(ignore_range=ignore_range) as server:
+        server.attachment_type = attachment_type
+        server.attachments["id"] = {"test.bin": content}
+        attachments = SandboxAttachments(server.host, "token", logger)
+        attachments.login()
+
+        target = BytesIO()
+        progress: List[Tuple[int, Optional[int]]] = []
+        written = attachments.download_attached_file(
+            "id", "test.bin", target, chunk_size=4096, progress=lambda done, total: progress.append((done, total))
+        )
+        assert written == len(content)
+        assert target.getvalue() == content
+        assert progress[-1] == (len(content), len(content))
+
+        target = BytesIO()
+        assert attachments.download_attached_file("id", "test.bin", target, byte_range=(1000, 9999), chunk_size=4096) == 9000
+        assert target.getvalue() == content[1000:10000]
+        target = BytesIO()
+        attachments.download_attached_file("id", "test.bin", target, byte_range=(250000, None))
+        assert target.getvalue() == content[250000:]
+
+        path = tmp_path / "test.bin"
+        path.write_bytes(content[:100000])
+        assert attachments.download_attached_file("id", "test.bin", path, resume=True) == len(content) - 100000
+        assert path.read_bytes() == content
+        assert attachments.download_attached_file("id", "test.bin", path, resume=True) == 0
+        assert path.read_bytes() == content
+
+
+def test_attachments_retry_and_login(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test retry on server errors, login again on expired authorization, including streamed uploads, and bounded registry."""
+    with StandInServer() as server:
+        attachments = SandboxAttachments(server.host, "token", logger, backoff_factor=0)
+        attachments.login()
+        server.fail_requests = 2
+        assert attachments.get_attached_files("id") == []
+        assert server.calls["REST GET GetReservationAttachmentsDetails"] == 3
+
+        server.expire_logins()
+        attachments.attach_new_file("id", "Hello World", "test.txt")
+        assert len(server.logins) == 2
+
+        server.expire_logins()
+        attachments.attach_new_file_stream("id", BytesIO(b"Hello World"), "test.bin")
+        assert len(server.logins) == 3 and server.attachments["id"]["test.bin"] == b"Hello World"
+
+        server.expire_logins()
+        monkeypatch.setattr(rest_api_helpers, "REST_LOGIN_CHECK_INTERVAL", 0)
+        attachments.attach_new_file_stream("id", iter([b"Hello ", b"World"]), "test.stream")
+        assert len(server.logins) == 4 and server.attachments["id"]["test.stream"] == b"Hello World"
+        assert server.calls["REST GET GetReservationAttachmentsDetails"] == 3
+
+        monkeypatch.setattr(rest_api_helpers, "ATTACHMENTS_REGISTRY_SIZE", 2)
+        monkeypatch.setattr(rest_api_helpers, "_attachments_registry", OrderedDict())
+        first = get_sandbox_attachments(server.host, "token 1", logger)
+        other_logger = logging.getLogger("test_attachments_retry_and_login")
+        assert get_sandbox_attachments(server.host, "token 1", other_logger) is first
+        assert first.logger is other_logger
+        get_sandbox_attachments(server.host, "token 2", logger)
+        get_sandbox_attachments(server.host, "token 3", logger)
+        assert list(rest_api_helpers._attachments_registry) == [  # pylint: disable=protected-access
+            (server.host, "token 2"),
+            (server.host, "token 3"),
+        ]
@@ -0,0 +1,252 @@
+"""
+Test tg.
+"""
+import logging
+import os
+import subprocess
+import sys
+import threading
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from cloudshell.logging.qs_logger import get_qs_logger
+from cloudshell.traffic.helpers import DeferredQueueHandler, RateLimitFilter, ReservationOutputHandler
+from cloudshell.traffic.tg import (
+    KeepAliveManager,
+    TgControllerDriver,
+    TgSessionRegistry,
+    TgStatsCollector,
+    _numpy,
+    iter_csv,
+    keep_alive_reservations,
+    resolve_tg_ports,
+)
+from tests.fakes import FakeSession, reservation_description
+
+
+def test_keep_alive_manager() -> None:
+    """Test one scheduler serves heartbeats of all reservations and releases cancelled ones."""
+    heartbeats = []
+    manager = KeepAliveManager(heartbeats.append, tick=0.01, heartbeat_interval=0)
+    cancellation_contexts = {reservation_id: SimpleNamespace(is_cancelled=False) for reservation_id in ["r1", "r2"]}
+    keep_alive_reservations.update(cancellation_contexts)
+    releases = {rid: manager.register(rid, context) for rid, context in cancellation_contexts.items()}
+    assert len(manager) == 2
+    cancellation_contexts["r1"].is_cancelled = True
+    assert releases["r1"].wait(1)
+    assert "r1" not in manager and "r1" not in keep_alive_reservations
+    assert "r2" in heartbeats
+    manager.stop()
+    assert releases["r2"].is_set()
+    assert not keep_alive_reservations
+    assert not [thread for thread in threading.enumerate() if thread.name == "keep-alive-scheduler"]
+
+
+def test_lazy_imports() -> None:
+    """Test importing tg does not import the heavy dependencies deferred to first use."""
+    deferred = ["cloudshell.api.cloudshell_api", "cloudshell.workflow.orchestration.sandbox", "requests", "urllib3"]
+    code = f"import sys, cloudshell.traffic.tg; print([m for m in {deferred} if m in sys.modules])"
+    output = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True).stdout
+    assert output.strip() == "[]"
+
+
+@pytest.mark.parametrize("use_numpy", [False, pytest.param(True, marks=pytest.mark.skipif(not _numpy(), reason="no numpy"))])
+def test_stats_collector(use_numpy: bool) -> None:
+    """Test ring buffer growth and wrap, counter reset, rates, percentiles and CSV export."""
+    partial = TgStatsCollector(["Tx Frames"], capacity=1000, use_numpy=use_numpy)
+    partial.add_sample("Port 1", [0], 0)
+    partial.add_sample("Port 1", [10], 1)
+    assert len(partial._buffers["Port 1"]) == 2 * 2  # pylint: disable=protected-access
+    assert partial.rates("Port 1") == {"Tx Frames": [10]}
+    partial.add_sample("Port 1", [30], 2)
+    assert partial.summary("Port 1")["Tx Frames"]["delta"] == 30
+
+    collector = TgStatsCollector(["Tx Frames", "Rx Frames"], capacity=4, use_numpy=use_numpy)
+    for second, (tx_frames, rx_frames) in enumerate([(0, 0), (100, 90), (200, 190), (400, 390), (600, 590), (50, 40)]):
+        collector.add_view({"Port 1": {"Tx Frames": tx_frames, "Rx Frames": rx_frames}, "Port 2": [0, 0]}, second)
+    assert len(collector) == 2
+    assert [row[0] for row in collector.samples("Port 1")] == [2, 3, 4, 5]
+    assert collector.rates("Port 1")["Tx Frames"] == [200, 200, 50]
+    summary = collector.summary("Port 1")["Tx Frames"]
+    assert summary == {"last": 50, "delta": 450, "rate": 150, "p50": 200, "p95": 200, "max": 200}
+    assert collector.summary("Port 2")["Rx Frames"]["rate"] == 0
+    rows = list(collector.iter_samples_rows())
+    assert rows[0] == ("Name", "Timestamp", "Tx Frames", "Rx Frames")
+    assert len(rows) == 1 + 2 * 4
+    summary_csv = "".join(iter_csv(collector.iter_summary_rows()))
+    assert summary_csv.splitlines()[1] == "Port 1,Tx Frames,50.0,450.0,150.0,200.0,200.0,200.0"
+
+
+class PortsSession(FakeSession):
+    """Fake session with logical name derived from port name."""
+
+    def GetResourceDetails(self, resourceFullPath: str) -> SimpleNamespace:  # pylint: disable=invalid-name
+        """Return port details with logical name, empty for the last port."""
+        self.calls += 1
+        logical_name = "" if resourceFullPath.endswith("Port3") else resourceFullPath.split("/")[-1]
+        attributes = [SimpleNamespace(Name="Port Model.Logical Name", Value=f" {logical_name} ")]
+        return SimpleNamespace(
+            Name=resourceFullPath,
+            ResourceModelName="Port Model",
+            ResourceFamilyName="CS_TrafficGeneratorPort",
+            ResourceAttributes=attributes,
+        )
+
+
+def test_resolve_tg_ports(tmp_path: Path, caplog: pytest.LogCaptureFixture) -> None:
+    """Test ports resolution and on disk cache, old or corrupt cached maps are resolved again and old maps removed."""
+    session = PortsSession(reservation_description(ports=4))
+    sandbox = SimpleNamespace(id="topology", automation_api=session)
+    ports = resolve_tg_ports(sandbox, use_cache=True, cache_dir=str(tmp_path))
+    assert list(ports) == ["Port0", "Port1", "Port2"]
+    assert ports["Port1"].location == "192.168.1.1/1/1"
+    assert ports["Port1"].resource_name == "chassis/Module1/Port1"
+    assert session.calls == 5
+    session.calls = 0
+    with caplog.at_level(logging.INFO, logger="cloudshell.traffic.tg"):
+        assert resolve_tg_ports(sandbox, use_cache=True, cache_dir=str(tmp_path)) == ports
+    assert session.calls == 1
+    assert "from cache" in caplog.text
+    stale = tmp_path / "stale.json"
+    stale.write_text("{}")
+    os.utime(stale, (0, 0))
+    session.calls = 0
+    assert resolve_tg_ports(sandbox, use_cache=True, cache_dir=str(tmp_path), cache_max_age=3600) == ports
+    assert session.calls == 1
+    assert resolve_tg_ports(sandbox, use_cache=True, cache_dir=str(tmp_path), cache_max_age=-1) == ports
+    assert session.calls == 6
+    assert not stale.exists()
+
+    (cache_file,) = tmp_path.glob("*.json")
+    cache_file.write_text('{"Port0": [')
+    session.calls = 0
+    assert resolve_tg_ports(sandbox, use_cache=True, cache_dir=str(tmp_path)) == ports
+    assert session.calls == 5
+
+
+def test_tg_session_registry() -> None:
+    """Test session reuse, LRU eviction with close hook, release and stats."""
+    closed = []
+    registry = TgSessionRegistry(lambda rid, address: f"{rid}@{address}", closed.append, max_sessions=2)
+    assert registry.get("r1", "ixn") == "r1@ixn"
+    registry.get("r2", "ixn")
+    assert registry.get("r1", "ixn") == "r1@ixn"
+    registry.get("r3", "stc")
+    assert closed == ["r2@ixn"]
+    assert ("r2", "ixn") not in registry
+    registry.release("r1")
+    assert closed == ["r2@ixn", "r1@ixn"]
+    assert registry.stats() == {"hits": 1, "misses": 3, "evictions": 1, "size": 1}
+    registry.close_all()
+    assert closed[-1] == "r3@stc" and not registry
+
+
+def test_keep_alive_cancel_single_reservation() -> None:
+    """Test cancelling one reservation releases only its keep alive and TG sessions."""
+    closed: list = []
+
+    class Driver(TgControllerDriver):
+        """Driver with string TG sessions."""
+
+        def create_tg_session(self, reservation_id: str, address: str) -> str:
+            """Return reservation@address."""
+            return f"{reservation_id}@{address}"
+
+        def close_tg_session(self, session: str) -> None:
+            """Record closed session."""
+            closed.append(session)
+
+    driver = Driver()
+    driver.keep_alive_manager.tick = 0.01
+    contexts = {rid: SimpleNamespace(reservation=SimpleNamespace(reservation_id=rid)) for rid in ["r1", "r2"]}
+    cancellation_contexts = {rid: SimpleNamespace(is_cancelled=False) for rid in contexts}
+    threads = {
+        rid: threading.Thread(target=driver.keep_alive, args=(contexts[rid], cancellation_contexts[rid])) for rid in contexts
+    }
+    for rid, thread in threads.items():
+        thread.start()
+        driver.tg_sessions.get(rid, "ixn")
+    while len(driver.keep_alive_manager) < 2:
+        threading.Event().wait(0.01)
+
+    cancellation_contexts["r1"].is_cancelled = True
+    threads["r1"].join(1)
+    assert not threads["r1"].is_alive()
+    assert "r2" in driver.keep_alive_manager and ("r2", "ixn") in driver.tg_sessions
+    assert closed == ["r1@ixn"]
+
+    driver.cleanup()
+    threads["r2"].join(1)
+    assert not threads["r2"].is_alive()
+    assert closed == ["r1@ixn", "r2@ixn"]
+
+
+class ListHandler(logging.Handler):
+    """Handler that keeps formatted messages and the names of the threads that handled them."""
+
+    def __init__(self) -> None:
+        """Initialize empty list."""
+        super().__init__()
+        self.messages: list = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        """Keep (message, handling thread name)."""
+        self.messages.append((record.getMessage(), threading.current_thread().name))
+
+
+def test_init_loggers() -> None:
+    """Test per package levels, rate limiting, log queue and runtime level switch."""
+    handler = ListHandler()
+    get_qs_logger(log_group="test_init_loggers").addHandler(handler)
+    session = FakeSession(reservation_description())
+    output_handler = ReservationOutputHandler(SimpleNamespace(id="id", automation_api=session))
+    output_handler.setLevel(logging.ERROR)
+    get_qs_logger(log_group="test_init_loggers").addHandler(output_handler)
+    driver = TgControllerDriver()
+    packages = {"test_init_loggers.vendor": logging.INFO}
+    rate_limit = RateLimitFilter(burst=2, interval=60, sample=5)
+    driver.init_loggers("test", "test_init_loggers", packages, logging.INFO, rate_limit, use_queue=True)
+    vendor_logger = logging.getLogger("test_init_loggers.vendor")
+    assert vendor_logger.level == logging.INFO
+    assert all(isinstance(h, DeferredQueueHandler) for h in (*driver.logger.handlers, *vendor_logger.handlers))
+
+    for counter in range(12):
+        vendor_logger.info("counter %d", counter)
+    vendor_logger.debug("debug off")
+    driver.set_log_level(logging.DEBUG)
+    vendor_logger.debug("debug on")
+    vendor_logger.error("error")
+    driver.cleanup()
+    assert handler in driver.logger.handlers and handler in vendor_logger.handlers
+    assert output_handler not in driver.logger.handlers and output_handler not in vendor_logger.handlers
+    assert session.messages == ["error"]
+    messages = [message for message, _ in handler.messages]
+    assert messages[:6] == ["counter 0", "counter 1", "counter 6", "counter 11", "debug on", "error"]
+    assert all(thread != threading.current_thread().name for _, thread in handler.messages)
+    assert rate_limit.suppressed == 8
+
+
+def test_rate_limit_child_loggers() -> None:
+    """Test rate limit applies to records of packages child loggers and counts records once with several handlers."""
+    handlers = [ListHandler(), ListHandler()]
+    shell_logger = get_qs_logger(log_group="test_rate_limit_child_loggers")
+    for handler in handlers:
+        shell_logger.addHandler(handler)
+    driver = TgControllerDriver()
+    rate_limit = RateLimitFilter(burst=2, interval=60)
+    driver.init_loggers("test", "test_rate_limit_child_loggers", ["test_rate_limit.vendor"], rate_limit=rate_limit)
+    session_logger = logging.getLogger("test_rate_limit.vendor.session")
+    for counter in range(100):
+        session_logger.info("session %d", counter)
+    assert rate_limit.suppressed == 98
+    assert all([message for message, _ in handler.messages] == ["session 0", "session 1"] for handler in handlers)
+
+    for handler, burst in zip(handlers, [1, 1000]):
+        handler.messages.clear()
+        handler.filters.clear()
+        handler.addFilter(RateLimitFilter(burst=burst, interval=60))
+    for counter in range(50):
+        session_logger.info("limits %d", counter)
+    assert [len(handler.messages) for handler in handlers] == [1, 50]
@@ -0,0 +1,91 @@
+"""
+Test watcher.
+"""
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from cloudshell.traffic.helpers import ReservationIndex
+from cloudshell.traffic.watcher import ReservationDiff, _watchers, diff_reservations, watch_reservation
+from tests.fakes import FakeSession, reservation_description
+
+
+def test_diff_reservations() -> None:
+    """Test diff of resources, services, connectors and attributes."""
+    old = reservation_description(ports=3)
+    new = reservation_description(ports=4)
+    new.Resources = new.Resources[1:]
+    new.Services[0].Attributes = [SimpleNamespace(Name="Test Attribute", Value="2")]
+    new.Connectors.append(SimpleNamespace(Alias="", Source="a", Target="b", Attributes=[]))
+    diff = diff_reservations(ReservationIndex(old), ReservationIndex(new))
+    assert diff.resources_added == ("chassis/Module1/Port3",)
+    assert diff.resources_removed == ("chassis/Module1/Port0",)
+    assert diff.connectors_added == ("a->b",)
+    assert diff.attributes_changed == {"Controller": {"Test Attribute": ("1", "2")}}
+    assert not diff_reservations(ReservationIndex(old), ReservationIndex(old))
+    assert not ReservationDiff()
+
+
+def test_watch_reservation() -> None:
+    """Test all subscribers of a reservation share one poller and get the same diffs."""
+    description = reservation_description()
+    session = FakeSession(description)
+    sandbox = SimpleNamespace(id="watched", automation_api=session)
+    diffs: dict = {"first": [], "second": []}
+    changed = threading.Event()
+
+    def subscriber(name: str):
+        def callback(diff: ReservationDiff) -> None:
+            diffs[name].append(diff)
+            changed.set()
+
+        return callback
+
+    unsubscribe_first = watch_reservation(sandbox, subscriber("first"), interval=0.01)
+    unsubscribe_second = watch_reservation(sandbox, subscriber("second"), interval=0.01)
+    watchers = [t for t in threading.enumerate() if t.name == "reservation-watcher-watched"]
+    assert len(watchers) == 1
+    session.description = SimpleNamespace(Resources=description.Resources, Services=[], Connectors=description.Connectors)
+    assert changed.wait(1)
+    unsubscribe_first()
+    unsubscribe_second()
+    watchers[0].join(1)
+    assert not watchers[0].is_alive()
+    assert diffs["first"][0].services_removed == ("Controller",)
+    assert diffs["second"][0] == diffs["first"][0]
+
+
+def test_watch_reservation_fetch() -> None:
+    """Test failed first fetch leaves nothing subscribed and slow first fetch does not block other reservations."""
+    session = FakeSession(reservation_description())
+    sandbox = SimpleNamespace(id="failed", automation_api=session)
+    session.GetReservationDetails = lambda *args, **kwargs: 1 / 0
+    with pytest.raises(ZeroDivisionError):
+        watch_reservation(sandbox, lambda diff: None)
+    assert "failed" not in _watchers
+    assert not any(t.name == "reservation-watcher-failed" for t in threading.enumerate())
+
+    started, release = threading.Event(), threading.Event()
+    slow_session = FakeSession(reservation_description())
+    fetch = slow_session.GetReservationDetails
+
+    def slow_fetch(*args: object, **kwargs: object) -> SimpleNamespace:
+        started.set()
+        release.wait(5)
+        return fetch(*args, **kwargs)
+
+    slow_session.GetReservationDetails = slow_fetch
+    slow = threading.Thread(
+        target=watch_reservation, args=(SimpleNamespace(id="slow", automation_api=slow_session), lambda diff: None)
+    )
+    slow.start()
+    assert started.wait(1)
+    del session.GetReservationDetails
+    unsubscribe = watch_reservation(SimpleNamespace(id="fast", automation_api=session), lambda diff: None)
+    assert slow.is_alive()
+    release.set()
+    slow.join()
+    unsubscribe()
+    _watchers["slow"].stop()
+    assert len(_watchers["slow"]) == 1 and "fast" not in _watchers